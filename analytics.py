@@ -0,0 +1,114 @@
+from fetchParser import envelope_sender, fetch_attributes, has_attachment
+from imapPipeline import pipelined_uid
+from imapUtils import fetch_internaldate, iter_fetch_groups, quote_mailbox, selected_uid_next
+from metadataStore import ATTACHMENT, MessageStore, bit_count
+from progress import ProgressTracker
+from senderIndex import normalize_address
+
+ANALYTICS_CHUNK = 5000  # UID range per metadata FETCH, no SEARCH needed to walk the folder
+ANALYTICS_FETCH = "(UID RFC822.SIZE INTERNALDATE ENVELOPE BODYSTRUCTURE)"
+REPORT_ROWS = 20
+WITH_ATTACHMENTS = "with attachments"
+WITHOUT_ATTACHMENTS = "without attachments"
+
+
+def largest(rows, limit=REPORT_ROWS):
+    return sorted(rows, key=lambda row: row[2], reverse=True)[:limit]
+
+
+class MailboxAnalytics:
+    # One row per message in a columnar store (see metadataStore), totals per sender,
+    # domain, month or attachment are grouped from it when asked for
+    def __init__(self, folder, metadata_rules=()):
+        self.folder = folder
+        self.metadata_rules = metadata_rules
+        self.store = MessageStore()
+
+    def add(self, uid, sender, size, timestamp, attachment):
+        self.store.add(uid, size, timestamp, sender, ATTACHMENT if attachment else 0)
+
+    def grouped_rows(self, groups, labels):
+        # (label, count, size, last_seen) per group with messages, unlabelled groups left out
+        counts, sizes, last_seen = self.store.totals(groups, len(labels))
+        return [(label, counts[i], sizes[i], last_seen[i]) for i, label in enumerate(labels) if counts[i] and label]
+
+    def domain_groups(self):
+        # Domain rows use the *@domain form the sender rules accept, so they can be selected too
+        groups, domains = self.store.domain_groups()
+        return groups, ["*@" + domain if domain else None for domain in domains]
+
+    def sender_rows(self):
+        # Rows for the sender table, largest offenders first once it is sorted by size
+        return self.grouped_rows(*self.store.sender_groups()) + self.grouped_rows(*self.domain_groups())
+
+    def rule_rows(self):
+        # What each archive rule would take on its own and all of them together, evaluated on the
+        # stored metadata without asking the server
+        rows = []
+        combined, combined_exact = 0, True
+        for rule in self.metadata_rules:
+            bits, exact = self.store.rule_bits(rule)
+            combined |= bits
+            combined_exact = combined_exact and exact
+            rows.append((rule.describe(), bit_count(bits), self.store.total_size(bits), exact))
+        if len(rows) > 1:
+            rows.append(("all rules", bit_count(combined), self.store.total_size(combined), combined_exact))
+        return rows
+
+    def format(self, limit=REPORT_ROWS):
+        total_bytes = self.store.total_size()
+        report = f"{self.folder}: {len(self.store)} messages, {total_bytes / 1048576:.1f} MB\n"
+        attachment_groups = self.store.flag_groups(ATTACHMENT, (WITHOUT_ATTACHMENTS, WITH_ATTACHMENTS))
+        sections = [("Largest senders", self.store.sender_groups()), ("Largest domains", self.domain_groups()),
+                    ("Largest months", self.store.month_groups()), ("Attachments", attachment_groups)]
+        for title, (groups, labels) in sections:
+            report += f"\n{title}:\n"
+            for key, count, size, _ in largest(self.grouped_rows(groups, labels), limit):
+                share = size / total_bytes * 100 if total_bytes else 0.0
+                report += f"  {key}: {size / 1048576:.1f} MB in {count} emails ({share:.1f}%)\n"
+        rule_rows = self.rule_rows()
+        if rule_rows:
+            report += "\nArchive rules:\n"
+        for description, count, size, exact in rule_rows:
+            share = size / total_bytes * 100 if total_bytes else 0.0
+            # Attachment types are not part of the stored metadata, those counts are upper bounds
+            bound = "" if exact else "at most "
+            report += f"  {description}: {bound}{size / 1048576:.1f} MB in {count} emails ({share:.1f}%)\n"
+        return report
+
+
+def analyze_mailbox(mail, log, cancelled=lambda: False, folder="INBOX", progress=None, metadata_rules=()):
+    # Metadata only: sizes, dates, envelopes and body structure, never a byte of content
+    result, data = mail.select(quote_mailbox(folder), readonly=True)
+    if result != 'OK':
+        log(f"Could not select {folder}!\n")
+        return None
+
+    progress = progress or ProgressTracker(lambda *args: None)
+    progress.set_total(int(data[0] or 0))
+    analytics = MailboxAnalytics(folder, metadata_rules)
+    uid_next = selected_uid_next(mail)
+    ranges = (f"{start}:{min(start + ANALYTICS_CHUNK, uid_next) - 1}" for start in range(1, uid_next, ANALYTICS_CHUNK))
+    for message_set, result, data in pipelined_uid(mail, ((uids, ('FETCH', uids, ANALYTICS_FETCH)) for uids in ranges)):
+        if cancelled():
+            log("Analyzing mailbox cancelled.\n")
+            return None
+        if result != 'OK':
+            log(f"ERROR getting messages {message_set}\n")
+            continue
+        fetched = 0
+        for group in iter_fetch_groups(data):
+            attributes = fetch_attributes(group)
+            size = attributes.get(b"RFC822.SIZE")
+            uid = attributes.get(b"UID")
+            if not size or not size.isdigit() or not uid or not uid.isdigit():
+                continue
+            sender = envelope_sender(attributes.get(b"ENVELOPE"))
+            date = attributes.get(b"INTERNALDATE")
+            timestamp = fetch_internaldate(b'INTERNALDATE "' + date + b'"') if date else 0.0
+            analytics.add(int(uid), normalize_address(sender) if sender else None, int(size), timestamp,
+                          has_attachment(attributes.get(b"BODYSTRUCTURE")))
+            fetched += 1
+        progress.advance(fetched)
+    progress.finish()
+    return analytics
@@ -0,0 +1,97 @@
+from imapUtils import chunked, days_ago, find_special_folders, imap_date, quote_mailbox, uid_set
+from progress import ProgressTracker
+
+CLEANUP_CHUNK_SIZE = 5000  # UIDs per UID STORE / UID EXPUNGE command
+
+DRAFTS = "\\Drafts"
+JUNK = "\\Junk"
+TRASH = "\\Trash"
+
+
+class CleanupJob:
+    def __init__(self, special_use=DRAFTS, folder=None, older_than_days=None, larger_than=None):
+        self.special_use = special_use
+        self.folder = folder
+        self.older_than_days = older_than_days
+        self.larger_than = larger_than
+
+    @property
+    def name(self):
+        return self.folder or self.special_use.lstrip("\\")
+
+    def search_criteria(self):
+        criteria = []
+        if self.older_than_days is not None:
+            criteria.append(f'BEFORE "{imap_date(days_ago(self.older_than_days))}"')
+        if self.larger_than is not None:
+            criteria.append(f"LARGER {int(self.larger_than)}")
+        return f"({' '.join(criteria)})" if criteria else None
+
+
+def run_cleanup(mail, job, log, cancelled=lambda: False, special_folders=None, progress=None):
+    progress = progress or ProgressTracker(lambda *args: None)
+    folder = job.folder
+    if folder is None:
+        if special_folders is None:
+            special_folders = find_special_folders(mail)
+        folder = special_folders.get(job.special_use)
+    if folder is None:
+        log(f"No {job.name} folder found!\n")
+        return 0
+
+    result, data = mail.select(quote_mailbox(folder))
+    if result != 'OK':
+        log(f"Could not select {folder}!\n")
+        return 0
+
+    criteria = job.search_criteria()
+    if criteria is None:
+        # No filters: flag the whole folder with a single ranged STORE
+        total = int(data[0] or 0)
+        progress.set_total(progress.total + total)
+        if total:
+            mail.store("1:*", '+FLAGS.SILENT', '(\\Deleted)')
+            mail.expunge()
+        progress.advance(total)
+        return total
+
+    result, data = mail.uid('SEARCH', None, criteria)
+    if result != 'OK':
+        log(f"No messages found in {folder}!\n")
+        return 0
+
+    uids = data[0].split()
+    progress.set_total(progress.total + len(uids))
+    uid_expunge = 'UIDPLUS' in mail.capabilities
+    deleted = 0
+
+    for chunk in chunked(uids, CLEANUP_CHUNK_SIZE):
+        if cancelled():
+            log(f"Cleaning up {folder} cancelled.\n")
+            break
+        message_set = uid_set(chunk)
+        mail.uid('STORE', message_set, '+FLAGS.SILENT', '(\\Deleted)')
+        # UID EXPUNGE only removes our chunk, leaving other \Deleted messages alone
+        if uid_expunge:
+            mail.uid('EXPUNGE', message_set)
+        deleted += len(chunk)
+        progress.advance(len(chunk))
+
+    if deleted and not uid_expunge:
+        mail.expunge()
+    return deleted
+
+
+def run_cleanup_jobs(mail, jobs, log, cancelled=lambda: False, progress=None):
+    special_folders = None
+    if any(job.folder is None for job in jobs):
+        special_folders = find_special_folders(mail)
+
+    results = {}
+    for job in jobs:
+        if cancelled():
+            break
+        results[job.name] = run_cleanup(mail, job, log, cancelled, special_folders, progress)
+    if progress:
+        progress.finish()
+    return results
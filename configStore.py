@@ -0,0 +1,92 @@
+import json
+import os
+
+from fileUtils import atomic_write
+from matcher import keyword_pairs
+from metadataRules import parse_metadata_rules
+from senderIndex import SenderIndex
+
+CONFIG_FILE = "configurations.json"
+RULES_VERSION = 3
+
+
+def split_keywords(keywords):
+    return [keyword.strip() for keyword in keywords.split(',') if keyword.strip()]
+
+
+def rules_source(config):
+    return [config.get("keywords", ""), sorted(config.get("senders", [])), config.get("metadata_rules", "")]
+
+
+def compile_rules(config):
+    # Pre-normalized matcher state, stored next to the raw fields so runs can skip re-parsing
+    sender_index = SenderIndex(config.get("senders", []))
+    return {
+        "version": RULES_VERSION,
+        "source": rules_source(config),
+        "keywords": [list(pair) for pair in keyword_pairs(split_keywords(config.get("keywords", "")))],
+        "addresses": sorted(sender_index.addresses),
+        "domains": sorted(sender_index.domains),
+        "dropped_senders": sender_index.dropped,
+        "metadata_rules": [rule.describe() for rule in parse_metadata_rules(config.get("metadata_rules", ""))],
+    }
+
+
+def rules_are_current(config):
+    rules = config.get("rules")
+    return (bool(rules) and rules.get("version") == RULES_VERSION
+            and rules.get("source") == rules_source(config))
+
+
+class ConfigStore:
+    # Parses configurations.json once and re-reads it only when its mtime changes
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self._configurations = {}
+        self._mtime = None
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def configurations(self):
+        mtime = self._current_mtime()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            if mtime is None:
+                self._configurations = {}
+            else:
+                with open(self.path, 'r') as file:
+                    self._configurations = json.load(file)
+        return self._configurations
+
+    def names(self):
+        return list(self.configurations().keys())
+
+    def get(self, name):
+        return self.configurations().get(name, {})
+
+    def rules(self, name):
+        config = self.get(name)
+        if not config:
+            return None
+        if not rules_are_current(config):
+            # Artifacts from an older version or a hand-edited file are rebuilt and persisted
+            self.save(name, config)
+            config = self.get(name)
+        return config["rules"]
+
+    def save(self, name, config):
+        config = dict(config)
+        config["rules"] = compile_rules(config)
+        configurations = dict(self.configurations())
+        configurations[name] = config
+        self._write(configurations)
+
+    def _write(self, configurations):
+        # Replaced in one rename, a crash mid-write never leaves a truncated configurations.json
+        atomic_write(self.path, json.dumps(configurations, indent=4).encode("utf-8"))
+        self._configurations = configurations
+        self._mtime = self._current_mtime()
@@ -0,0 +1,625 @@
+import datetime
+import email
+import email.utils
+import socket
+import threading
+
+import pytest
+
+import imapConnection
+from imapConnection import CompressedIMAP4_SSL, refresh_capabilities
+
+CAPABILITIES = ("IMAP4rev1", "UIDPLUS", "MOVE", "UNSELECT", "SPECIAL-USE")
+GMAIL_CAPABILITIES = CAPABILITIES + ("X-GM-EXT-1",)
+
+
+def make_message(sender="news@example.com", subject="Hello", body="Hello there", message_id=None,
+                 references=None, date=None, html=False, headers=()):
+    date = date or datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    lines = [f"From: {sender}", "To: me@example.com", f"Subject: {subject}",
+             f"Date: {email.utils.format_datetime(date)}"]
+    if message_id:
+        lines.append(f"Message-ID: {message_id}")
+    if references:
+        lines.append(f"References: {references}")
+    lines.extend(headers)
+    lines.append("MIME-Version: 1.0")
+    lines.append(f"Content-Type: text/{'html' if html else 'plain'}; charset=utf-8")
+    return ("\r\n".join(lines) + "\r\n\r\n" + body + "\r\n").encode()
+
+
+class FakeMessage:
+    def __init__(self, uid, raw, date, flags=(), labels=(), thread_id=0, message_id=0):
+        self.uid = uid
+        self.raw = raw
+        self.date = date
+        self.flags = set(flags)
+        self.labels = set(labels)
+        self.thread_id = thread_id
+        self.message_id = message_id
+        self.headers = email.message_from_bytes(raw)
+
+    def header_fields(self, names):
+        lines = [f"{name}: {value}" for name, value in self.headers.items() if name.upper() in names]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    def copy(self, uid):
+        return FakeMessage(uid, self.raw, self.date, self.flags, self.labels, self.thread_id, self.message_id)
+
+
+class FakeMailbox:
+    def __init__(self, name, special_use=None, uidvalidity=1):
+        self.name = name
+        self.special_use = special_use
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.messages = []  # In UID order, sequence number = position + 1
+
+    def append(self, message):
+        message.uid = self.uidnext
+        self.uidnext += 1
+        self.messages.append(message)
+        return message
+
+    def add(self, raw, date=None, flags=(), labels=(), thread_id=0):
+        date = date or datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        return self.append(FakeMessage(0, raw, date, flags, labels, thread_id, message_id=self.uidnext))
+
+    def uids(self):
+        return [message.uid for message in self.messages]
+
+    def by_uid(self, uid):
+        return next((message for message in self.messages if message.uid == uid), None)
+
+
+def tokenize(text):
+    # IMAP arguments as nested lists of strings; brackets (BODY[HEADER.FIELDS (A B)]) stay one atom
+    tokens, stack = [], []
+    current = tokens
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == " ":
+            i += 1
+        elif c == "(":
+            stack.append(current)
+            current.append([])
+            current = current[-1]
+            i += 1
+        elif c == ")":
+            current = stack.pop()
+            i += 1
+        elif c == '"':
+            j, value = i + 1, []
+            while text[j] != '"':
+                if text[j] == "\\":
+                    j += 1
+                value.append(text[j])
+                j += 1
+            current.append("".join(value))
+            i = j + 1
+        else:
+            j, depth = i, 0
+            while j < len(text) and (depth or text[j] not in " ()"):
+                depth += {"[": 1, "]": -1}.get(text[j], 0)
+                j += 1
+            current.append(text[i:j])
+            i = j
+    return tokens
+
+
+def parse_set(text, largest):
+    numbers = set()
+    for part in text.split(","):
+        first, _, last = part.partition(":")
+        first = largest if first == "*" else int(first)
+        last = first if not last else largest if last == "*" else int(last)
+        numbers.update(range(min(first, last), max(first, last) + 1))
+    return numbers
+
+
+def quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def nstring(value):
+    # NIL, a quoted string, or a literal for values quoting can't carry (like a real server's 8-bit data)
+    if value is None:
+        return b"NIL"
+    data = value.encode("utf-8", "surrogateescape")
+    if '"' in value or not value.isascii():
+        return f"{{{len(data)}}}\r\n".encode() + data
+    return quote(value).encode()
+
+
+def nlist(values):
+    return b"(" + b" ".join(values) + b")" if values else b"NIL"
+
+
+def envelope(headers):
+    # (date subject from sender reply-to to cc bcc in-reply-to message-id), addresses as (name adl mailbox host)
+    def addresses(name):
+        pairs = email.utils.getaddresses(headers.get_all(name, []))
+        return nlist([b"(" + b" ".join([nstring(display or None), b"NIL", nstring(address.partition("@")[0]),
+                                         nstring(address.partition("@")[2])]) + b")"
+                      for display, address in pairs if "@" in address])
+
+    sender = addresses("From")
+    return b"(" + b" ".join([
+        nstring(headers.get("Date")), nstring(headers.get("Subject")), sender,
+        addresses("Sender") if "Sender" in headers else sender,
+        addresses("Reply-To") if "Reply-To" in headers else sender,
+        addresses("To"), addresses("Cc"), addresses("Bcc"),
+        nstring(headers.get("In-Reply-To")), nstring(headers.get("Message-ID"))]) + b")"
+
+
+def bodystructure(part):
+    def parameters(pairs):
+        return nlist([nstring(key) + b" " + nstring(value) for key, value in pairs])
+
+    params = [(key, value) for key, value in part.get_params([])[1:]]
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_filename()
+        disposition = b"(" + nstring(disposition) + b" " + parameters([("filename", filename)] if filename else []) \
+            + b")"
+    else:
+        disposition = b"NIL"
+    if part.is_multipart():
+        children = b"".join(bodystructure(child) for child in part.get_payload())
+        return b"(" + children + b" " + nstring(part.get_content_subtype()) + b" " + parameters(params) + b" " + \
+            disposition + b" NIL)"
+    payload = part.get_payload().encode()
+    fields = [nstring(part.get_content_maintype()), nstring(part.get_content_subtype()), parameters(params),
+              nstring(part.get("Content-ID")), nstring(part.get("Content-Description")),
+              nstring(part.get("Content-Transfer-Encoding", "7bit")), str(len(payload)).encode()]
+    if part.get_content_maintype() == "text":
+        fields.append(str(payload.count(b"\n")).encode())
+    fields.extend([b"NIL", disposition, b"NIL"])
+    return b"(" + b" ".join(fields) + b")"
+
+
+class Dropped(Exception):
+    pass
+
+
+class Session:
+    # One client connection of the fake server, commands are handled strictly in order
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.selected = None
+        self.readonly = False
+        self.out = []
+
+    def send(self, data):
+        self.out.append(data if isinstance(data, bytes) else (data + "\r\n").encode())
+
+    def flush(self):
+        if self.out:
+            self.sock.sendall(b"".join(self.out))
+            self.out = []
+
+    def run(self):
+        try:
+            self.send("* OK fake IMAP ready")
+            self.flush()
+            pending = []
+            while True:
+                if not pending:
+                    lines = [self.reader.readline()]
+                    # A hold set before this command was sent covers it and the ones right after it
+                    for _ in range(self.server.take_hold() - 1):
+                        lines.append(self.reader.readline())
+                    if not all(lines):
+                        return
+                    pending = [line.decode().rstrip("\r\n") for line in lines]
+                line = pending.pop(0)
+                tag, _, rest = line.partition(" ")
+                if not self.handle(tag, rest):
+                    return
+        except (Dropped, OSError):
+            pass
+        finally:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+    def handle(self, tag, rest):
+        name, _, arguments = rest.partition(" ")
+        name = name.upper()
+        args = tokenize(arguments)
+        command = name
+        if name == "UID":
+            command = f"UID {args[0].upper()}"
+        drop = self.server.take_drop(command)
+        if drop == "before":
+            raise Dropped()
+        self.server.record(command, arguments)
+        try:
+            # Like a real server, Gmail's X-GM-* items and keys are unknown without X-GM-EXT-1
+            if "X-GM-" in arguments.upper() and "X-GM-EXT-1" not in self.server.capabilities:
+                raise ValueError("unknown X-GM extension")
+            with self.server.lock:
+                result = getattr(self, "do_" + command.replace(" ", "_"))(args)
+        except Exception as e:
+            result = f"BAD {str(e)}"
+        if drop == "after":
+            # The command ran and its untagged data went out, the tagged reply never does
+            self.flush()
+            raise Dropped()
+        self.send(f"{tag} {result or 'OK done'}")
+        self.flush()
+        return name != "LOGOUT"
+
+    def mailbox(self):
+        return self.server.mailboxes[self.selected]
+
+    def do_CAPABILITY(self, args):
+        self.send("* CAPABILITY " + " ".join(self.server.capabilities))
+
+    def do_LOGIN(self, args):
+        return "OK LOGIN completed"
+
+    def do_LOGOUT(self, args):
+        self.send("* BYE logging out")
+
+    def do_NOOP(self, args):
+        return None
+
+    def do_SELECT(self, args, readonly=False):
+        # INBOX is case-insensitive, every other name is not
+        mailbox = self.server.mailboxes.get("INBOX" if args[0].upper() == "INBOX" else args[0])
+        if mailbox is None:
+            self.selected = None
+            return "NO no such mailbox"
+        self.selected, self.readonly = mailbox.name, readonly
+        self.send(f"* {len(mailbox.messages)} EXISTS")
+        self.send(f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid")
+        self.send(f"* OK [UIDNEXT {mailbox.uidnext}] next UID")
+        return f"OK [{'READ-ONLY' if readonly else 'READ-WRITE'}] selected"
+
+    def do_EXAMINE(self, args):
+        return self.do_SELECT(args, readonly=True)
+
+    def do_CLOSE(self, args):
+        if not self.readonly:
+            self.expunge(lambda message: True, report=False)
+        self.selected = None
+
+    def do_UNSELECT(self, args):
+        self.selected = None
+
+    def do_CREATE(self, args):
+        if not self.server.can_create or args[0] in self.server.mailboxes:
+            return "NO [CANNOT] cannot create that mailbox"
+        self.server.add_mailbox(args[0])
+
+    def do_LIST(self, args):
+        for mailbox in self.server.mailboxes.values():
+            flags = " ".join(["\\HasNoChildren"] + ([mailbox.special_use] if mailbox.special_use else []))
+            self.send(f'* LIST ({flags}) "/" {quote(mailbox.name)}')
+
+    def do_STATUS(self, args):
+        mailbox = self.server.mailboxes.get(args[0])
+        if mailbox is None:
+            return "NO no such mailbox"
+        values = {"MESSAGES": len(mailbox.messages), "UIDNEXT": mailbox.uidnext, "UIDVALIDITY": mailbox.uidvalidity,
+                  "UNSEEN": sum("\\Seen" not in message.flags for message in mailbox.messages)}
+        items = " ".join(f"{item} {values[item.upper()]}" for item in args[1] if item.upper() in values)
+        self.send(f"* STATUS {quote(mailbox.name)} ({items})")
+
+    def expunge(self, selected, report=True):
+        messages = self.mailbox().messages
+        position = 0
+        while position < len(messages):
+            if "\\Deleted" in messages[position].flags and selected(messages[position]):
+                del messages[position]
+                if report:
+                    self.send(f"* {position + 1} EXPUNGE")
+            else:
+                position += 1
+
+    def do_EXPUNGE(self, args):
+        self.expunge(lambda message: True)
+
+    def do_UID_EXPUNGE(self, args):
+        uids = parse_set(args[1], self.mailbox().uidnext - 1)
+        self.expunge(lambda message: message.uid in uids)
+
+    def sequence_messages(self, text):
+        messages = self.mailbox().messages
+        return [messages[number - 1] for number in sorted(parse_set(text, len(messages))) if number <= len(messages)]
+
+    def uid_messages(self, text):
+        uids = parse_set(text, max(self.mailbox().uidnext - 1, 1))
+        return [message for message in self.mailbox().messages if message.uid in uids]
+
+    def do_SEARCH(self, args):
+        numbers = [str(position + 1) for position, message in enumerate(self.mailbox().messages)
+                   if self.matches(message, list(args))]
+        self.send("* SEARCH" + "".join(" " + number for number in numbers))
+
+    def do_UID_SEARCH(self, args):
+        args = args[1:]
+        if args and isinstance(args[0], str) and args[0].upper() == "CHARSET":
+            args = args[2:]
+        count = args and isinstance(args[0], str) and args[0].upper() == "RETURN"
+        if count:
+            if "ESEARCH" not in self.server.capabilities:
+                raise ValueError("RETURN needs ESEARCH")
+            args = args[2:]
+        uids = [str(message.uid) for message in self.mailbox().messages if self.matches(message, list(args))]
+        if count:
+            self.send(f"* ESEARCH UID COUNT {len(uids)}")
+        else:
+            self.send("* SEARCH" + "".join(" " + uid for uid in uids))
+
+    def matches(self, message, criteria):
+        while criteria:
+            if not self.criterion(message, criteria):
+                return False
+        return True
+
+    def criterion(self, message, criteria):
+        key = criteria.pop(0)
+        if isinstance(key, list):
+            return self.matches(message, list(key))
+        key = key.upper()
+        if key == "ALL":
+            return True
+        if key == "NOT":
+            return not self.criterion(message, criteria)
+        if key == "OR":
+            first = self.criterion(message, criteria)
+            second = self.criterion(message, criteria)
+            return first or second
+        if key in ("DELETED", "UNDELETED", "SEEN", "UNSEEN", "FLAGGED", "UNFLAGGED"):
+            flag = "\\" + key.replace("UN", "", 1).capitalize()
+            return (flag in message.flags) != key.startswith("UN")
+        if key == "UID":
+            return message.uid in parse_set(criteria.pop(0), max(self.mailbox().uidnext - 1, 1))
+        if key[0].isdigit() or key[0] == "*":
+            messages = self.mailbox().messages
+            return messages.index(message) + 1 in parse_set(key, len(messages))
+        if key in ("SINCE", "BEFORE", "ON", "SENTSINCE", "SENTBEFORE"):
+            day = datetime.datetime.strptime(criteria.pop(0), "%d-%b-%Y").date()
+            date = message.date.date()
+            return {"SINCE": date >= day, "SENTSINCE": date >= day, "BEFORE": date < day,
+                    "SENTBEFORE": date < day, "ON": date == day}[key]
+        if key == "LARGER":
+            return len(message.raw) > int(criteria.pop(0))
+        if key == "SMALLER":
+            return len(message.raw) < int(criteria.pop(0))
+        if key in ("FROM", "TO", "SUBJECT", "CC"):
+            return criteria.pop(0).lower() in str(message.headers.get(key, "")).lower()
+        if key == "HEADER":
+            name, value = criteria.pop(0), criteria.pop(0)
+            return value.lower() in str(message.headers.get(name, "")).lower()
+        if key in ("BODY", "TEXT"):
+            return criteria.pop(0).lower().encode() in message.raw.lower()
+        if key == "X-GM-THRID":
+            return message.thread_id == int(criteria.pop(0))
+        if key == "X-GM-MSGID":
+            return message.message_id == int(criteria.pop(0))
+        raise ValueError(f"unsupported search key {key}")
+
+    def do_UID_FETCH(self, args):
+        items = args[2] if isinstance(args[2], list) else [args[2]]
+        for message in self.uid_messages(args[1]):
+            self.fetch(message, items)
+
+    def do_FETCH(self, args):
+        items = args[1] if isinstance(args[1], list) else [args[1]]
+        for message in self.sequence_messages(args[0]):
+            self.fetch(message, items)
+
+    def fetch(self, message, items):
+        parts = [f"UID {message.uid}".encode()]
+        for item in items:
+            key = item.upper()
+            if key == "UID":
+                continue
+            elif key == "FLAGS":
+                parts.append(f"FLAGS ({' '.join(sorted(message.flags))})".encode())
+            elif key == "RFC822.SIZE":
+                parts.append(f"RFC822.SIZE {len(message.raw)}".encode())
+            elif key == "INTERNALDATE":
+                parts.append(f'INTERNALDATE "{message.date.strftime("%d-%b-%Y %H:%M:%S %z")}"'.encode())
+            elif key == "ENVELOPE":
+                parts.append(b"ENVELOPE " + envelope(message.headers))
+            elif key == "BODYSTRUCTURE":
+                parts.append(b"BODYSTRUCTURE " + bodystructure(message.headers))
+            elif key == "X-GM-THRID":
+                parts.append(f"X-GM-THRID {message.thread_id}".encode())
+            elif key == "X-GM-MSGID":
+                parts.append(f"X-GM-MSGID {message.message_id}".encode())
+            elif key == "X-GM-LABELS":
+                parts.append(f"X-GM-LABELS ({' '.join(sorted(message.labels))})".encode())
+            elif key in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                if not key.startswith("BODY.PEEK") and not self.readonly:
+                    message.flags.add("\\Seen")
+                name = "RFC822" if key == "RFC822" else "BODY[]"
+                parts.append(f"{name} {{{len(message.raw)}}}\r\n".encode() + message.raw)
+            elif key.startswith(("BODY[]<", "BODY.PEEK[]<")):
+                # Partial fetch: the reply names only the origin octet
+                start, _, count = key[key.index("<") + 1:-1].partition(".")
+                data = message.raw[int(start):int(start) + int(count)]
+                parts.append(f"BODY[]<{start}> {{{len(data)}}}\r\n".encode() + data)
+            elif key.startswith(("BODY[HEADER", "BODY.PEEK[HEADER")) or key == "RFC822.HEADER":
+                section = item[item.index("[") + 1:-1] if "[" in item else "HEADER"
+                if section.upper().startswith("HEADER.FIELDS"):
+                    names = {name.upper() for name in tokenize(section[len("HEADER.FIELDS"):])[0]}
+                    data = message.header_fields(names)
+                else:
+                    data = message.raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+                name = "RFC822.HEADER" if key == "RFC822.HEADER" else f"BODY[{section}]"
+                parts.append(f"{name} {{{len(data)}}}\r\n".encode() + data)
+            else:
+                raise ValueError(f"unsupported fetch item {item}")
+        position = self.mailbox().messages.index(message) + 1
+        self.send(f"* {position} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+
+    def store(self, messages, args):
+        operation, values = args[0].upper(), args[1] if isinstance(args[1], list) else [args[1]]
+        silent = operation.endswith(".SILENT")
+        operation = operation.replace(".SILENT", "")
+        labels = "X-GM-LABELS" in operation
+        for message in messages:
+            target = message.labels if labels else message.flags
+            if operation.startswith("+"):
+                target.update(values)
+            elif operation.startswith("-"):
+                target.difference_update(values)
+            else:
+                target.clear()
+                target.update(values)
+            if not silent:
+                position = self.mailbox().messages.index(message) + 1
+                self.send(f"* {position} FETCH (UID {message.uid} FLAGS ({' '.join(sorted(message.flags))}))")
+
+    def do_STORE(self, args):
+        self.store(self.sequence_messages(args[0]), args[1:])
+
+    def do_UID_STORE(self, args):
+        self.store(self.uid_messages(args[1]), args[2:])
+
+    def copy(self, args):
+        target = self.server.mailboxes.get(args[2])
+        if target is None:
+            return None, "NO [TRYCREATE] no such mailbox"
+        messages = self.uid_messages(args[1])
+        copies = [target.append(message.copy(0)) for message in messages]
+        for copied in copies:
+            copied.flags.discard("\\Deleted")
+        source = ",".join(str(message.uid) for message in messages)
+        destination = ",".join(str(copied.uid) for copied in copies)
+        if not messages or "UIDPLUS" not in self.server.capabilities:
+            return messages, ""
+        return messages, f"[COPYUID {target.uidvalidity} {source} {destination}]"
+
+    def do_UID_COPY(self, args):
+        messages, code = self.copy(args)
+        if messages is None:
+            return code
+        return f"OK {code} copied".replace("  ", " ")
+
+    def do_UID_MOVE(self, args):
+        messages, code = self.copy(args)
+        if messages is None:
+            return code
+        if code:
+            self.send(f"* OK {code}")
+        for message in messages:
+            message.flags.add("\\Deleted")
+        uids = {message.uid for message in messages}
+        self.expunge(lambda message: message.uid in uids)
+        return "OK moved"
+
+
+class FakeImapServer:
+    # A small in-memory IMAP server on a localhost socket, enough of RFC 3501, UIDPLUS, MOVE,
+    # UNSELECT and the Gmail extensions for imaplib and the code built on it. drop() makes
+    # it close the connection when a given command arrives, before or after running it.
+    def __init__(self, capabilities=CAPABILITIES):
+        self.capabilities = tuple(capabilities)
+        self.mailboxes = {}
+        self.can_create = True
+        self.add_mailbox("INBOX")
+        self.lock = threading.RLock()
+        self.commands = []  # (command, arguments) in the order they ran, across connections
+        self.drops = []     # [command, when] still to happen
+        self.hold = 0
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.sessions = []
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def add_mailbox(self, name, special_use=None):
+        self.mailboxes[name] = FakeMailbox(name, special_use)
+        return self.mailboxes[name]
+
+    def accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            session = Session(self, sock)
+            self.sessions.append(session)
+            threading.Thread(target=session.run, daemon=True).start()
+
+    def record(self, command, arguments):
+        with self.lock:
+            self.commands.append((command, arguments))
+
+    def ran(self, command):
+        return sum(name == command for name, _ in self.commands)
+
+    def drop(self, command, when="before"):
+        # Close the connection on the next command of this name ("UID FETCH", "EXPUNGE"):
+        # "before" running it, or "after" running it but before its tagged reply
+        with self.lock:
+            self.drops.append([command, when])
+
+    def take_drop(self, command):
+        with self.lock:
+            for drop in self.drops:
+                if drop[0] == command:
+                    self.drops.remove(drop)
+                    return drop[1]
+        return None
+
+    def hold_next(self, count):
+        # The next time the server waits for a command it reads count of them before answering
+        # any, which only completes if the client sends them without waiting for replies
+        self.hold = count
+
+    def take_hold(self):
+        with self.lock:
+            held, self.hold = self.hold, 0
+        return held
+
+    def connect(self, client=None):
+        # A logged-in connection set up the way imapConnection.connect() does it
+        mail = (client or FakeClient)("127.0.0.1", self.port, timeout=5)
+        mail.login("user", "secret")
+        mail.account = ("127.0.0.1", self.port, "user", "secret")
+        refresh_capabilities(mail)
+        return mail
+
+    def close(self):
+        self.listener.close()
+        for session in self.sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class FakeClient(CompressedIMAP4_SSL):
+    # CompressedIMAP4_SSL over plain TCP, the fake server does not speak TLS
+    def _create_socket(self, timeout):
+        return socket.create_connection((self.host, self.port), timeout)
+
+
+@pytest.fixture
+def imap_server(monkeypatch, tmp_path):
+    monkeypatch.setattr(imapConnection, "reconnect_delay", lambda attempt: 0)
+    monkeypatch.chdir(tmp_path)  # Archive runs write their journals under the working directory
+    server = FakeImapServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def gmail_server(monkeypatch, tmp_path):
+    monkeypatch.setattr(imapConnection, "reconnect_delay", lambda attempt: 0)
+    monkeypatch.chdir(tmp_path)  # Archive runs write their journals under the working directory
+    server = FakeImapServer(GMAIL_CAPABILITIES)
+    server.add_mailbox("[Gmail]/All Mail", "\\All")
+    yield server
+    server.close()
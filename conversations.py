@@ -0,0 +1,159 @@
+import email
+import re
+
+from imapPipeline import pipelined_uid
+from imapUtils import chunked, iter_fetch_responses, uid_set
+
+THREAD_HEADER_CHUNK = 1000  # UIDs per header-only threading fetch
+THREAD_HEADER_FETCH = "(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID IN-REPLY-TO REFERENCES)])"
+MESSAGE_ID_PATTERN = re.compile(r"<[^<>\s]+>")
+
+
+def message_ids(value):
+    return [message_id.lower() for message_id in MESSAGE_ID_PATTERN.findall(value or "")]
+
+
+class ConversationIndex:
+    # Union-find over Message-IDs: a message joins every conversation it references
+    # through In-Reply-To or References, which is the grouping step of JWZ threading.
+    def __init__(self, merged=None):
+        self.parents = {}
+        self.merged = merged  # Called with (kept root, absorbed root) when two conversations join
+
+    def find(self, key):
+        parents = self.parents
+        root = parents.setdefault(key, key)
+        while root != parents[root]:
+            root = parents[root]
+        while key != root:
+            parents[key], key = root, parents[key]
+        return root
+
+    def union(self, first, second):
+        first_root, second_root = self.find(first), self.find(second)
+        if first_root != second_root:
+            self.parents[second_root] = first_root
+            if self.merged:
+                self.merged(first_root, second_root)
+
+    def add(self, uid, headers):
+        msg = email.message_from_bytes(headers)
+        own = message_ids(msg.get("Message-ID"))
+        key = own[0] if own else f"uid:{uid}"
+        for related in message_ids(msg.get("References")) + message_ids(msg.get("In-Reply-To")):
+            self.union(related, key)
+        return key
+
+
+class ConversationSet:
+    # Conversation membership for a whole run. A match on any member acts on every member
+    # of its conversation, once: members of a conversation already acted on are not fetched
+    # again, and members that turn up after it was acted on follow it without being matched.
+    def __init__(self):
+        self.conversations = {}  # UID -> conversation key
+        self.uids = {}           # Conversation key -> UIDs of its members
+        self.done = set()        # Keys of conversations already acted on
+        self.following = set()   # Members of done conversations not acted on yet
+        self.followers = []      # The same, not yet handed out by take_followers()
+
+    def add(self, uid, key):
+        self.conversations[uid] = key
+        self.uids.setdefault(key, []).append(uid)
+        if key in self.done:
+            self.follow([uid])
+
+    def follow(self, uids):
+        self.following.update(uids)
+        self.followers.extend(uids)
+
+    def merge(self, kept, absorbed):
+        # Two conversations turned out to be one; if only one of them was acted on, the
+        # other's members follow it
+        uids = self.uids.pop(absorbed, [])
+        for uid in uids:
+            self.conversations[uid] = kept
+        if (kept in self.done) != (absorbed in self.done):
+            self.follow(uids if kept in self.done else self.uids.get(kept, []))
+            self.done.add(kept)
+        self.done.discard(absorbed)
+        self.uids.setdefault(kept, []).extend(uids)
+
+    def pending(self, uids):
+        # The UIDs of a window still worth fetching: conversations acted on are decided already
+        done, conversations = self.done, self.conversations
+        return [uid for uid in uids if conversations.get(int(uid)) not in done]
+
+    def take_followers(self):
+        followers, self.followers = self.followers, []
+        return followers
+
+    def members(self, uids):
+        # Every UID acting on uids touches, mapped to the matched UID it is acted on for
+        members = {}
+        for uid in uids:
+            key = self.conversations.get(uid)
+            if key is None or uid in self.following:
+                members.setdefault(uid, uid)
+            elif key not in self.done:
+                for member in self.uids[key]:
+                    members.setdefault(member, uid)
+        return members
+
+    def take(self, uids):
+        members = list(self.members(uids))
+        self.following.difference_update(members)
+        self.done.update(self.conversations[uid] for uid in uids if uid in self.conversations)
+        return members
+
+    def clear(self):
+        self.conversations.clear()
+        self.uids.clear()
+        self.done.clear()
+        self.following.clear()
+        self.followers.clear()
+
+
+class ConversationAction:
+    # Wraps another action: a match on any message of a conversation is applied to all of
+    # its members in the same bulk action. Conversations are built window by window as the
+    # windows stream past, a later message joins every conversation it references; members
+    # of conversations already acted on are neither fetched nor matched again.
+    def __init__(self, action):
+        self.action = action
+        self.conversations = ConversationSet()
+        self.index = ConversationIndex(self.conversations.merge)
+
+    def thread_windows(self, mail, uid_windows):
+        for uids in uid_windows:
+            commands = ((None, ('FETCH', uid_set(chunk), THREAD_HEADER_FETCH))
+                        for chunk in chunked(uids, THREAD_HEADER_CHUNK))
+            for _, result, data in pipelined_uid(mail, commands):
+                if result != 'OK':
+                    continue
+                for uid, _, literals in iter_fetch_responses(data):
+                    if uid is not None and literals:
+                        self.conversations.add(uid, self.index.find(self.index.add(uid, literals[0])))
+            yield self.conversations.pending(uids)
+
+    @property
+    def kind(self):
+        return self.action.kind
+
+    @property
+    def target(self):
+        return self.action.target
+
+    def members(self, uids):
+        return self.conversations.members(uids)
+
+    def take_followers(self):
+        return self.conversations.take_followers()
+
+    def apply(self, mail, uids):
+        members = self.conversations.take(uids)
+        return self.action.apply(mail, members) if members else 0
+
+    def finish(self, mail):
+        self.conversations.clear()
+        self.index = ConversationIndex(self.conversations.merge)
+        self.action.finish(mail)
@@ -1,22 +1,26 @@
-import imaplib
 from PyQt5.QtCore import QThread, pyqtSignal
+from cleanupJobs import CleanupJob, DRAFTS, run_cleanup_jobs
+from imapConnection import connect
+from progress import ProgressTracker
 
 class Deleter(QThread):
     log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
+    progress_signal = pyqtSignal('qint64', 'qint64', 'qint64', float)  # done, total, bytes, messages per second
     cancel_event = False
 
-    def __init__(self, imap_server, imap_port, username, password):
+    def __init__(self, imap_server, imap_port, username, password, jobs=None):
         super().__init__()
         self.imap_server = imap_server
         self.imap_port = imap_port
         self.username = username
         self.password = password
+        self.jobs = jobs or [CleanupJob(DRAFTS)]
 
     def run(self):
+        mail = None
         try:
-            mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            mail.login(self.username, self.password)
+            mail = connect((self.imap_server, self.imap_port, self.username, self.password))
             self.delete_draft_emails(mail)
         except Exception as e:
             self.log_signal.emit(f"Exception occurred: {str(e)}\n")
@@ -31,26 +35,11 @@ class Deleter(QThread):
 
     def delete_draft_emails(self, mail):
         try:
-            mail.select('"[Gmail]/Drafts"')
-            result, data = mail.search(None, "ALL")
-            if result != 'OK':
-                self.log_signal.emit("No draft messages found!\n")
-                return
-
-            deleted_emails = 0
-
-            for num in data[0].split():
-                if self.cancel_event:
-                    self.log_signal.emit("Deleting drafts cancelled.\n")
-                    break
-                try:
-                    mail.store(num, '+FLAGS', '\\Deleted')
-                    deleted_emails += 1
-                except Exception as e:
-                    self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-            mail.expunge()
-            summary = f"Total drafts deleted: {deleted_emails}\n"
+            results = run_cleanup_jobs(mail, self.jobs, self.log_signal.emit, lambda: self.cancel_event,
+                                       ProgressTracker(self.progress_signal.emit))
+            for name, deleted in results.items():
+                self.log_signal.emit(f"{name}: {deleted} messages deleted\n")
+            summary = f"Total messages deleted: {sum(results.values())}\n"
             self.log_signal.emit(summary)
         except Exception as e:
             self.log_signal.emit(f"Exception occurred: {str(e)}\n")
@@ -0,0 +1,164 @@
+import math
+import random
+import time
+
+from imapPipeline import pipelined_uid
+from imapUtils import chunked, count_messages, fetch_number, iter_fetch_responses, selected_uid_next, uid_set
+from parsePool import process_workers_for, scan_batch
+from pipeline import FETCH_BATCH_SIZE, PARSE_WORKERS, since_criteria
+from progress import format_duration
+
+SAMPLE_SIZE = 400             # Messages fetched and matched per estimate
+SAMPLE_BYTE_CAP = 64 * 1024   # Bytes of each sampled message fetched when keywords need bodies
+MAX_CANDIDATES = 20000        # Random UIDs tried per sampling round
+CANDIDATE_CHUNK = 5000        # Random UIDs per UID SEARCH, keeps the command line well under server limits
+SAMPLE_ROUNDS = 4
+Z_95 = 1.96
+
+
+def wilson_interval(hits, n, z=Z_95):
+    # Score interval for a proportion, well behaved for the 0 and n hit counts rare rules produce
+    if n == 0:
+        return 0.0, 1.0
+    p = hits / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def sample_uids(mail, criteria, sample_size, uid_next, rng, cancelled=lambda: False):
+    # Returns (sample, population). Random UIDs are drawn from the whole UID range and UID
+    # SEARCH keeps those that exist and match the criteria, so every message
+    # in the searched population is equally likely and the mailbox is never listed in full.
+    uid_range = uid_next - 1
+    if uid_range <= MAX_CANDIDATES:
+        result, data = mail.uid('SEARCH', None, f"UID 1:{max(uid_range, 1)} {criteria}")
+        uids = [int(uid) for uid in data[0].split()] if result == 'OK' and data[0] else []
+        return rng.sample(uids, min(sample_size, len(uids))), len(uids)
+
+    tried = set()
+    found = set()
+    for _ in range(SAMPLE_ROUNDS):
+        if len(found) >= sample_size or cancelled():
+            break
+        # Scale the next draw by the share of candidates that survived so far
+        if found:
+            wanted = int((sample_size - len(found)) * len(tried) / len(found) * 1.2) + 1
+        elif tried:
+            wanted = MAX_CANDIDATES
+        else:
+            wanted = int(sample_size * 1.2)
+        candidates = set()
+        while len(candidates) < min(wanted, MAX_CANDIDATES, uid_range - len(tried)):
+            uid = rng.randrange(1, uid_next)
+            if uid not in tried:
+                candidates.add(uid)
+        if not candidates:
+            break
+        tried |= candidates
+        for chunk in chunked(sorted(candidates), CANDIDATE_CHUNK):
+            result, data = mail.uid('SEARCH', None, f"UID {uid_set(chunk)} {criteria}")
+            if result == 'OK' and data[0]:
+                found.update(int(uid) for uid in data[0].split())
+
+    population = round(len(found) / len(tried) * uid_range) if tried else 0
+    sample = rng.sample(sorted(found), min(sample_size, len(found)))
+    return sample, population
+
+
+class MatchEstimate:
+    def __init__(self, archive_date, population, sample_size):
+        self.archive_date = archive_date
+        self.population = population
+        self.sample_size = sample_size
+        self.hits = 0
+        self.keyword_hits = {}
+        self.sender_hits = 0
+        self.seconds = 0.0       # Projected full run time
+        self.total_bytes = 0     # Projected bytes a full run fetches
+
+    def scaled(self, hits):
+        # (estimate, low, high) for the whole population
+        low, high = wilson_interval(hits, self.sample_size)
+        share = hits / self.sample_size if self.sample_size else 0.0
+        return round(share * self.population), math.floor(low * self.population), math.ceil(high * self.population)
+
+    def format(self):
+        estimate, low, high = self.scaled(self.hits)
+        summary = (f"Estimated matches since {self.archive_date}: ~{estimate} of {self.population} messages "
+                   f"(95% CI {low}-{high}, sample of {self.sample_size})\n\n")
+        for keyword, hits in sorted(self.keyword_hits.items(), key=lambda item: -item[1]):
+            estimate, low, high = self.scaled(hits)
+            summary += f"'{keyword}': ~{estimate} emails ({low}-{high})\n"
+        if self.sender_hits:
+            estimate, low, high = self.scaled(self.sender_hits)
+            summary += f"Selected senders: ~{estimate} emails ({low}-{high})\n"
+        summary += (f"\nEstimated full run: {format_duration(self.seconds)} "
+                    f"for {self.total_bytes / 1048576:.1f} MB\n")
+        return summary
+
+
+def estimate_matches(mail, matcher, archive_date, log, cancelled=lambda: False, sample_size=SAMPLE_SIZE, rng=None):
+    if not matcher:
+        log("No keywords or senders selected!\n")
+        return None
+    matcher.sender_index.log_dropped(log)
+
+    result, data = mail.select("inbox", readonly=True)
+    if result != 'OK':
+        log("No messages found!\n")
+        return None
+
+    criteria = since_criteria(archive_date)
+    uid_next = selected_uid_next(mail)
+    sample, population = sample_uids(mail, criteria, sample_size, uid_next, rng or random.Random(), cancelled)
+    # An exact count beats the sampled one when the server can give it cheaply
+    population = count_messages(mail, criteria, population)
+
+    # Sender rules only need headers, keyword rules need (the start of) the body
+    query = f"(UID RFC822.SIZE BODY.PEEK[]<0.{SAMPLE_BYTE_CAP}>)" if matcher.keywords else \
+        "(UID RFC822.SIZE BODY.PEEK[HEADER])"
+    items = []
+    full_bytes = 0
+    started = time.monotonic()
+    commands = ((None, ('FETCH', uid_set(chunk), query)) for chunk in chunked(sorted(sample), FETCH_BATCH_SIZE))
+    for _, result, data in pipelined_uid(mail, commands):
+        if cancelled():
+            log("Estimate cancelled.\n")
+            return None
+        if result != 'OK':
+            continue
+        for uid, meta, literals in iter_fetch_responses(data):
+            if uid is not None and literals:
+                items.append((uid, literals[0]))
+                full_bytes += fetch_number(meta, "RFC822.SIZE") or len(literals[0])
+    fetch_seconds = time.monotonic() - started
+
+    started = time.monotonic()
+    results, errors = scan_batch(items, matcher.scanner)
+    parse_seconds = time.monotonic() - started
+    for error in errors:
+        log(error)
+
+    estimate = MatchEstimate(archive_date, population, len(results))
+    for parsed in results:
+        match = matcher.match(parsed)
+        if match is None:
+            continue
+        estimate.hits += 1
+        if match.keyword:
+            estimate.keyword_hits[match.keyword] = estimate.keyword_hits.get(match.keyword, 0) + 1
+        else:
+            estimate.sender_hits += 1
+
+    if items:
+        # A full run fetches whole messages, scale the sample's fetch time by the size difference
+        scale = population / len(items)
+        fetched_bytes = sum(len(raw) for _, raw in items)
+        fetch_total = fetch_seconds * scale * max(1.0, full_bytes / max(fetched_bytes, 1))
+        parse_total = parse_seconds * scale / (process_workers_for(population) or PARSE_WORKERS)
+        # Fetching and parsing overlap in the pipeline, the slower side sets the pace
+        estimate.seconds = max(fetch_total, parse_total)
+        estimate.total_bytes = round(full_bytes * scale)
+    return estimate
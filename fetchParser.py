@@ -0,0 +1,90 @@
+import re
+
+# One token per match: "(", ")", a quoted string, a literal marker, or an atom. Atoms
+# may carry a section and partial such as BODY[HEADER.FIELDS (FROM)]<0>.
+TOKEN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}|([^\s()"\[\]]+(?:\[[^\]]*\](?:<\d+>)?)?))')
+QUOTED_ESCAPE = re.compile(rb'\\(.)')
+
+OPEN = object()
+CLOSE = object()
+LITERAL = object()
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    end = len(text)
+    while pos < end:
+        match = TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        opened, closed, quoted, literal, atom = match.groups()
+        if opened:
+            tokens.append(OPEN)
+        elif closed:
+            tokens.append(CLOSE)
+        elif quoted is not None:
+            tokens.append(QUOTED_ESCAPE.sub(rb"\1", quoted) if b"\\" in quoted else quoted)
+        elif literal is not None:
+            tokens.append(LITERAL)
+        elif atom is not None:
+            tokens.append(None if atom.upper() == b"NIL" else atom)
+    return tokens
+
+
+def parse_group(group):
+    # Nested lists of bytes / None for the raw items of one message (see imapUtils.iter_fetch_groups)
+    tokens = []
+    for part in group:
+        text, literal = part if isinstance(part, tuple) else (part, None)
+        tokens.extend(tokenize(text))
+        if literal is not None:
+            # The literal takes the place of the {N} marker that announced it
+            if tokens and tokens[-1] is LITERAL:
+                tokens[-1] = literal
+            else:
+                tokens.append(literal)
+
+    stack = [[]]
+    for token in tokens:
+        if token is OPEN:
+            stack.append([])
+        elif token is CLOSE:
+            if len(stack) > 1:
+                closed = stack.pop()
+                stack[-1].append(closed)
+        elif token is not LITERAL:
+            stack[-1].append(token)
+    while len(stack) > 1:
+        closed = stack.pop()
+        stack[-1].append(closed)
+    return stack[0]
+
+
+def fetch_attributes(group):
+    # {b"UID": b"12", b"ENVELOPE": [...], ...} for one FETCH response
+    for item in parse_group(group):
+        if isinstance(item, list):
+            return {key.upper(): value for key, value in zip(item[::2], item[1::2]) if isinstance(key, bytes)}
+    return {}
+
+
+def envelope_sender(envelope):
+    # ENVELOPE is (date subject from sender reply-to to cc bcc in-reply-to message-id),
+    # each address is (name adl mailbox host)
+    if not isinstance(envelope, list) or len(envelope) < 3 or not envelope[2]:
+        return None
+    address = envelope[2][0]
+    if not isinstance(address, list) or len(address) < 4 or not address[2] or not address[3]:
+        return None
+    return (address[2] + b"@" + address[3]).decode("utf-8", errors="replace")
+
+
+def has_attachment(structure):
+    # A part with an attachment disposition or a file name anywhere in BODYSTRUCTURE
+    if isinstance(structure, list):
+        return any(has_attachment(item) for item in structure)
+    if not isinstance(structure, bytes) or len(structure) > 10:
+        return False
+    return structure.lower() in (b"attachment", b"filename", b"name")
@@ -1,12 +1,15 @@
-import email
-import imaplib
-
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from imapConnection import connect
+from progress import ProgressTracker
+from senderModel import SenderCollector
+from senderScan import scan_senders
+
 
 class Fetcher(QThread):
     log_signal = pyqtSignal(str)
     senders_signal = pyqtSignal(list)
+    progress_signal = pyqtSignal('qint64', 'qint64', 'qint64', float)  # done, total, bytes, messages per second
     cancel_event = False
 
     def __init__(self, imap_server, imap_port, username, password, archive_date):
@@ -18,10 +21,10 @@ class Fetcher(QThread):
         self.archive_date = archive_date
 
     def run(self):
+        mail = None
         try:
             self.log_signal.emit("Starting sender collection...")
-            mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            mail.login(self.username, self.password)
+            mail = connect((self.imap_server, self.imap_port, self.username, self.password))
             self.collect_senders(mail)
         except Exception as e:
             self.log_signal.emit(f"Exception occurred: {str(e)}\n")
@@ -35,32 +38,7 @@ class Fetcher(QThread):
 
     def collect_senders(self, mail):
         try:
-            mail.select("inbox")
-            result, data = mail.search(None, f'(SINCE "{self.archive_date.strftime("%d-%b-%Y")}")')
-            if result != 'OK':
-                self.log_signal.emit("No messages found!\n")
-                return
-
-            senders = set()
-            nums = data[0].split()
-
-            for num in nums:
-                if self.cancel_event:
-                    self.log_signal.emit("Collecting senders cancelled.\n")
-                    break
-                try:
-                    result, msg_data = mail.fetch(num, "(RFC822)")
-                    if result != 'OK':
-                        self.log_signal.emit(f"ERROR getting message {num}\n")
-                        continue
-
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    sender = msg.get("From")
-                    if sender:
-                        senders.add(sender)
-                except Exception as e:
-                    self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-            self.senders_signal.emit(list(senders))
+            scan_senders(mail, self.archive_date, SenderCollector(), self.senders_signal.emit, self.log_signal.emit,
+                         lambda: self.cancel_event, ProgressTracker(self.progress_signal.emit))
         except Exception as e:
             self.log_signal.emit(f"Exception occurred: {str(e)}\n")
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+
+def atomic_write(path, payload):
+    # Write to a temporary file in the same directory and rename it over the original,
+    # so a crash mid-write never leaves a truncated file behind
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    name, _, extension = os.path.basename(path).partition(".")
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}-", suffix=f".{extension}" if extension else "", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
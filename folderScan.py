@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fileUtils import atomic_write
+from gmailBackend import is_gmail
+from imapUtils import deselect, find_special_folders, list_folders, mailbox_status
+from imapPipeline import PIPELINE_DEPTH
+from journal import ActionJournal
+from pipeline import ArchiveSummary, archive_mailbox, find_archive_folder
+from progress import ProgressGroup, ProgressTracker
+from senderCache import account_key
+
+FOLDER_WORKERS = 3  # Folders scanned at once, each on its own connection
+FOLDER_STATE_DIR = "folder_state"
+STATE_VERSION = 1
+# Sent, drafts, junk and trash are not archived from; All Mail, Archive, Starred and
+# Important only hold copies or already archived mail
+SKIPPED_SPECIAL_USE = ("\\Drafts", "\\Junk", "\\Trash", "\\All", "\\Sent", "\\Archive", "\\Flagged", "\\Important")
+
+
+def discover_folders(mail):
+    # Gmail labels are views of All Mail, not folders: a message shows up in every label it
+    # has, and archiving it from one leaves it in the others. Gmail runs stay on the inbox.
+    if is_gmail(mail):
+        return ["INBOX"]
+    folders = list_folders(mail)
+    skipped = set(find_special_folders(mail, folders).values())
+    skipped_flags = {flag.lower() for flag in SKIPPED_SPECIAL_USE}
+    names = [name for flags, name in folders if name not in skipped and not flags & skipped_flags]
+    if not any(name.upper() == "INBOX" for name in names):
+        names.append("INBOX")
+    # The inbox first, it changes most often
+    return sorted(names, key=lambda name: name.upper() != "INBOX")
+
+
+def status_items(mail):
+    # HIGHESTMODSEQ also changes on flag and label changes, not only on new or removed mail
+    items = ("UIDVALIDITY", "UIDNEXT", "MESSAGES")
+    return items + ("HIGHESTMODSEQ",) if 'CONDSTORE' in mail.capabilities else items
+
+
+def folder_statuses(mail, folders):
+    # STATUS reads each folder's counters without selecting it
+    items = status_items(mail)
+    return {folder: mailbox_status(mail, folder, items) for folder in folders}
+
+
+def state_path(account, directory=FOLDER_STATE_DIR):
+    return os.path.join(directory, f"folders-{account_key(account)}.json")
+
+
+def load_folder_state(account, directory=FOLDER_STATE_DIR):
+    # Folder -> {"status", "fingerprint", "since"} as left by the last completed archive of it
+    try:
+        with open(state_path(account, directory), encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return data["folders"] if data.get("version") == STATE_VERSION else {}
+
+
+def save_folder_state(account, state, directory=FOLDER_STATE_DIR):
+    payload = json.dumps({"version": STATE_VERSION, "folders": state}, separators=(",", ":")).encode("utf-8")
+    atomic_write(state_path(account, directory), payload)
+
+
+def archive_fingerprint(matcher, metadata_rules=()):
+    # Identifies the rules a folder was archived with, None when results can change without the folder changing
+    if any(rule.older_than_days is not None for rule in metadata_rules):
+        return None  # Age rules match more messages every day
+    source = [sorted(matcher.keywords), sorted(matcher.sender_index.addresses), sorted(matcher.sender_index.domains),
+              sorted(rule.describe() for rule in metadata_rules)]
+    return hashlib.sha1(json.dumps(source).encode("utf-8")).hexdigest()
+
+
+def is_unchanged(entry, status, fingerprint, archive_date):
+    # Same STATUS as right after the last run, with the same rules over the same or a shorter date range
+    return (bool(status) and fingerprint is not None and entry is not None and entry.get("status") == status
+            and entry.get("fingerprint") == fingerprint and archive_date.isoformat() >= entry.get("since", ""))
+
+
+def run_per_folder(mail, connections, account, folders, work, log, workers=FOLDER_WORKERS):
+    # Returns {folder: work(connection, folder)}, None for folders that failed. imaplib
+    # connections cannot be shared between threads, so parallel folders get pooled connections.
+    if connections is None or len(folders) <= 1:
+        connections = None
+        workers = 1
+
+    def run(folder):
+        folder_mail = connections.acquire(account) if connections else mail
+        reusable = False
+        try:
+            result = work(folder_mail, folder)
+            reusable = True
+            return folder, result
+        except Exception as e:
+            log(f"Exception occurred: {str(e)}\n")
+            return folder, None
+        finally:
+            if connections:
+                connections.release(account, folder_mail, reusable)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(folders)))) as executor:
+        return dict(executor.map(run, folders))
+
+
+def archive_folders(mail, connections, account, matcher, archive_date, log, cancelled=lambda: False, progress=None,
+                    metadata_rules=(), workers=FOLDER_WORKERS, pipeline_depth=PIPELINE_DEPTH):
+    # Archive every folder that changed since its last run, in parallel, into one summary and one journal
+    if is_gmail(mail):
+        log("Gmail labels are not separate folders, archiving the inbox only.\n")
+    elif find_archive_folder(mail, log) is None:
+        # Created here once, not by every folder's connection at the same time
+        return None
+    folders = discover_folders(mail)
+    statuses = folder_statuses(mail, folders)
+    state = load_folder_state(account)
+    fingerprint = archive_fingerprint(matcher, metadata_rules)
+    changed = [folder for folder in folders
+               if not is_unchanged(state.get(folder), statuses[folder], fingerprint, archive_date)]
+    log(f"Archiving {len(changed)} of {len(folders)} folders, the rest are unchanged since the last run.\n")
+
+    summary = ArchiveSummary()
+    summary.skipped_folders = len(folders) - len(changed)
+    progress = progress or ProgressTracker(lambda *args: None)
+    group = ProgressGroup(progress)
+    journal = ActionJournal()
+    log(f"Recording archived messages in {journal.path}\n")
+    matcher.sender_index.log_dropped(log)
+
+    def archive(folder_mail, folder):
+        def folder_log(message):
+            log(f"[{folder}] {message}")
+
+        folder_summary = archive_mailbox(folder_mail, matcher, archive_date, folder_log, cancelled,
+                                         progress=group.part(), journal=journal, metadata_rules=metadata_rules,
+                                         folder=folder, pipeline_depth=pipeline_depth)
+        if folder_summary is None or cancelled():
+            return folder_summary, None
+        # Servers may answer STATUS on the selected folder from stale counters. Not CLOSE,
+        # that would expunge \Deleted messages the run did not touch.
+        deselect(folder_mail)
+        return folder_summary, mailbox_status(folder_mail, folder, status_items(folder_mail))
+
+    try:
+        results = run_per_folder(mail, connections, account, changed, archive, log, workers)
+    finally:
+        journal.close()
+
+    for folder, result in results.items():
+        if result is None:
+            continue
+        folder_summary, status = result
+        if folder_summary is not None:
+            summary.merge(folder_summary, folder)
+        if status and fingerprint is not None:
+            state[folder] = {"status": status, "fingerprint": fingerprint, "since": archive_date.isoformat()}
+    save_folder_state(account, state)
+    progress.finish()
+    return summary
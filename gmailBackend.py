@@ -0,0 +1,62 @@
+from conversations import ConversationSet
+from imapUtils import (chunked, fetch_number, find_special_folders, gmail_label, iter_fetch_responses, quote_mailbox,
+                       uid_set)
+from imapPipeline import pipelined_uid
+from journal import UNLABEL
+
+THREAD_FETCH_CHUNK = 5000  # UIDs per X-GM-THRID fetch
+ALL_MAIL = "[Gmail]/All Mail"
+
+
+def is_gmail(mail):
+    return 'X-GM-EXT-1' in mail.capabilities
+
+
+class GmailBackend:
+    # Gmail archive action that decides per conversation: a match on any message of an
+    # X-GM-THRID is applied to every message of the thread with one UID MOVE to All Mail
+    # (or one \Inbox label removal). Thread ids are read window by window as the windows
+    # stream past; members of threads already acted on are not fetched again, and members
+    # that turn up later follow their thread without being matched.
+    def __init__(self, mail, all_mail=None, folder="INBOX"):
+        self.all_mail = all_mail or find_special_folders(mail).get("\\All", ALL_MAIL)
+        self.label = gmail_label(folder)  # A label folder is archived by dropping that label instead
+        self.can_move = 'MOVE' in mail.capabilities
+        self.conversations = ConversationSet()
+        # Moving out of the inbox and dropping \Inbox both leave the message in All Mail
+        self.kind = UNLABEL
+        self.target = self.all_mail
+
+    def thread_windows(self, mail, uid_windows):
+        for uids in uid_windows:
+            commands = ((None, ('FETCH', uid_set(chunk), "(UID X-GM-THRID)"))
+                        for chunk in chunked(uids, THREAD_FETCH_CHUNK))
+            for _, result, data in pipelined_uid(mail, commands):
+                if result != 'OK':
+                    continue
+                for uid, meta, _ in iter_fetch_responses(data):
+                    thread_id = fetch_number(meta, "X-GM-THRID")
+                    if uid is not None and thread_id is not None:
+                        self.conversations.add(uid, thread_id)
+            yield self.conversations.pending(uids)
+
+    def members(self, uids):
+        return self.conversations.members(uids)
+
+    def take_followers(self):
+        return self.conversations.take_followers()
+
+    def apply(self, mail, uids):
+        members = self.conversations.take(uids)
+        if not members:
+            return 0
+        message_set = uid_set(members)
+        if self.can_move:
+            mail.uid('MOVE', message_set, quote_mailbox(self.all_mail))
+        else:
+            mail.uid('STORE', message_set, '-X-GM-LABELS', f"({self.label})")
+        return len(members)
+
+    def finish(self, mail):
+        # MOVE and label removal take effect immediately, there is nothing to expunge
+        self.conversations.clear()
@@ -0,0 +1,97 @@
+import argparse
+import datetime
+import sys
+
+from analytics import analyze_mailbox
+from configStore import ConfigStore
+from estimator import estimate_matches
+from folderScan import archive_folders
+from imapConnection import ConnectionPool, connect
+from imapPipeline import PIPELINE_DEPTH
+from journal import latest_journal, restore_journal
+from matcher import MessageMatcher
+from metadataRules import MetadataRule
+from pipeline import archive_mailbox
+from progress import ProgressTracker, progress_line
+
+
+def log(message):
+    sys.stdout.write(message if message.endswith("\n") else message + "\n")
+    sys.stdout.flush()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="main.py --headless", description="Archive emails without the GUI.")
+    parser.add_argument("profile", help="name of a saved configuration")
+    parser.add_argument("--days", type=int, default=7, help="archive emails from the last N days (default 7)")
+    parser.add_argument("--restore", metavar="JOURNAL", nargs="?", const="latest",
+                        help="undo the run recorded in JOURNAL (default: the latest journal) instead of archiving")
+    parser.add_argument("--estimate", action="store_true",
+                        help="estimate matches and run time from a random sample instead of archiving")
+    parser.add_argument("--analyze", metavar="FOLDER", nargs="?", const="INBOX",
+                        help="report sizes by sender, domain, month and attachments instead of archiving")
+    parser.add_argument("--pipeline-depth", type=int, default=PIPELINE_DEPTH, metavar="N",
+                        help=f"IMAP commands kept in flight while archiving, raise it on high-latency links "
+                             f"(default {PIPELINE_DEPTH})")
+    parser.add_argument("--all-folders", action="store_true",
+                        help="archive from every folder that changed since the last run, not only the inbox "
+                             "(Gmail labels are not folders, Gmail runs stay on the inbox)")
+    return parser.parse_args(argv)
+
+
+def run_headless(argv):
+    args = parse_args(argv)
+    store = ConfigStore()
+    config = store.get(args.profile)
+    if not config:
+        log(f"Unknown configuration: {args.profile}")
+        return 1
+
+    if args.restore:
+        path = latest_journal() if args.restore == "latest" else args.restore
+        if not path:
+            log("No journal to restore.")
+            return 1
+        return run_restore(config, path)
+
+    # The stored rule artifact is used as-is, no keyword or sender parsing at start-up
+    rules = store.rules(args.profile)
+    matcher = MessageMatcher.from_rules(rules)
+    metadata_rules = [MetadataRule.parse(rule) for rule in rules.get("metadata_rules", [])]
+    archive_date = datetime.date.today() - datetime.timedelta(days=args.days)
+
+    account = (config["imap_server"], int(config["imap_port"]), config["email"], config["app_password"])
+    mail = connect(account)
+    connections = ConnectionPool()
+    try:
+        if args.analyze:
+            summary = analyze_mailbox(mail, log, folder=args.analyze, metadata_rules=metadata_rules)
+        elif args.estimate:
+            summary = estimate_matches(mail, matcher, archive_date, log)
+        else:
+            progress = ProgressTracker(lambda *args: log(progress_line(*args)))
+            if args.all_folders:
+                summary = archive_folders(mail, connections, account, matcher, archive_date, log, progress=progress,
+                                          metadata_rules=metadata_rules, pipeline_depth=args.pipeline_depth)
+            else:
+                summary = archive_mailbox(mail, matcher, archive_date, log, progress=progress,
+                                          metadata_rules=metadata_rules, pipeline_depth=args.pipeline_depth)
+        if summary:
+            log(summary.format())
+    finally:
+        connections.close_all()
+        if mail.state != 'LOGOUT':
+            mail.logout()
+    return 0
+
+
+def run_restore(config, path):
+    mail = connect((config["imap_server"], int(config["imap_port"]), config["email"], config["app_password"]))
+    try:
+        log(f"Restoring {path}")
+        restored = restore_journal(mail, path, log)
+        log(f"Total messages restored: {restored}")
+    finally:
+        if mail.state != 'LOGOUT':
+            mail.logout()
+    return 0
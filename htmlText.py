@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+HTML_BYTE_CAP = 256 * 1024   # Bytes of an HTML part decoded and fed to the extractor
+HTML_FEED_SIZE = 16 * 1024   # Characters per feed() call, keywords are checked between feeds
+HTML_CACHE_SIZE = 2048       # Extracted texts kept per process, keyed by Message-ID
+
+SKIPPED_TAGS = {"style", "script", "head", "title", "noscript", "template"}
+BREAK_TAGS = {"p", "div", "br", "li", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+
+
+class HtmlTextExtractor(HTMLParser):
+    # Collects text nodes as they stream past, without building a DOM
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.chunks = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BREAK_TAGS:
+            self.chunks.append(" ")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BREAK_TAGS:
+            self.chunks.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in BREAK_TAGS:
+            self.chunks.append(" ")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.chunks.append(data)
+
+
+class HtmlTextCache:
+    def __init__(self, size=HTML_CACHE_SIZE):
+        self.size = size
+        self.texts = OrderedDict()
+
+    def get(self, message_id):
+        text = self.texts.get(message_id)
+        if text is not None:
+            self.texts.move_to_end(message_id)
+        return text
+
+    def put(self, message_id, text):
+        self.texts[message_id] = text
+        self.texts.move_to_end(message_id)
+        if len(self.texts) > self.size:
+            self.texts.popitem(last=False)
+
+
+html_cache = HtmlTextCache()
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def scan_html(html, scanner, message_id=None, complete=True):
+    # Returns (keyword, text). Extraction stops at the first keyword hit; only texts of
+    # complete (not truncated to HTML_BYTE_CAP) parts are cached.
+    cached = html_cache.get(message_id) if message_id else None
+    if cached is not None:
+        return scanner.find_in_text(cached), cached
+
+    extractor = HtmlTextExtractor()
+    checked = 0   # Chunks already searched
+    tail = ""     # End of the text already searched
+    # Raw text still holds runs of whitespace, so leave extra room beyond the longest keyword
+    overlap = 2 * max((len(lowered) for _, lowered in scanner.keywords), default=0) + 32
+    for start in range(0, len(html), HTML_FEED_SIZE):
+        extractor.feed(html[start:start + HTML_FEED_SIZE])
+        # Only search the new chunks plus enough overlap to catch keywords split across feeds,
+        # joining everything on each feed would make long parts quadratic
+        window = tail + "".join(extractor.chunks[checked:])
+        checked = len(extractor.chunks)
+        keyword = scanner.find_in_text(normalize_text(window))
+        if keyword:
+            return keyword, normalize_text("".join(extractor.chunks))
+        tail = window[-overlap:]
+
+    extractor.close()
+    text = normalize_text("".join(extractor.chunks))
+    if message_id and complete:
+        html_cache.put(message_id, text)
+    return scanner.find_in_text(text), text
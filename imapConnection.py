@@ -0,0 +1,325 @@
+import imaplib
+import random
+import threading
+import time
+import zlib
+
+from runStats import TransferStats
+
+COMPRESS_READ_SIZE = 64 * 1024  # Compressed bytes read from the socket at a time
+SOCKET_TIMEOUT = 300        # Seconds without a byte from the server before the connection counts as dead
+RECONNECT_ATTEMPTS = 8      # Reconnects tried after a dropped connection before giving up
+RECONNECT_BASE_DELAY = 1.0  # Seconds, the backoff doubles after every failed attempt
+RECONNECT_MAX_DELAY = 60.0
+COMMAND_RETRIES = 3         # Times one command is sent again on a fresh connection
+# Sent again after a drop only when running them twice gives the same result as once: reads,
+# and UID STORE of absolute FLAGS. COPY, MOVE, EXPUNGE, APPEND, +FLAGS/-FLAGS and label changes,
+# and anything addressed by sequence number (which shifts between connections) never are.
+REPLAYED = ('NOOP', 'STATUS', 'SELECT', 'EXAMINE')
+REPLAYED_UID = ('FETCH', 'SEARCH')
+ABSOLUTE_FLAGS = ('FLAGS', 'FLAGS.SILENT')
+# Part of opening a session, a drop during them fails the connection instead of reconnecting
+NOT_RECONNECTED = ('LOGIN', 'AUTHENTICATE', 'LOGOUT', 'STARTTLS', 'COMPRESS')
+# A dead connection shows up as abort (BYE, EOF, failed send) or as the socket's own error
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError)
+
+# imaplib refuses commands it does not know, RFC 4978 allows COMPRESS once authenticated
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+
+class SessionLost(imaplib.IMAP4.abort):
+    # The connection dropped and could not be brought back to the same folder state
+    pass
+
+
+class UnconfirmedCommand(imaplib.IMAP4.error):
+    # The connection dropped before the reply to a command that is not safe to send twice.
+    # The connection is back, but the command may or may not have taken effect.
+    pass
+
+
+def is_replayable(name, args):
+    if name == 'UID':
+        command = str(args[0]).upper() if args else ''
+        if command == 'STORE':
+            return len(args) > 2 and str(args[2]).upper() in ABSOLUTE_FLAGS
+        return command in REPLAYED_UID
+    return name in REPLAYED
+
+
+def describe_command(name, args):
+    return f"UID {str(args[0]).upper()}" if name == 'UID' and args else name
+
+
+def reconnect_delay(attempt):
+    # Exponential backoff with full jitter, so connections dropped together don't come back in lockstep
+    return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt))
+
+
+class CompressedIMAP4_SSL(imaplib.IMAP4_SSL):
+    # IMAP4_SSL that can switch the stream to COMPRESS=DEFLATE (RFC 4978). Until
+    # enable_compression() succeeds, and on servers without it, it is plain IMAP4_SSL.
+    def __init__(self, *args, **kwargs):
+        self.compressor = None
+        self.decompressor = None
+        self.buffer = bytearray()  # Decompressed bytes not yet read
+        self.wire_view = memoryview(bytearray(COMPRESS_READ_SIZE))  # Reused for every socket read
+        self.transfer = None
+        self.account = None    # Set by connect(), lets the connection log in again by itself
+        self.selected = None   # (mailbox, readonly, UIDVALIDITY) to restore after a reconnect
+        self.reconnecting = False
+        self.reconnects = 0
+        super().__init__(*args, **kwargs)
+
+    def enable_compression(self):
+        if 'COMPRESS=DEFLATE' not in self.capabilities or self.compressor is not None:
+            return False
+        try:
+            result, _ = self._simple_command('COMPRESS', 'DEFLATE')
+        except self.error:
+            return False
+        if result != 'OK':
+            return False
+        # Raw deflate both ways (no zlib header), flushed after every command the client sends
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        if self.transfer is None:
+            self.transfer = TransferStats()  # Kept across reconnects
+        return True
+
+    def select(self, mailbox='INBOX', readonly=False):
+        result, data = super().select(mailbox, readonly)
+        if result == 'OK':
+            # Peek, callers still read UIDVALIDITY through response()
+            validity = self.untagged_responses.get('UIDVALIDITY')
+            self.selected = (mailbox, readonly, validity[-1] if validity else None)
+        else:
+            self.selected = None  # A failed SELECT leaves no folder selected
+        return result, data
+
+    def close(self):
+        try:
+            return super().close()
+        finally:
+            self.selected = None
+
+    def unselect(self):
+        try:
+            return super().unselect()
+        finally:
+            self.selected = None
+
+    def can_reconnect(self, name, error):
+        return (self.account is not None and not self.reconnecting and name not in NOT_RECONNECTED
+                and not isinstance(error, SessionLost))
+
+    def _simple_command(self, name, *args):
+        # A command that fails on a dead connection is sent again once the connection has been
+        # brought back, if is_replayable() says that is safe. The failed command never got its
+        # tagged reply, everything before it did. Other commands raise UnconfirmedCommand on the
+        # fresh connection, so the caller can carry on without assuming either outcome.
+        retries = 0
+        while True:
+            try:
+                return super()._simple_command(name, *args)
+            except CONNECTION_ERRORS as e:
+                if not self.can_reconnect(name, e):
+                    raise
+                if retries >= COMMAND_RETRIES:
+                    raise SessionLost(f"{name} failed on {retries + 1} connections: {str(e)}") from e
+                retries += 1
+                self.reconnect(e)
+                if not is_replayable(name, args):
+                    raise UnconfirmedCommand(f"Connection dropped before {describe_command(name, args)} was "
+                                             f"answered, it may or may not have taken effect") from e
+
+    def reopen(self):
+        try:
+            self.shutdown()
+        except OSError:
+            pass
+        self.compressor = None
+        self.decompressor = None
+        self.buffer = bytearray()
+        # Resets tags and untagged responses, then opens a fresh socket and reads the greeting
+        imaplib.IMAP4.__init__(self, self.host, self.port, SOCKET_TIMEOUT)
+
+    def reconnect(self, error):
+        # Log in again on the same object, so every stage holding this connection keeps
+        # working, and select the same folder again. Raises SessionLost when the server
+        # stays unreachable, or when the folder's UIDVALIDITY changed and the UIDs held
+        # by the caller no longer name the same messages.
+        selected = self.selected
+        compressed = self.compressor is not None
+        self.reconnecting = True
+        try:
+            for attempt in range(RECONNECT_ATTEMPTS):
+                time.sleep(reconnect_delay(attempt))
+                try:
+                    self.reopen()
+                    self.login(*self.account[2:])
+                    refresh_capabilities(self)
+                    if compressed:
+                        self.enable_compression()
+                    if selected:
+                        mailbox, readonly, validity = selected
+                        if self.select(mailbox, readonly)[0] != 'OK':
+                            raise SessionLost(f"Could not select {mailbox} after reconnecting")
+                        if self.selected[2] != validity:
+                            raise SessionLost(f"UIDVALIDITY of {mailbox} changed while reconnecting")
+                    self.reconnects += 1
+                    return
+                except SessionLost:
+                    raise
+                except CONNECTION_ERRORS as e:
+                    error = e
+                except self.error as e:
+                    raise SessionLost(f"Could not log in again: {str(e)}") from e
+            raise SessionLost(f"Connection lost, {RECONNECT_ATTEMPTS} reconnects failed: {str(error)}")
+        finally:
+            self.reconnecting = False
+
+    def send(self, data):
+        if self.compressor is None:
+            return super().send(data)
+        payload = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.transfer.raw_out += len(data)
+        self.transfer.wire_out += len(payload)
+        self.sock.sendall(payload)
+
+    def receive(self):
+        # One socket read into the reusable wire buffer, decompressed
+        started = time.monotonic()
+        count = self.sock.recv_into(self.wire_view)
+        self.transfer.read_seconds += time.monotonic() - started
+        if not count:
+            raise self.abort('socket error: EOF')
+        data = self.decompressor.decompress(self.wire_view[:count])
+        self.transfer.wire_in += count
+        self.transfer.raw_in += len(data)
+        return data
+
+    def take(self, size):
+        # Bytes off the front of the buffer, copied once
+        data = bytes(memoryview(self.buffer)[:size])
+        del self.buffer[:size]
+        return data
+
+    def read(self, size):
+        if self.decompressor is None:
+            return super().read(size)
+        if len(self.buffer) >= size:
+            return self.take(size)
+        # Message literals are mostly larger than what is buffered: gather the decompressed
+        # chunks as views and join them once into the literal, instead of passing every
+        # byte through the buffer
+        pieces = [self.buffer]
+        missing = size - len(self.buffer)
+        self.buffer = bytearray()
+        while missing > 0:
+            data = memoryview(self.receive())
+            if len(data) > missing:
+                self.buffer += data[missing:]
+                data = data[:missing]
+            pieces.append(data)
+            missing -= len(data)
+        return b"".join(pieces)
+
+    def readline(self):
+        if self.decompressor is None:
+            return super().readline()
+        searched = 0
+        while True:
+            end = self.buffer.find(b"\n", searched)
+            if end >= 0:
+                break
+            if len(self.buffer) > imaplib._MAXLINE:
+                raise self.error(f"got more than {imaplib._MAXLINE} bytes")
+            searched = len(self.buffer)
+            self.buffer += self.receive()
+        return self.take(end + 1)
+
+
+def refresh_capabilities(mail):
+    # Servers often advertise more after login (COMPRESS, MOVE, ESEARCH) than in their greeting,
+    # usually in the LOGIN response itself
+    _, data = mail.response('CAPABILITY')
+    if not data or not data[-1]:
+        result, data = mail.capability()
+        if result != 'OK':
+            return
+    if data and data[-1]:
+        mail.capabilities = tuple(data[-1].decode("ascii", errors="replace").upper().split())
+
+
+def can_reconnect(mail, name, error):
+    # Connections from connect() reconnect by themselves, anything else just fails
+    reconnectable = getattr(mail, "can_reconnect", None)
+    return bool(reconnectable and reconnectable(name, error))
+
+
+def reconnect_count(mail):
+    return getattr(mail, "reconnects", 0)
+
+
+def transfer_stats(mail):
+    # TransferStats of a compressed connection, None for a plain one
+    return getattr(mail, "transfer", None)
+
+
+def connect(account, compress=True):
+    imap_server, imap_port, username, password = account
+    mail = CompressedIMAP4_SSL(imap_server, int(imap_port), timeout=SOCKET_TIMEOUT)
+    mail.login(username, password)
+    mail.account = account
+    refresh_capabilities(mail)
+    if compress:
+        mail.enable_compression()
+    return mail
+
+
+def close_connection(mail):
+    try:
+        # No CLOSE first, it would expunge every \Deleted message in the selected folder
+        if mail.state != 'LOGOUT':
+            mail.logout()
+    except Exception:
+        pass  # The server may already have dropped an idle session
+
+
+class ConnectionPool:
+    # Idle logged-in connections per account, so back-to-back jobs skip the TLS
+    # handshake and LOGIN. Each connection is used by one job at a time.
+    def __init__(self, connect=connect):
+        self.connect = connect
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, account):
+        while True:
+            with self.lock:
+                idle = self.idle.get(account)
+                mail = idle.pop() if idle else None
+            if mail is None:
+                return self.connect(account)
+            try:
+                # Servers drop idle sessions, make sure this one is still alive
+                if mail.noop()[0] == 'OK':
+                    return mail
+            except Exception:
+                pass
+            close_connection(mail)
+
+    def release(self, account, mail, reusable=True):
+        if not reusable or mail.state == 'LOGOUT':
+            close_connection(mail)
+            return
+        with self.lock:
+            self.idle.setdefault(account, []).append(mail)
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for mail in connections:
+                close_connection(mail)
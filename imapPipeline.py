@@ -0,0 +1,107 @@
+import collections
+
+from imapConnection import (COMMAND_RETRIES, CONNECTION_ERRORS, SessionLost, UnconfirmedCommand, can_reconnect,
+                            describe_command, is_replayable)
+
+PIPELINE_DEPTH = 4  # Tagged commands kept in flight on one connection
+
+
+class CommandPipeline:
+    # Sends UID commands without waiting for the previous one to complete, so a
+    # high-latency link stays busy instead of idling a round trip per command.
+    # Completions are taken in submission order, each together with the untagged
+    # data read up to its own tagged response, which is where servers that answer
+    # commands in order put it. UID FETCH data carries its UIDs, so anything
+    # a server answers out of order is still processed exactly once.
+    #
+    # imaplib files untagged data by response name only, so no other command may
+    # run on the connection while commands are in flight: call drain() first.
+    #
+    # When the connection drops, the commands still in flight never got their tagged
+    # reply; they are sent again once the connection is back if all of them are safe to
+    # repeat (see imapConnection.is_replayable). Completed ones are not.
+    def __init__(self, mail, depth=PIPELINE_DEPTH):
+        self.mail = mail
+        self.depth = max(1, depth)
+        self.in_flight = collections.deque()  # (tag, command, args, key)
+        self.ready = collections.deque()      # (key, result, data), oldest first
+        self.replays = 0                      # Since the last completed command
+
+    def submit(self, key, command, *args):
+        while True:
+            try:
+                tag = self.mail._command('UID', command, *args)
+                break
+            except CONNECTION_ERRORS as e:
+                self.replay(e)
+        self.in_flight.append((tag, command.upper(), args, key))
+
+    def replay(self, error):
+        unacknowledged = list(self.in_flight)
+        # Whatever happens next, nothing sent on the dead connection will complete
+        self.in_flight.clear()
+        if not can_reconnect(self.mail, 'UID', error):
+            raise error
+        if self.replays >= COMMAND_RETRIES:
+            raise SessionLost(f"UID commands failed on {self.replays + 1} connections: {str(error)}") from error
+        self.replays += 1
+        self.mail.reconnect(error)
+        for _, command, args, _ in unacknowledged:
+            if not is_replayable('UID', (command,) + args):
+                raise UnconfirmedCommand(f"Connection dropped before {describe_command('UID', (command,))} was "
+                                         f"answered, it may or may not have taken effect") from error
+        for _, command, args, key in unacknowledged:
+            self.submit(key, command, *args)
+
+    def full(self):
+        return len(self.in_flight) >= self.depth
+
+    def complete_one(self):
+        while True:
+            tag, command, args, key = self.in_flight[0]
+            try:
+                result, data = self.mail._command_complete('UID', tag)
+                break
+            except CONNECTION_ERRORS as e:
+                # Nothing else in flight will complete on this connection either
+                self.replay(e)
+            except self.mail.error as e:
+                # A BAD answer to one command, the others are unaffected
+                self.in_flight.popleft()
+                self.ready.append((key, 'BAD', [str(e).encode()]))
+                return
+        self.in_flight.popleft()
+        self.replays = 0
+        # Same untagged response lookup imaplib's uid() does
+        name = command if command in ('SEARCH', 'SORT', 'THREAD') else 'FETCH'
+        result, data = self.mail._untagged_response(result, data, name)
+        self.ready.append((key, result, data))
+
+    def drain(self):
+        while self.in_flight:
+            self.complete_one()
+
+    def take_ready(self):
+        while self.ready:
+            yield self.ready.popleft()
+
+
+def pipelined_uid(mail, commands, depth=PIPELINE_DEPTH):
+    # commands yields (key, (command, *args)) and must not use the connection itself.
+    # Yields (key, result, data) in the same order while up to depth commands are in flight.
+    pipeline = CommandPipeline(mail, depth)
+    try:
+        for key, args in commands:
+            pipeline.submit(key, *args)
+            if pipeline.full():
+                pipeline.complete_one()
+            yield from pipeline.take_ready()
+        pipeline.drain()
+        yield from pipeline.take_ready()
+    finally:
+        # A consumer that stops early (cancel) still leaves the connection with nothing in flight
+        if pipeline.in_flight:
+            try:
+                pipeline.drain()
+            except CONNECTION_ERRORS:
+                pass  # Already failing, the caller gets the first error
@@ -0,0 +1,257 @@
+import datetime
+import imaplib
+import re
+import time
+
+UID_WINDOW_SIZE = 20000  # UIDs covered by each windowed UID SEARCH
+UID_PATTERN = re.compile(rb"UID (\d+)")
+NO_SUCH_FOLDER = "EmailArchiver/no such folder"  # EXAMINEd by deselect() to leave the selected folder
+LIST_RESPONSE = re.compile(r'\((?P<flags>[^)]*)\) (?P<delimiter>"(?:[^"\\]|\\.)*"|NIL) (?P<name>.+)')
+
+# Folder names to fall back on when the server does not advertise special-use flags
+SPECIAL_USE_FALLBACKS = {
+    "\\Drafts": ("[Gmail]/Drafts", "Drafts", "INBOX.Drafts", "Draft"),
+    "\\Junk": ("[Gmail]/Spam", "Junk", "Spam", "INBOX.Junk", "Junk E-mail"),
+    "\\Trash": ("[Gmail]/Trash", "Trash", "INBOX.Trash", "Deleted Items", "Deleted Messages"),
+    "\\All": ("[Gmail]/All Mail", "All Mail", "Archive"),
+    "\\Sent": ("[Gmail]/Sent Mail", "Sent", "INBOX.Sent", "Sent Items"),
+    "\\Archive": ("Archive", "Archives", "INBOX.Archive"),
+}
+
+
+def deselect(mail):
+    # Leave the selected folder without CLOSE, which expunges every \Deleted message in it,
+    # including ones the user flagged. Without UNSELECT (RFC 3691), EXAMINE of a folder that
+    # does not exist leaves nothing selected and expunges nothing (RFC 3501 6.3.1).
+    if 'UNSELECT' in mail.capabilities:
+        return mail.unselect()
+    return mail.select(quote_mailbox(NO_SUCH_FOLDER), readonly=True)
+
+
+def imap_date(date):
+    return date.strftime("%d-%b-%Y")
+
+
+def days_ago(days):
+    return datetime.date.today() - datetime.timedelta(days=days)
+
+
+def quote_mailbox(name):
+    return quote_string(name)
+
+
+def quote_string(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def gmail_label(folder):
+    # Gmail shows the inbox as the \Inbox label and every other label as a folder of the same name
+    return "\\Inbox" if folder.upper() == "INBOX" else quote_string(folder)
+
+
+def or_criteria(key, values, quote=True):
+    # IMAP OR is binary, so N values become OR k a OR k b ... k z
+    terms = [f"{key} {quote_string(value) if quote else value}" for value in values]
+    if not terms:
+        return None
+    query = terms[-1]
+    for term in reversed(terms[:-1]):
+        query = f"OR {term} {query}"
+    return query
+
+
+def unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return value
+
+
+def parse_list_response(line):
+    if isinstance(line, tuple):
+        # Literal folder names come back as (prefix, literal) pairs
+        literal = line[1].replace(b"\\", b"\\\\").replace(b'"', b'\\"')
+        line = re.sub(rb"\{\d+\}$", b"", line[0]) + b'"' + literal + b'"'
+    match = LIST_RESPONSE.match(line.decode("utf-8", errors="replace"))
+    if not match:
+        return None
+    flags = {flag.lower() for flag in match.group("flags").split()}
+    return flags, unquote(match.group("name").strip())
+
+
+def list_folders(mail):
+    result, data = mail.list()
+    if result != 'OK':
+        return []
+    folders = []
+    for line in data:
+        if not line:
+            continue
+        parsed = parse_list_response(line)
+        if parsed and "\\noselect" not in parsed[0] and "\\nonexistent" not in parsed[0]:
+            folders.append(parsed)
+    return folders
+
+
+def find_special_folders(mail, folders=None):
+    if folders is None:
+        folders = list_folders(mail)
+    special = {}
+    for flags, name in folders:
+        for flag in SPECIAL_USE_FALLBACKS:
+            if flag.lower() in flags and flag not in special:
+                special[flag] = name
+
+    names = {name.lower(): name for _, name in folders}
+    for flag, candidates in SPECIAL_USE_FALLBACKS.items():
+        if flag in special:
+            continue
+        for candidate in candidates:
+            if candidate.lower() in names:
+                special[flag] = names[candidate.lower()]
+                break
+    return special
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def uid_set(uids):
+    # Collapse UIDs into an IMAP sequence set such as "1:5,8,10:12"
+    numbers = sorted(int(uid) for uid in uids)
+    if not numbers:
+        return ""
+    ranges = []
+    start = end = numbers[0]
+    for number in numbers[1:]:
+        if number == end + 1:
+            end = number
+            continue
+        if number != end:
+            ranges.append(f"{start}:{end}" if start != end else str(start))
+            start = end = number
+    ranges.append(f"{start}:{end}" if start != end else str(start))
+    return ",".join(ranges)
+
+
+def parse_uid_set(message_set):
+    # Inverse of uid_set, for sets the server sends back such as COPYUID results
+    uids = []
+    for part in message_set.split(","):
+        start, _, end = part.partition(":")
+        if end:
+            low, high = sorted((int(start), int(end)))
+            uids.extend(range(low, high + 1))
+        elif start:
+            uids.append(int(start))
+    return uids
+
+
+def _fetch_entry(meta, literals):
+    match = UID_PATTERN.search(meta)
+    return (int(match.group(1)) if match else None), meta, literals
+
+
+def iter_fetch_groups(data):
+    # Regroup imaplib FETCH data into the raw items of each message response.
+    # imaplib splits a response around each literal, trailers start with b' ' or b')'.
+    group = []
+    for item in data:
+        if isinstance(item, tuple):
+            if group and item[0][:1] != b' ':
+                yield group
+                group = []
+            group.append(item)
+        elif not item:
+            continue
+        elif group and item[:1] in (b' ', b')'):
+            group.append(item)
+            yield group
+            group = []
+        else:
+            if group:
+                yield group
+                group = []
+            yield [item]
+    if group:
+        yield group
+
+
+def iter_fetch_responses(data):
+    # (UID, attribute bytes, literals) per message
+    for group in iter_fetch_groups(data):
+        meta = b"".join(part[0] if isinstance(part, tuple) else part for part in group)
+        yield _fetch_entry(meta, [part[1] for part in group if isinstance(part, tuple)])
+
+
+def iter_fetch_items(data):
+    # Yield (UID, literal) pairs from a UID FETCH response with one literal per message
+    for uid, _, literals in iter_fetch_responses(data):
+        if uid is not None and literals:
+            yield uid, literals[0]
+
+
+def fetch_number(meta, name):
+    match = re.search(re.escape(name.encode()) + rb" (\d+)", meta)
+    return int(match.group(1)) if match else None
+
+
+def fetch_internaldate(meta):
+    date_tuple = imaplib.Internaldate2tuple(meta)
+    return time.mktime(date_tuple) if date_tuple else 0.0
+
+
+def selected_uid_next(mail):
+    # SELECT leaves UIDNEXT in the untagged responses, fall back to the UID of the last message
+    result, data = mail.response('UIDNEXT')
+    if data and data[0]:
+        return int(data[0])
+    result, data = mail.uid('FETCH', '*', '(UID)')
+    for uid, _, _ in iter_fetch_responses(data if result == 'OK' else []):
+        if uid is not None:
+            return uid + 1
+    return 1
+
+
+def selected_uidvalidity(mail):
+    # Read before the next SELECT, which would add another UIDVALIDITY response
+    result, data = mail.response('UIDVALIDITY')
+    if data and data[-1]:
+        return int(data[-1])
+    return None
+
+
+def mailbox_status(mail, folder, items=("UIDVALIDITY", "UIDNEXT", "MESSAGES")):
+    # STATUS reads counters without selecting the folder
+    result, data = mail.status(quote_mailbox(folder), f"({' '.join(items)})")
+    if result != 'OK' or not data or not data[0]:
+        return {}
+    line = data[0] if isinstance(data[0], bytes) else data[0][0]
+    return {item: fetch_number(line, item) for item in items}
+
+
+def count_messages(mail, criteria, fallback):
+    # ESEARCH returns just the count instead of every matching UID
+    if 'ESEARCH' not in mail.capabilities:
+        return fallback
+    result, _ = mail.uid('SEARCH', 'RETURN (COUNT)', criteria)
+    if result == 'OK':
+        # imaplib files ESEARCH replies under their own response name
+        _, data = mail.response('ESEARCH')
+        for line in data:
+            count = fetch_number(line or b"", "COUNT")
+            if count is not None:
+                return count
+    return fallback
+
+
+def iter_uid_windows(mail, criteria, window=UID_WINDOW_SIZE, uid_next=None, uid_start=1):
+    # UID SEARCH one UID range at a time, so no single response lists the whole mailbox
+    if uid_next is None:
+        uid_next = selected_uid_next(mail)
+    for start in range(uid_start, uid_next, window):
+        end = min(start + window, uid_next) - 1
+        result, data = mail.uid('SEARCH', None, f"UID {start}:{end} {criteria}")
+        if result == 'OK' and data[0]:
+            yield data[0].split()
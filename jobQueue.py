@@ -0,0 +1,175 @@
+import datetime
+import itertools
+import threading
+import time
+
+# Lower runs first
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+ARCHIVE = "archive"
+DELETE_DRAFTS = "delete_drafts"
+COLLECT_SENDERS = "collect_senders"
+UNSUBSCRIBE = "unsubscribe"
+ESTIMATE = "estimate"
+ANALYZE = "analyze"
+READ_ONLY_KINDS = {COLLECT_SENDERS, ESTIMATE, ANALYZE}  # Kinds that may run next to another job on the same account
+
+HOURLY = 3600
+NIGHTLY_HOUR = 2          # Local hour nightly jobs run at
+MAX_CONCURRENT_JOBS = 2   # Worker threads, each with its own connection
+JOB_HISTORY = 200         # Finished jobs kept for the job list
+SCHEDULER_INTERVAL = 30 * 1000  # Milliseconds between checks for due recurring jobs
+
+REPEAT_ONCE = "Once"
+REPEAT_HOURLY = "Hourly"
+REPEAT_NIGHTLY = "Nightly"
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, account, params=None, priority=NORMAL, recurring=None):
+        self.id = next(Job._ids)
+        self.kind = kind
+        self.account = account  # (imap_server, imap_port, username, password)
+        self.params = params or {}
+        self.priority = priority
+        self.recurring = recurring
+        self.status = QUEUED
+        self.summary = ""
+        self.result = None  # Anything the job hands back for the UI to follow up on
+        self.cancel_event = False
+
+    def cancel(self):
+        self.cancel_event = True
+
+    def cancelled(self):
+        return self.cancel_event
+
+    def describe(self):
+        label = f"#{self.id} {self.kind.replace('_', ' ')}"
+        if self.recurring:
+            label += f" ({self.recurring.name})"
+        text = f"{label}: {self.status}"
+        summary = self.summary.strip().splitlines()
+        return f"{text} - {summary[0]}" if summary else text
+
+
+def next_nightly(now=None, hour=NIGHTLY_HOUR):
+    now = datetime.datetime.fromtimestamp(now or time.time())
+    run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run <= now:
+        run += datetime.timedelta(days=1)
+    return run.timestamp()
+
+
+class RecurringJob:
+    def __init__(self, kind, account, params=None, interval=HOURLY, first_run=None, priority=LOW, name=None):
+        self.kind = kind
+        self.account = account
+        self.params = params or {}
+        self.interval = interval
+        self.next_run = first_run or time.time() + interval
+        self.priority = priority
+        self.name = name or f"every {interval // 60} min"
+        self.last_job = None
+
+    def due(self, now):
+        # Never stack a run on top of one that is still queued or running
+        busy = self.last_job is not None and self.last_job.status in (QUEUED, RUNNING)
+        return now >= self.next_run and not busy
+
+    def make_job(self, now):
+        while self.next_run <= now:
+            self.next_run += self.interval
+        self.last_job = Job(self.kind, self.account, dict(self.params), self.priority, self)
+        return self.last_job
+
+
+class JobQueue:
+    # Priority queue shared by the worker threads. Equal priorities run first in,
+    # first out, and at most one job that changes a mailbox runs per account.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.order = itertools.count()
+        self.pending = []  # (priority, order, job)
+        self.jobs = {}
+        self.writers = set()  # Accounts with a mailbox-changing job running
+        self.recurring = []
+        self.closed = False
+
+    def submit(self, job):
+        with self.condition:
+            self.pending.append((job.priority, next(self.order), job))
+            self.jobs[job.id] = job
+            self.condition.notify_all()
+        return job
+
+    def runnable(self, job):
+        return job.kind in READ_ONLY_KINDS or job.account not in self.writers
+
+    def take(self, timeout=None):
+        # Blocks until a job can run, returns None once the queue is closed
+        with self.condition:
+            while not self.closed:
+                self.pending = [entry for entry in self.pending if entry[2].status == QUEUED]
+                for entry in sorted(self.pending, key=lambda entry: entry[:2]):
+                    job = entry[2]
+                    if self.runnable(job):
+                        self.pending.remove(entry)
+                        job.status = RUNNING
+                        if job.kind not in READ_ONLY_KINDS:
+                            self.writers.add(job.account)
+                        return job
+                if not self.condition.wait(timeout) and timeout is not None:
+                    return None
+            return None
+
+    def finish(self, job, status):
+        with self.condition:
+            job.status = status
+            if job.kind not in READ_ONLY_KINDS:
+                self.writers.discard(job.account)
+            finished = [job_id for job_id, known in self.jobs.items() if known.status not in (QUEUED, RUNNING)]
+            for job_id in finished[:-JOB_HISTORY]:
+                del self.jobs[job_id]
+            self.condition.notify_all()
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel()
+            if job.status == QUEUED:
+                job.status = CANCELLED
+            return job
+
+    def cancel_all(self):
+        with self.condition:
+            self.recurring = []
+            for job_id in list(self.jobs):
+                self.cancel(job_id)
+
+    def add_recurring(self, recurring):
+        with self.condition:
+            self.recurring.append(recurring)
+
+    def submit_due(self, now=None):
+        now = now or time.time()
+        with self.condition:
+            due = [recurring.make_job(now) for recurring in self.recurring if recurring.due(now)]
+        return [self.submit(job) for job in due]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
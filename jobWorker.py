@@ -0,0 +1,157 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from analytics import analyze_mailbox
+from cleanupJobs import CleanupJob, DRAFTS, run_cleanup_jobs
+from estimator import estimate_matches
+from folderScan import archive_folders, discover_folders, folder_statuses, run_per_folder
+from imapUtils import days_ago
+from jobQueue import ANALYZE, ARCHIVE, CANCELLED, COLLECT_SENDERS, DELETE_DRAFTS, DONE, ESTIMATE, FAILED, UNSUBSCRIBE
+from matcher import MessageMatcher
+from metadataRules import parse_metadata_rules
+from pipeline import archive_mailbox
+from progress import ProgressGroup, ProgressTracker
+from senderCache import SenderSnapshot, load_snapshot, save_snapshot
+from senderModel import SenderCollector
+from senderScan import scan_senders
+from unsubscriber import SmtpMailer, UnsubscribePool, mailto_address, send_mailto_unsubscribes, unsubscribe_senders
+
+
+def execute_job(mail, job, log, progress, on_senders, on_senders_reset, connections=None):
+    # Runs one job on a logged-in connection and returns its summary. connections (a
+    # ConnectionPool) lets all-folder jobs scan several folders at once.
+    params = job.params
+    if job.kind == ARCHIVE:
+        # Recurring runs look back the same number of days each time
+        matcher = MessageMatcher(params.get("keywords", []), params.get("senders", []))
+        metadata_rules = parse_metadata_rules(params.get("metadata_rules", ""))
+        archive_date = days_ago(params.get("days", 7))
+        if params.get("all_folders"):
+            summary = archive_folders(mail, connections, job.account, matcher, archive_date, log, job.cancelled,
+                                      progress, metadata_rules)
+        else:
+            summary = archive_mailbox(mail, matcher, archive_date, log, job.cancelled, progress=progress,
+                                      metadata_rules=metadata_rules)
+        return summary.format() if summary else ""
+
+    if job.kind == ESTIMATE:
+        matcher = MessageMatcher(params.get("keywords", []), params.get("senders", []))
+        estimate = estimate_matches(mail, matcher, days_ago(params.get("days", 7)), log, job.cancelled)
+        return estimate.format() if estimate else ""
+
+    if job.kind == ANALYZE:
+        analytics = analyze_mailbox(mail, log, job.cancelled, params.get("folder", "INBOX"), progress,
+                                    parse_metadata_rules(params.get("metadata_rules", "")))
+        if analytics is None:
+            return ""
+        # Sizes go to the sender table, sorting it by size gives the largest offenders to select
+        on_senders_reset()
+        on_senders(analytics.sender_rows())
+        return analytics.format()
+
+    if job.kind == DELETE_DRAFTS:
+        results = run_cleanup_jobs(mail, [CleanupJob(DRAFTS)], log, job.cancelled, progress)
+        return f"Total drafts deleted: {sum(results.values())}\n"
+
+    if job.kind == COLLECT_SENDERS:
+        return collect_senders(mail, job, log, progress, on_senders, on_senders_reset, connections)
+
+    if job.kind == UNSUBSCRIBE:
+        if "mailto" in params:
+            # Unsubscribe emails the user confirmed, sent through the SMTP server of the profile
+            _, _, username, password = job.account
+            mailer = SmtpMailer(params["smtp_server"], int(params["smtp_port"]), username, password)
+            results = send_mailto_unsubscribes(params["mailto"], UnsubscribePool(mailer=mailer), log)
+            sent = sum(1 for _, _, ok, _ in results if ok)
+            return f"Unsubscribe emails sent: {sent} of {len(results)}.\n"
+        mail.select("inbox")
+        results, mailto = unsubscribe_senders(mail, params.get("senders", []), UnsubscribePool(), log, job.cancelled)
+        unsubscribed = sum(1 for _, _, ok, _ in results if ok)
+        summary = f"Unsubscribing completed: {unsubscribed} of {len(results)} senders unsubscribed.\n"
+        if mailto:
+            # Handed back to the UI, which asks before anything is emailed
+            job.result = mailto
+            addresses = ", ".join(sorted({mailto_address(link) for _, link in mailto}))
+            summary += f"{len(mailto)} senders only offer unsubscribing by email, to: {addresses}\n"
+        return summary
+
+    raise ValueError(f"Unknown job kind: {job.kind}")
+
+
+def collect_senders(mail, job, log, progress, on_senders, on_senders_reset, connections=None):
+    # A refresh continues the saved snapshot from each folder's UID high-water mark, anything
+    # else (or a snapshot the server has invalidated) is a full scan from scratch
+    snapshot = load_snapshot(job.account) if job.params.get("refresh") else None
+    # A refresh covers the folders the snapshot was collected from
+    all_folders = job.params.get("all_folders") or (snapshot is not None and len(snapshot.folders) > 1)
+    folders = discover_folders(mail) if all_folders else ["INBOX"]
+    statuses = folder_statuses(mail, folders)
+    if snapshot and not snapshot.matches(statuses):
+        log("Sender cache is out of date, collecting all senders again.\n")
+        snapshot = None
+    if snapshot is None:
+        on_senders_reset()
+        snapshot = SenderSnapshot(days_ago(job.params.get("days", 7)))
+
+    # Folders whose UIDNEXT has not moved past the high-water mark have nothing new to count
+    changed = [folder for folder in folders
+               if statuses[folder].get("UIDNEXT") is None or statuses[folder]["UIDNEXT"] > snapshot.uid_start(folder)]
+    collector = SenderCollector(senders=snapshot.senders)
+    group = ProgressGroup(progress)
+
+    def scan(folder_mail, folder):
+        return scan_senders(folder_mail, snapshot.since, collector, on_senders, log, job.cancelled, group.part(),
+                            snapshot.uid_start(folder), folder)
+
+    results = run_per_folder(mail, connections, job.account, changed, scan, log)
+    progress.finish()
+    if not all(results.values()):
+        return "Collecting senders did not complete.\n"
+    for folder, scanned in results.items():
+        snapshot.folders[folder] = list(scanned)
+    save_snapshot(job.account, snapshot)
+    return f"Senders collected: {len(collector.senders)}\n"
+
+
+class JobWorker(QThread):
+    log_signal = pyqtSignal(str)
+    senders_signal = pyqtSignal(list)  # Signal to send batches of (sender, count, size, last_seen) rows
+    senders_reset_signal = pyqtSignal()  # A full sender scan is starting, drop the current rows
+    progress_signal = pyqtSignal('qint64', 'qint64', 'qint64', float)  # done, total, bytes, messages per second
+    job_signal = pyqtSignal(int)  # Id of a job whose status changed
+
+    def __init__(self, job_queue, connections):
+        super().__init__()
+        self.job_queue = job_queue
+        self.connections = connections
+
+    def run(self):
+        while True:
+            job = self.job_queue.take()
+            if job is None:
+                break
+            self.run_job(job)
+
+    def run_job(self, job):
+        self.job_signal.emit(job.id)
+
+        def log(message):
+            self.log_signal.emit(f"[#{job.id}] {message}")
+
+        mail = None
+        status = FAILED
+        try:
+            mail = self.connections.acquire(job.account)
+            job.summary = execute_job(mail, job, log, ProgressTracker(self.progress_signal.emit),
+                                      self.senders_signal.emit, self.senders_reset_signal.emit, self.connections)
+            if job.summary:
+                log(job.summary)
+            status = CANCELLED if job.cancelled() else DONE
+        except Exception as e:
+            log(f"Exception occurred: {str(e)}\n")
+            job.summary = str(e)
+        finally:
+            if mail is not None:
+                # A failed job may have left the connection mid-command, don't hand it on
+                self.connections.release(job.account, mail, status != FAILED)
+            self.job_queue.finish(job, status)
+            self.job_signal.emit(job.id)
@@ -0,0 +1,203 @@
+import copy
+import datetime
+import email
+import glob
+import json
+import os
+import threading
+
+from imapUtils import (chunked, fetch_number, gmail_label, iter_fetch_responses, or_criteria, parse_uid_set,
+                       quote_mailbox, selected_uidvalidity, uid_set)
+
+JOURNAL_DIR = "journals"
+JOURNAL_FETCH_CHUNK = 5000   # UIDs per identity fetch while journaling
+RESTORE_CHUNK_SIZE = 5000    # UIDs per UID MOVE / UID STORE while restoring
+RESTORE_SEARCH_CHUNK = 100   # Identifiers per OR search when a message has to be looked up
+
+# What an action did to a message, which decides how it is restored
+MOVE = "move"        # Moved (or copied and expunged) into the target folder, restored by moving it back
+UNLABEL = "unlabel"  # Gmail \Inbox (or folder) label removed, restored by adding it again in All Mail
+DELETE = "delete"    # Flagged \Deleted and expunged, nothing is left on the server to restore
+
+
+def new_journal_path(directory=JOURNAL_DIR):
+    return os.path.join(directory, datetime.datetime.now().strftime("archive-%Y%m%d-%H%M%S.jsonl"))
+
+
+def latest_journal(directory=JOURNAL_DIR):
+    paths = glob.glob(os.path.join(directory, "archive-*.jsonl"))
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def fetch_identities(mail, uids, gmail):
+    # UID -> (X-GM-MSGID, Message-ID), the identifiers that survive a move between folders
+    query = "(UID X-GM-MSGID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])" if gmail else \
+        "(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])"
+    identities = {}
+    for chunk in chunked(uids, JOURNAL_FETCH_CHUNK):
+        result, data = mail.uid('FETCH', uid_set(chunk), query)
+        if result != 'OK':
+            continue
+        for uid, meta, literals in iter_fetch_responses(data):
+            if uid is None:
+                continue
+            message_id = email.message_from_bytes(literals[0]).get("Message-ID") if literals else None
+            identities[uid] = (fetch_number(meta, "X-GM-MSGID"), message_id.strip() if message_id else None)
+    return identities
+
+
+class ActionJournal:
+    # Append-only JSON lines. Each batch is written and fsynced before the action touches
+    # it, so even a run that dies half way leaves a record of everything it may have changed.
+    def __init__(self, path=None):
+        self.path = path or new_journal_path()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.folder = None
+        self.uidvalidity = None
+
+    def start(self, mail, folder):
+        # Call right after selecting the folder the run acts on
+        self.folder = folder
+        self.uidvalidity = selected_uidvalidity(mail)
+
+    def for_folder(self, mail, folder):
+        # A journal for one folder of a multi-folder run: same file and lock, its own folder
+        # and UIDVALIDITY. Close only the journal it came from.
+        journal = copy.copy(self)
+        journal.start(mail, folder)
+        return journal
+
+    def record(self, mail, rules, action, target=None):
+        # rules maps every affected UID to the rule that matched it (or its conversation)
+        identities = fetch_identities(mail, list(rules), 'X-GM-EXT-1' in mail.capabilities)
+        entries = []
+        for uid, rule in rules.items():
+            gm_msgid, message_id = identities.get(uid, (None, None))
+            entries.append({"uid": int(uid), "uidvalidity": self.uidvalidity, "gm_msgid": gm_msgid,
+                            "message_id": message_id, "action": action, "rule": rule,
+                            "folder": self.folder, "target": target})
+        self._write(entries)
+
+    def record_copyuid(self, mail, target):
+        # UIDPLUS servers report where MOVE put each message, which lets restore skip searching
+        _, data = mail.response('COPYUID')
+        entries = []
+        for line in data or []:
+            parts = line.decode(errors="replace").split() if line else []
+            if len(parts) == 3:
+                entries.append({"kind": "copyuid", "folder": self.folder, "target": target,
+                                "uidvalidity": int(parts[0]), "source": parts[1], "target_uids": parts[2]})
+        if entries:
+            self._write(entries)
+
+    def _write(self, entries):
+        lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+        with self.lock:
+            self.file.write(lines)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def read_journal(path):
+    entries = []
+    copied = {}  # (target folder, source folder, source UID) -> (target UIDVALIDITY, target UID)
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # A torn last line from an interrupted run
+            if entry.get("kind") == "copyuid":
+                pairs = zip(parse_uid_set(entry["source"]), parse_uid_set(entry["target_uids"]))
+                for source, target in pairs:
+                    # Journals from before multi-folder runs have no source folder, the inbox was the only one
+                    copied[(entry["target"], entry.get("folder", "INBOX"), source)] = (entry["uidvalidity"], target)
+            else:
+                entries.append(entry)
+    return entries, copied
+
+
+def locate_messages(mail, entries, cancelled=lambda: False):
+    # Fallback for messages without a COPYUID record: search the target folder by identifier
+    gm_msgids = [str(entry["gm_msgid"]) for entry in entries if entry.get("gm_msgid")]
+    message_ids = [entry["message_id"] for entry in entries if not entry.get("gm_msgid") and entry.get("message_id")]
+    searches = [(chunk, "X-GM-MSGID", False) for chunk in chunked(gm_msgids, RESTORE_SEARCH_CHUNK)]
+    searches += [(chunk, "HEADER Message-ID", True) for chunk in chunked(message_ids, RESTORE_SEARCH_CHUNK)]
+
+    uids = set()
+    for chunk, key, quote in searches:
+        if cancelled():
+            break
+        result, data = mail.uid('SEARCH', None, or_criteria(key, chunk, quote))
+        if result == 'OK' and data[0]:
+            uids.update(int(uid) for uid in data[0].split())
+    return uids
+
+
+def restore_uids(mail, uids, action, folder, cancelled=lambda: False):
+    # Undo one group in bulk: UIDs are in the selected target folder, folder is where they came from
+    restored = 0
+    copied = False
+    for chunk in chunked(sorted(uids), RESTORE_CHUNK_SIZE):
+        if cancelled():
+            break
+        message_set = uid_set(chunk)
+        if action == UNLABEL:
+            mail.uid('STORE', message_set, '+X-GM-LABELS', f"({gmail_label(folder)})")
+        elif 'MOVE' in mail.capabilities:
+            mail.uid('MOVE', message_set, quote_mailbox(folder))
+        else:
+            mail.uid('COPY', message_set, quote_mailbox(folder))
+            mail.uid('STORE', message_set, '+FLAGS.SILENT', '(\\Deleted)')
+            # Only the copied messages, not whatever else is flagged \Deleted in the folder
+            if 'UIDPLUS' in mail.capabilities:
+                mail.uid('EXPUNGE', message_set)
+            else:
+                copied = True
+        restored += len(chunk)
+    if copied:
+        mail.expunge()
+    return restored
+
+
+def restore_journal(mail, path, log, cancelled=lambda: False):
+    entries, copied = read_journal(path)
+    # Replay newest first, grouped so every (action, target) pair is undone in bulk
+    groups = {}
+    for entry in reversed(entries):
+        groups.setdefault((entry["action"], entry["target"], entry["folder"]), {})[entry["uid"]] = entry
+
+    restored = 0
+    for (action, target, folder), group in groups.items():
+        if cancelled():
+            log("Restore cancelled.\n")
+            break
+        if action == DELETE or not target:
+            log(f"{len(group)} messages were expunged from {folder} and cannot be restored.\n")
+            continue
+        result, _ = mail.select(quote_mailbox(target))
+        if result != 'OK':
+            log(f"Could not select {target}!\n")
+            continue
+
+        uidvalidity = selected_uidvalidity(mail)
+        uids = set()
+        missing = []
+        for uid, entry in group.items():
+            known = copied.get((target, folder, uid))
+            if known and known[0] == uidvalidity:
+                uids.add(known[1])
+            else:
+                missing.append(entry)
+        uids.update(locate_messages(mail, missing, cancelled))
+        if len(uids) < len(group):
+            log(f"{len(group) - len(uids)} messages from {target} could not be found.\n")
+        count = restore_uids(mail, uids, action, folder, cancelled)
+        log(f"Restored {count} messages from {target} to {folder}.\n")
+        restored += count
+    return restored
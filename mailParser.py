@@ -0,0 +1,97 @@
+import email
+from email.header import decode_header
+
+from htmlText import HTML_BYTE_CAP, scan_html
+from matcher import is_ascii_compatible
+
+SNIPPET_LENGTH = 200
+SNIPPET_BYTES = SNIPPET_LENGTH * 4  # Enough bytes for SNIPPET_LENGTH characters in any charset
+
+
+def decode_payload(payload, charset):
+    # Pure ASCII decodes the same under every ASCII-compatible charset, take the fast path
+    if payload.isascii() and is_ascii_compatible(charset):
+        return payload.decode('ascii')
+    try:
+        return payload.decode(charset, errors='ignore')
+    except LookupError:
+        return payload.decode('latin-1', errors='ignore')
+
+
+def part_charset(part):
+    return part.get_content_charset() or 'utf-8'  # default to utf-8 if charset is not specified
+
+
+def decode_email_content(part):
+    return decode_payload(part.get_payload(decode=True), part_charset(part))
+
+
+def decode_subject(msg):
+    subject = msg.get("Subject")
+    if subject is None:
+        return ""
+    decoded = []
+    for value, encoding in decode_header(subject):
+        if isinstance(value, bytes):
+            try:
+                value = value.decode(encoding or "utf-8", errors="replace")
+            except LookupError:
+                value = value.decode("latin-1", errors="replace")
+        decoded.append(value)
+    return "".join(decoded)
+
+
+def body_parts(msg):
+    if not msg.is_multipart():
+        return [msg]
+    plain = [part for part in msg.walk() if part.get_content_type() == "text/plain"]
+    # HTML-only messages are matched on the text extracted from their HTML parts
+    return plain or [part for part in msg.walk() if part.get_content_type() == "text/html"]
+
+
+def normalize_snippet(text):
+    return " ".join(text[:SNIPPET_LENGTH * 2].split())[:SNIPPET_LENGTH]
+
+
+class ParsedMessage:
+    # Compact scan result, small enough to ship back from a worker process
+    __slots__ = ("uid", "subject", "sender", "size", "subject_keyword", "body_keyword", "snippet")
+
+    def __init__(self, uid, subject, sender, size, subject_keyword=None, body_keyword=None, snippet=""):
+        self.uid = uid
+        self.subject = subject
+        self.sender = sender
+        self.size = size
+        self.subject_keyword = subject_keyword
+        self.body_keyword = body_keyword
+        self.snippet = snippet
+
+
+def scan_message(uid, raw, scanner):
+    msg = email.message_from_bytes(raw)
+    subject = decode_subject(msg)
+    parsed = ParsedMessage(uid, subject, msg.get("From"), len(raw), scanner.find_in_text(subject))
+    if parsed.subject_keyword:
+        # The subject already decides the match, skip the body
+        return parsed
+
+    for part in body_parts(msg):
+        # Transfer-decode each payload once and hand the bytes straight to the scanner
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            continue
+        charset = part_charset(part)
+        if part.get_content_type() == "text/html":
+            html = decode_payload(payload[:HTML_BYTE_CAP], charset)
+            parsed.body_keyword, text = scan_html(html, scanner, msg.get("Message-ID"), len(payload) <= HTML_BYTE_CAP)
+            if not parsed.snippet:
+                parsed.snippet = text[:SNIPPET_LENGTH]
+            if parsed.body_keyword:
+                break
+            continue
+        if not parsed.snippet:
+            parsed.snippet = normalize_snippet(decode_payload(payload[:SNIPPET_BYTES], charset))
+        parsed.body_keyword = scanner.find_in_payload(payload, charset, decode_payload)
+        if parsed.body_keyword:
+            break
+    return parsed
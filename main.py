@@ -1,259 +1,33 @@
 import sys
-import imaplib
-import email
-from email.header import decode_header
-import datetime
-import json
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, QComboBox, QDateEdit,
-                             QTextEdit, QMessageBox, QInputDialog, QListWidget)
+                             QTextEdit, QMessageBox, QInputDialog, QTableView, QAbstractItemView,
+                             QHeaderView, QProgressBar, QListWidget, QListWidgetItem, QCheckBox)
 from PyQt5.QtGui import QFont, QColor, QPalette
-from PyQt5.QtCore import Qt, QDate, QThread, pyqtSignal
-
-CONFIG_FILE = "configurations.json"
-
-def decode_email_content(part):
-    try:
-        charset = part.get_content_charset()
-        if not charset:
-            charset = 'utf-8'  # default to utf-8 if charset is not specified
-        return part.get_payload(decode=True).decode(charset, errors='ignore')
-    except UnicodeDecodeError:
-        return part.get_payload(decode=True).decode('latin-1', errors='ignore')
-
-class ArchiverThread(QThread):
-    log_signal = pyqtSignal(str)
-    finished_signal = pyqtSignal()
-    senders_signal = pyqtSignal(list)  # Signal to send list of senders
-
-    def __init__(self, imap_server, imap_port, username, password, keywords, archive_date, action):
-        super().__init__()
-        self.imap_server = imap_server
-        self.imap_port = imap_port
-        self.username = username
-        self.password = password
-        self.keywords = keywords
-        self.archive_date = archive_date
-        self.action = action
-        self.cancel_event = False
-        self.selected_senders = []  # Initialize selected_senders
-
-    def run(self):
-        try:
-            # Connect to the server
-            mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            # Login to your account
-            mail.login(self.username, self.password)
-
-            if self.action == "archive":
-                self.archive_emails(mail)
-            elif self.action == "delete_drafts":
-                self.delete_draft_emails(mail)
-            elif self.action == "collect_senders":
-                self.collect_senders(mail)
-
-            # Logout
-            mail.logout()
-        except Exception as e:
-            self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-        self.finished_signal.emit()
-
-    def archive_emails(self, mail):
-        try:
-            # Select the inbox
-            mail.select("inbox")
-
-            # Search for emails from the given date
-            result, data = mail.search(None, f'(SINCE "{self.archive_date.strftime("%d-%b-%Y")}")')
-
-            if result != 'OK':
-                self.log_signal.emit("No messages found!\n")
-                return
-
-            deleted_emails = 0
-            matched_keywords = {}
-
-            # Iterate through the emails
-            for num in data[0].split():
-                if self.cancel_event:
-                    self.log_signal.emit("Archiving cancelled.\n")
-                    break
-
-                try:
-                    result, msg_data = mail.fetch(num, "(RFC822)")
-                    if result != 'OK':
-                        self.log_signal.emit(f"ERROR getting message {num}\n")
-                        continue
-
-                    msg = email.message_from_bytes(msg_data[0][1])
-
-                    # Decode the email subject
-                    subject, encoding = decode_header(msg["Subject"])[0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode(encoding if encoding else "utf-8")
-
-                    matched = False
-
-                    # Log subject for debugging
-                    self.log_signal.emit(f"Subject: {subject}\n")
-
-                    # Check if any keyword is in the email subject
-                    for keyword in self.keywords:
-                        if keyword.lower().strip() in subject.lower():
-                            matched_keywords[keyword] = matched_keywords.get(keyword, 0) + 1
-                            matched = True
-                            break
-
-                    # Check if the sender is in the selected senders list
-                    sender = msg.get("From")
-                    if sender and any(s.lower().strip() in sender.lower() for s in self.selected_senders):
-                        matched = True
-
-                    if matched:
-                        self.log_signal.emit(f"Matched keyword in subject: {subject}\n")
-                        mail.store(num, '+X-GM-LABELS', '\\Archive')
-                        mail.store(num, '+FLAGS', '\\Deleted')
-                        deleted_emails += 1
-                        continue
-
-                    # Check if any keyword is in the email body
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            if part.get_content_type() == "text/plain":
-                                try:
-                                    body = decode_email_content(part)
-                                except Exception as e:
-                                    self.log_signal.emit(f"Error decoding body: {e}\n")
-                                    continue
-                                # Log body for debugging
-                                self.log_signal.emit(f"Body: {body[:100]}\n")  # Log the first 100 characters of the body
-
-                                for keyword in self.keywords:
-                                    if keyword.lower().strip() in body.lower():
-                                        matched_keywords[keyword] = matched_keywords.get(keyword, 0) + 1
-                                        matched = True
-                                        break
-                            if matched:
-                                self.log_signal.emit(f"Matched keyword in body: {subject}\n")
-                                mail.store(num, '+X-GM-LABELS', '\\Archive')
-                                mail.store(num, '+FLAGS', '\\Deleted')
-                                deleted_emails += 1
-                                break
-                    else:
-                        try:
-                            body = decode_email_content(msg)
-                        except Exception as e:
-                            self.log_signal.emit(f"Error decoding body: {e}\n")
-                            continue
-                        # Log body for debugging
-                        self.log_signal.emit(f"Body: {body[:100]}\n")  # Log the first 100 characters of the body
-
-                        for keyword in self.keywords:
-                            if keyword.lower().strip() in body.lower():
-                                matched_keywords[keyword] = matched_keywords.get(keyword, 0) + 1
-                                matched = True
-                                break
-                        if matched:
-                            self.log_signal.emit(f"Matched keyword in body: {subject}\n")
-                            mail.store(num, '+X-GM-LABELS', '\\Archive')
-                            mail.store(num, '+FLAGS', '\\Deleted')
-                            deleted_emails += 1
-
-                except Exception as e:
-                    self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-            # Expunge the emails marked for deletion
-            mail.expunge()
-
-            # Create a summary message
-            summary = f"Total emails archived: {deleted_emails}\n\n"
-            for keyword, count in matched_keywords.items():
-                summary += f"'{keyword}': {count} emails\n"
-
-            self.log_signal.emit(summary)
-        except Exception as e:
-            self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-    def delete_draft_emails(self, mail):
-        try:
-            # Select the Drafts mailbox
-            mail.select('"[Gmail]/Drafts"')
-
-            # Search for all draft emails
-            result, data = mail.search(None, "ALL")
-
-            if result != 'OK':
-                self.log_signal.emit("No draft messages found!\n")
-                return
-
-            deleted_emails = 0
-
-            # Iterate through the draft emails
-            for num in data[0].split():
-                if self.cancel_event:
-                    self.log_signal.emit("Deleting drafts cancelled.\n")
-                    break
-
-                try:
-                    mail.store(num, '+FLAGS', '\\Deleted')
-                    deleted_emails += 1
-
-                except Exception as e:
-                    self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-            # Expunge the emails marked for deletion
-            mail.expunge()
-
-            # Create a summary message
-            summary = f"Total drafts deleted: {deleted_emails}\n"
-            self.log_signal.emit(summary)
-        except Exception as e:
-            self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-    def collect_senders(self, mail):
-        try:
-            # Select the inbox
-            mail.select("inbox")
-
-            # Search for emails from the given date
-            result, data = mail.search(None, f'(SINCE "{self.archive_date.strftime("%d-%b-%Y")}")')
-
-            if result != 'OK':
-                self.log_signal.emit("No messages found!\n")
-                return
-
-            senders = set()
-
-            # Iterate through the emails
-            for num in data[0].split():
-                if self.cancel_event:
-                    self.log_signal.emit("Collecting senders cancelled.\n")
-                    break
-
-                try:
-                    result, msg_data = mail.fetch(num, "(RFC822)")
-                    if result != 'OK':
-                        self.log_signal.emit(f"ERROR getting message {num}\n")
-                        continue
-
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    sender = msg.get("From")
-                    if sender:
-                        senders.add(sender)
-
-                except Exception as e:
-                    self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-            self.senders_signal.emit(list(senders))
-        except Exception as e:
-            self.log_signal.emit(f"Exception occurred: {str(e)}\n")
-
-    def cancel(self):
-        self.cancel_event = True
+from PyQt5.QtCore import Qt, QDate, QTimer
+from senderModel import SenderTableModel, SenderFilterProxyModel, COUNT_COLUMN, SENDER_COLUMN, SIZE_COLUMN
+from configStore import ConfigStore
+from headless import run_headless
+from imapConnection import ConnectionPool
+from jobQueue import (ANALYZE, ARCHIVE, COLLECT_SENDERS, DELETE_DRAFTS, ESTIMATE, HIGH, HOURLY, LOW,
+                      MAX_CONCURRENT_JOBS, NORMAL, QUEUED, REPEAT_HOURLY, REPEAT_NIGHTLY, REPEAT_ONCE, RUNNING,
+                      SCHEDULER_INTERVAL, Job, JobQueue, RecurringJob, next_nightly)
+from jobWorker import JobWorker
+from metadataRules import parse_metadata_rules
+from progress import format_progress
+from senderCache import account_key, load_snapshot
 
 class EmailArchiverApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.config_store = ConfigStore()
+        self.job_queue = JobQueue()
+        self.connections = ConnectionPool()
+        self.job_items = {}  # Job id -> row in the job list
+        self.snapshot_key = None  # account_key of the profile whose senders are listed
         self.init_ui()
+        self.start_workers()
+        # Fill the sender list from the cache once the window is up, not before it
+        QTimer.singleShot(0, self.load_sender_snapshot)
 
     def init_ui(self):
         self.setWindowTitle("Email Archiver")
@@ -296,9 +70,40 @@ class EmailArchiverApp(QWidget):
         self.collect_senders_button.clicked.connect(self.collect_senders)
         left_layout.addWidget(self.collect_senders_button)
 
+        # Analyze Mailbox Size Button
+        self.analyze_button = QPushButton("Analyze Mailbox Size", self)
+        self.analyze_button.setToolTip("Total up sizes by sender, domain, month and attachments without downloading any email.")
+        self.analyze_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF; border-radius: 10px; padding: 10px;")
+        self.analyze_button.clicked.connect(self.analyze_mailbox)
+        left_layout.addWidget(self.analyze_button)
+
+        # Sender Filter
+        self.sender_filter_input = QLineEdit(self)
+        self.sender_filter_input.setPlaceholderText("Filter senders...")
+        self.sender_filter_input.setStyleSheet("color: #333333; border-radius: 10px; padding: 5px;")
+        left_layout.addWidget(self.sender_filter_input)
+
+        # Debounce the filter so typing stays responsive on large sender lists
+        self.sender_filter_timer = QTimer(self)
+        self.sender_filter_timer.setSingleShot(True)
+        self.sender_filter_timer.setInterval(150)
+        self.sender_filter_timer.timeout.connect(self.apply_sender_filter)
+        self.sender_filter_input.textChanged.connect(self.sender_filter_timer.start)
+
         # Sender List
-        self.sender_list = QListWidget(self)
-        self.sender_list.setSelectionMode(QListWidget.MultiSelection)
+        self.sender_model = SenderTableModel(self)
+        self.sender_proxy = SenderFilterProxyModel(self)
+        self.sender_proxy.setSourceModel(self.sender_model)
+        self.sender_list = QTableView(self)
+        self.sender_list.setModel(self.sender_proxy)
+        self.sender_list.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.sender_list.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.sender_list.setSortingEnabled(True)
+        self.sender_list.sortByColumn(COUNT_COLUMN, Qt.DescendingOrder)
+        self.sender_list.setWordWrap(False)
+        self.sender_list.verticalHeader().hide()
+        self.sender_list.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.sender_list.horizontalHeader().setSectionResizeMode(SENDER_COLUMN, QHeaderView.Stretch)
         self.sender_list.setStyleSheet("color: #333333; border-radius: 10px; padding: 5px;")
         left_layout.addWidget(self.sender_list)
 
@@ -308,17 +113,53 @@ class EmailArchiverApp(QWidget):
         self.archive_button.clicked.connect(self.start_archiving)
         left_layout.addWidget(self.archive_button)
 
+        # Estimate Matches Button
+        self.estimate_button = QPushButton("Estimate Matches", self)
+        self.estimate_button.setToolTip("Match a random sample of the selected range to preview how many emails the rules would archive.")
+        self.estimate_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF; border-radius: 10px; padding: 10px;")
+        self.estimate_button.clicked.connect(self.estimate_matches)
+        left_layout.addWidget(self.estimate_button)
+
         # Delete Draft Emails Button
         self.delete_drafts_button = QPushButton("Delete Draft Emails", self)
         self.delete_drafts_button.setStyleSheet("background-color: #dc3545; color: #FFFFFF; border-radius: 10px; padding: 10px;")
         self.delete_drafts_button.clicked.connect(self.delete_drafts)
         left_layout.addWidget(self.delete_drafts_button)
 
-        # Cancel Archiving Button
-        self.cancel_button = QPushButton("Cancel Archiving", self)
+        # Repeat Selector
+        repeat_layout = QHBoxLayout()
+        repeat_layout.addWidget(QLabel("Repeat:"))
+        self.repeat_dropdown = QComboBox(self)
+        self.repeat_dropdown.addItems([REPEAT_ONCE, REPEAT_HOURLY, REPEAT_NIGHTLY])
+        self.repeat_dropdown.setToolTip("Run the next job once, every hour, or every night at 2 AM.")
+        self.repeat_dropdown.setStyleSheet("color: #333333; border-radius: 10px; padding: 5px;")
+        repeat_layout.addWidget(self.repeat_dropdown, 1)
+        left_layout.addLayout(repeat_layout)
+
+        # Job List
+        self.job_list = QListWidget(self)
+        self.job_list.setMaximumHeight(120)
+        self.job_list.setStyleSheet("color: #333333; border-radius: 10px; padding: 5px;")
+        left_layout.addWidget(self.job_list)
+
+        # Cancel Buttons
+        cancel_layout = QHBoxLayout()
+        self.cancel_job_button = QPushButton("Cancel Selected Job", self)
+        self.cancel_job_button.setStyleSheet("background-color: #dc3545; color: #FFFFFF; border-radius: 10px; padding: 10px;")
+        self.cancel_job_button.clicked.connect(self.cancel_selected_job)
+        cancel_layout.addWidget(self.cancel_job_button)
+        self.cancel_button = QPushButton("Cancel All Jobs", self)
         self.cancel_button.setStyleSheet("background-color: #dc3545; color: #FFFFFF; border-radius: 10px; padding: 10px;")
         self.cancel_button.clicked.connect(self.cancel_archiving)
-        left_layout.addWidget(self.cancel_button)
+        cancel_layout.addWidget(self.cancel_button)
+        left_layout.addLayout(cancel_layout)
+
+        # Progress Display
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setStyleSheet("border-radius: 10px;")
+        left_layout.addWidget(self.progress_bar)
+        self.progress_label = QLabel("", self)
+        left_layout.addWidget(self.progress_label)
 
         # Log Display
         self.logs = QTextEdit(self)
@@ -384,6 +225,23 @@ class EmailArchiverApp(QWidget):
         keywords_layout.addWidget(self.keywords_input)
         right_layout.addLayout(keywords_layout)
 
+        # Size and attachment rules, answered by the server without downloading messages
+        rules_layout = QVBoxLayout()
+        self.rules_label = QLabel("Size / attachment rules (semicolon-separated):")
+        self.rules_label.setToolTip("Conditions in one rule must all hold: larger:10MB, attachment:pdf, older:365, "
+                                    "from:news@example.com. Rules without older: only cover emails since the archive date.")
+        self.rules_input = QLineEdit(self)
+        self.rules_input.setPlaceholderText("larger:10MB; attachment:pdf older:365; older:30 from:news@example.com")
+        self.rules_input.setStyleSheet("color: #333333; border-radius: 10px; padding: 5px;")
+        rules_layout.addWidget(self.rules_label)
+        rules_layout.addWidget(self.rules_input)
+        right_layout.addLayout(rules_layout)
+
+        # Scan labels and subfolders too, each unchanged folder is skipped
+        self.all_folders_checkbox = QCheckBox("Include all folders", self)
+        self.all_folders_checkbox.setToolTip("Archive from and collect senders in every folder except Sent, Drafts, Junk, Trash and the archive itself.\nOn Gmail, labels are not separate folders and only the inbox is used.")
+        right_layout.addWidget(self.all_folders_checkbox)
+
         # Archive Emails Since Date Picker
         date_layout = QVBoxLayout()
         self.date_label = QLabel("Archive Emails Since:")
@@ -442,124 +300,217 @@ class EmailArchiverApp(QWidget):
             if not ok or not config_name:
                 return
 
+        try:
+            parse_metadata_rules(self.rules_input.text())
+        except ValueError as e:
+            self.logs.append(f"{str(e)}\n")
+            return
+
         config = {
             "imap_server": self.imap_server_input.text(),
             "imap_port": self.imap_port_input.text(),
             "email": self.email_input.text(),
             "app_password": self.password_input.text(),
-            "keywords": self.keywords_input.text()
+            "keywords": self.keywords_input.text(),
+            "metadata_rules": self.rules_input.text(),
+            # Keep the previously saved senders when none are selected in the list
+            "senders": self.selected_senders() or self.config_store.get(config_name).get("senders", [])
         }
 
-        try:
-            with open(CONFIG_FILE, 'r') as file:
-                configurations = json.load(file)
-        except FileNotFoundError:
-            configurations = {}
-
-        configurations[config_name] = config
-        with open(CONFIG_FILE, 'w') as file:
-            json.dump(configurations, file, indent=4)
-        self.update_config_dropdown()
+        self.config_store.save(config_name, config)
+        self.update_config_dropdown(config_name)
 
     def load_configuration(self):
         config_name = self.config_dropdown.currentText()
         if config_name:
-            with open(CONFIG_FILE, 'r') as file:
-                configurations = json.load(file)
-            config = configurations.get(config_name, {})
+            config = self.config_store.get(config_name)
             self.imap_server_input.setText(config.get("imap_server", ""))
             self.imap_port_input.setText(config.get("imap_port", ""))
             self.email_input.setText(config.get("email", ""))
             self.password_input.setText(config.get("app_password", ""))
             self.keywords_input.setText(config.get("keywords", ""))
+            self.rules_input.setText(config.get("metadata_rules", ""))
+            # Another account's senders, once the event loop is free
+            QTimer.singleShot(0, self.load_sender_snapshot)
 
-    def update_config_dropdown(self):
+    def update_config_dropdown(self, selected_name=None):
+        # Repopulate without firing load_configuration for every inserted item
+        self.config_dropdown.blockSignals(True)
         self.config_dropdown.clear()
-        try:
-            with open(CONFIG_FILE, 'r') as file:
-                configurations = json.load(file)
-            self.config_dropdown.addItems(configurations.keys())
-        except FileNotFoundError:
-            pass
+        self.config_dropdown.addItems(self.config_store.names())
+        if selected_name:
+            self.config_dropdown.setCurrentText(selected_name)
+        self.config_dropdown.blockSignals(False)
+        self.load_configuration()
 
     def start_archiving(self):
-        imap_server = self.imap_server_input.text()
-        imap_port = int(self.imap_port_input.text())
-        username = self.email_input.text()
-        password = self.password_input.text()
         keywords = self.keywords_input.text().split(',')
-        archive_date = self.date_picker.date().toPyDate()
-
-        # Get selected senders
-        selected_senders = [item.text() for item in self.sender_list.selectedItems()]
-
-        # Ensure any existing thread is properly cleaned up before starting a new one
-        if hasattr(self, 'archiving_thread') and self.archiving_thread.isRunning():
-            self.logs.append("Previous archiving thread is still running.\n")
+        try:
+            # Checked here so a typo is reported now rather than when the job runs
+            parse_metadata_rules(self.rules_input.text())
+        except ValueError as e:
+            self.logs.append(f"{str(e)}\n")
             return
+        self.submit_job(ARCHIVE, {"keywords": keywords, "senders": self.selected_senders(), "days": self.days_back(),
+                                  "metadata_rules": self.rules_input.text(),
+                                  "all_folders": self.all_folders_checkbox.isChecked()})
 
-        self.logs.clear()
-        self.logs.append("Archiving started...\n")
-
-        self.archiving_thread = ArchiverThread(imap_server, imap_port, username, password, keywords, archive_date, "archive")
-        self.archiving_thread.selected_senders = selected_senders  # Set selected_senders
-        self.archiving_thread.log_signal.connect(self.logs.append)
-        self.archiving_thread.finished_signal.connect(self.archiving_finished)
-        self.archiving_thread.start()
+    def estimate_matches(self):
+        keywords = self.keywords_input.text().split(',')
+        params = {"keywords": keywords, "senders": self.selected_senders(), "days": self.days_back()}
+        # Answers in seconds and changes nothing, so it never waits behind a long run
+        job = self.job_queue.submit(Job(ESTIMATE, self.current_account(), params, HIGH))
+        self.job_changed(job.id)
 
     def delete_drafts(self):
-        imap_server = self.imap_server_input.text()
-        imap_port = int(self.imap_port_input.text())
-        username = self.email_input.text()
-        password = self.password_input.text()
-
-        # Ensure any existing thread is properly cleaned up before starting a new one
-        if hasattr(self, 'archiving_thread') and self.archiving_thread.isRunning():
-            self.logs.append("Previous archiving thread is still running.\n")
-            return
-
-        self.logs.clear()
-        self.logs.append("Deleting drafts started...\n")
-
-        self.archiving_thread = ArchiverThread(imap_server, imap_port, username, password, [], None, "delete_drafts")
-        self.archiving_thread.log_signal.connect(self.logs.append)
-        self.archiving_thread.finished_signal.connect(self.archiving_finished)
-        self.archiving_thread.start()
+        self.submit_job(DELETE_DRAFTS)
 
     def collect_senders(self):
-        imap_server = self.imap_server_input.text()
-        imap_port = int(self.imap_port_input.text())
-        username = self.email_input.text()
-        password = self.password_input.text()
-        archive_date = self.date_picker.date().toPyDate()
-
-        # Ensure any existing thread is properly cleaned up before starting a new one
-        if hasattr(self, 'archiving_thread') and self.archiving_thread.isRunning():
-            self.logs.append("Previous archiving thread is still running.\n")
-            return
+        # The user is waiting on the sender list, let it jump ahead of background jobs
+        self.submit_job(COLLECT_SENDERS, {"days": self.days_back(), "all_folders": self.all_folders_checkbox.isChecked()},
+                        HIGH)
 
-        self.logs.clear()
-        self.logs.append("Collecting senders started...\n")
-
-        self.archiving_thread = ArchiverThread(imap_server, imap_port, username, password, [], archive_date, "collect_senders")
-        self.archiving_thread.log_signal.connect(self.logs.append)
-        self.archiving_thread.senders_signal.connect(self.populate_sender_list)
-        self.archiving_thread.finished_signal.connect(self.archiving_finished)
-        self.archiving_thread.start()
+    def analyze_mailbox(self):
+        try:
+            parse_metadata_rules(self.rules_input.text())
+        except ValueError as e:
+            self.logs.append(f"{str(e)}\n")
+            return
+        # The report shows what the archive rules would take
+        job = self.job_queue.submit(Job(ANALYZE, self.current_account(), {"metadata_rules": self.rules_input.text()}))
+        self.job_changed(job.id)
+        # Largest offenders first
+        self.sender_list.sortByColumn(SIZE_COLUMN, Qt.DescendingOrder)
 
     def populate_sender_list(self, senders):
-        self.sender_list.clear()
-        self.sender_list.addItems(senders)
+        self.sender_model.upsert_senders(senders)
+
+    def apply_sender_filter(self):
+        self.sender_proxy.set_filter_text(self.sender_filter_input.text())
+
+    def selected_senders(self):
+        rows = self.sender_list.selectionModel().selectedRows()
+        return [self.sender_model.sender_at(self.sender_proxy.mapToSource(index).row()) for index in rows]
+
+    def start_workers(self):
+        self.workers = []
+        for _ in range(MAX_CONCURRENT_JOBS):
+            worker = JobWorker(self.job_queue, self.connections)
+            worker.log_signal.connect(self.logs.append)
+            worker.senders_signal.connect(self.populate_sender_list)
+            worker.senders_reset_signal.connect(self.sender_model.clear)
+            worker.progress_signal.connect(self.update_progress)
+            worker.job_signal.connect(self.job_changed)
+            worker.start()
+            self.workers.append(worker)
+
+        # Check recurring schedules in the background of the event loop
+        self.scheduler_timer = QTimer(self)
+        self.scheduler_timer.setInterval(SCHEDULER_INTERVAL)
+        self.scheduler_timer.timeout.connect(self.submit_due_jobs)
+        self.scheduler_timer.start()
+
+    def load_sender_snapshot(self):
+        try:
+            account = self.current_account()
+        except ValueError:
+            return  # No profile loaded yet
+        key = account_key(account)
+        if key == self.snapshot_key:
+            return
+        # Switching profiles drops the previous account's senders, whether or not this one has a cache
+        if self.snapshot_key is not None:
+            self.sender_model.clear()
+        self.snapshot_key = key
+        snapshot = load_snapshot(account)
+        if snapshot is None:
+            return
+        self.sender_model.upsert_senders(snapshot.rows())
+        self.logs.append(f"Loaded {len(snapshot.senders)} senders collected since {snapshot.since}.\n")
+        # Pick up mail that arrived since the snapshot without blocking anything the user starts
+        job = self.job_queue.submit(Job(COLLECT_SENDERS, account, {"refresh": True}, LOW))
+        self.job_changed(job.id)
+
+    def current_account(self):
+        return (self.imap_server_input.text(), int(self.imap_port_input.text()), self.email_input.text(),
+                self.password_input.text())
+
+    def days_back(self):
+        return max(0, self.date_picker.date().daysTo(QDate.currentDate()))
+
+    def submit_job(self, kind, params=None, priority=NORMAL):
+        account = self.current_account()
+        repeat = self.repeat_dropdown.currentText()
+        if repeat == REPEAT_ONCE:
+            job = self.job_queue.submit(Job(kind, account, params, priority))
+            self.logs.append(f"Job #{job.id} queued.\n")
+            self.job_changed(job.id)
+            return
+
+        if repeat == REPEAT_HOURLY:
+            recurring = RecurringJob(kind, account, params, HOURLY, name="hourly")
+        else:
+            recurring = RecurringJob(kind, account, params, 24 * HOURLY, next_nightly(), name="nightly")
+        self.job_queue.add_recurring(recurring)
+        self.logs.append(f"Scheduled {kind.replace('_', ' ')} {recurring.name}.\n")
+
+    def submit_due_jobs(self):
+        for job in self.job_queue.submit_due():
+            self.job_changed(job.id)
+
+    def job_changed(self, job_id):
+        job = self.job_queue.jobs.get(job_id)
+        if job is None:
+            # Dropped from the queue's history, drop it from the list as well
+            item = self.job_items.pop(job_id, None)
+            if item is not None:
+                self.job_list.takeItem(self.job_list.row(item))
+            return
+        if job.status == RUNNING:
+            self.progress_bar.setRange(0, 0)  # Busy indicator until the first progress update
+            self.progress_label.setText("")
+
+        item = self.job_items.get(job_id)
+        if item is None:
+            item = self.job_items[job_id] = QListWidgetItem()
+            item.setData(Qt.UserRole, job_id)
+            self.job_list.insertItem(0, item)
+        item.setText(job.describe())
+        if job.status not in (QUEUED, RUNNING) and self.progress_bar.maximum() == 0:
+            self.progress_bar.setRange(0, 1)
+
+    def update_progress(self, done, total, num_bytes, rate):
+        self.progress_bar.setRange(0, max(total, 1))
+        self.progress_bar.setValue(done)
+        self.progress_label.setText(format_progress(done, total, num_bytes, rate))
+
+    def cancel_selected_job(self):
+        for item in self.job_list.selectedItems():
+            job = self.job_queue.cancel(item.data(Qt.UserRole))
+            if job:
+                self.logs.append(f"Cancelling job #{job.id}...\n")
+                self.job_changed(job.id)
 
     def cancel_archiving(self):
-        if hasattr(self, 'archiving_thread') and self.archiving_thread.isRunning():
-            self.archiving_thread.cancel()
-            self.logs.append("Cancelling archiving process...\n")
+        # Cancels running and queued jobs and drops every recurring schedule
+        self.job_queue.cancel_all()
+        for job_id in list(self.job_items):
+            self.job_changed(job_id)
+        self.logs.append("Cancelling all jobs...\n")
+
+    def closeEvent(self, event):
+        self.job_queue.cancel_all()
+        self.job_queue.close()
+        for worker in self.workers:
+            worker.wait()
+        self.connections.close_all()
+        super().closeEvent(event)
 
-    def archiving_finished(self):
-        self.logs.append("Archiving finished.\n")
 
 def main():
+    if "--headless" in sys.argv:
+        sys.exit(run_headless([arg for arg in sys.argv[1:] if arg != "--headless"]))
+
     app = QApplication(sys.argv)
     ex = EmailArchiverApp()
     sys.exit(app.exec_())
@@ -0,0 +1,120 @@
+import codecs
+from functools import lru_cache
+
+from senderIndex import SenderIndex
+
+SUBJECT = "subject"
+SENDER = "sender"
+BODY = "body"
+RULE = "rule"  # Size, age and attachment rules answered by the server (see metadataRules)
+CONVERSATION = "conversation"  # Later members of a conversation archived for another match
+
+
+def keyword_pairs(keywords):
+    # Blank keywords would match every message, so they are dropped here
+    return tuple((keyword.strip(), keyword.strip().lower()) for keyword in keywords if keyword.strip())
+
+
+def find_keyword(text, keywords):
+    lowered = text.lower()
+    for keyword, lowered_keyword in keywords:
+        if lowered_keyword in lowered:
+            return keyword
+    return None
+
+
+ASCII_COMPATIBLE_CODECS = ("ascii", "utf-8", "latin-1", "iso8859-", "cp125", "cp437", "cp850", "koi8-", "mac-")
+
+
+@lru_cache(maxsize=None)
+def is_ascii_compatible(charset):
+    # True when ASCII bytes always stand for themselves in this charset, so a byte-level
+    # keyword hit is a real hit. Multi-byte CJK codecs are excluded, their trail bytes
+    # can fall in the ASCII range.
+    try:
+        name = codecs.lookup(charset).name
+    except LookupError:
+        # Unknown charsets are decoded as latin-1
+        return True
+    return name.startswith(ASCII_COMPATIBLE_CODECS)
+
+
+class KeywordScanner:
+    # ASCII keywords are searched directly in the lowered payload bytes, so bodies
+    # that cannot match are never decoded. Other keywords need the decoded text, which
+    # is made at most once and only for bodies that are not pure ASCII. Keywords are
+    # tried in their configured order, like find_keyword, so the same one is reported.
+    def __init__(self, keywords):
+        self.keywords = keywords
+        # (keyword, lowered keyword, lowered ASCII bytes or None)
+        self.patterns = tuple((keyword, lowered, lowered.encode("ascii") if lowered.isascii() else None)
+                              for keyword, lowered in keywords)
+        self.unicode_keywords = any(pattern is None for _, _, pattern in self.patterns)
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def find_in_text(self, text):
+        return find_keyword(text, self.keywords)
+
+    def find_in_payload(self, payload, charset, decode):
+        if not self.keywords:
+            return None
+        if not is_ascii_compatible(charset):
+            return find_keyword(decode(payload, charset), self.keywords)
+
+        lowered = payload.lower()
+        # A pure ASCII body can't hold a non-ASCII keyword
+        decodable = self.unicode_keywords and not payload.isascii()
+        text = None
+        for keyword, lowered_keyword, pattern in self.patterns:
+            if pattern is not None:
+                if pattern in lowered:
+                    return keyword
+            elif decodable:
+                if text is None:
+                    text = decode(payload, charset).lower()
+                if lowered_keyword in text:
+                    return keyword
+        return None
+
+
+class Match:
+    __slots__ = ("uid", "subject", "keyword", "reason")
+
+    def __init__(self, uid, subject, keyword, reason):
+        self.uid = uid
+        self.subject = subject
+        self.keyword = keyword
+        self.reason = reason
+
+
+class MessageMatcher:
+    # Keyword search happens while scanning (see mailParser.scan_message), so the
+    # matcher only combines the scan result with the sender index.
+    def __init__(self, keywords, selected_senders=()):
+        self.keywords = keyword_pairs(keywords)
+        self.scanner = KeywordScanner(self.keywords)
+        self.sender_index = SenderIndex(selected_senders)
+
+    @classmethod
+    def from_rules(cls, rules):
+        # Build from a compiled rule artifact (see configStore.compile_rules) without re-parsing
+        matcher = cls(())
+        matcher.keywords = tuple((keyword, lowered) for keyword, lowered in rules["keywords"])
+        matcher.scanner = KeywordScanner(matcher.keywords)
+        matcher.sender_index = SenderIndex.from_sets(rules["addresses"], rules["domains"],
+                                                      rules.get("dropped_senders", ()))
+        return matcher
+
+    def __bool__(self):
+        return bool(self.keywords or self.sender_index)
+
+    def match(self, parsed):
+        if parsed.subject_keyword:
+            return Match(parsed.uid, parsed.subject, parsed.subject_keyword, SUBJECT)
+        if self.sender_index.matches(parsed.sender):
+            return Match(parsed.uid, parsed.subject, None, SENDER)
+        if parsed.body_keyword:
+            return Match(parsed.uid, parsed.subject, parsed.body_keyword, BODY)
+        return None
@@ -0,0 +1,172 @@
+import re
+
+from fetchParser import fetch_attributes
+from imapUtils import chunked, days_ago, imap_date, iter_fetch_groups, iter_uid_windows, quote_string, uid_set
+
+STRUCTURE_FETCH_CHUNK = 1000  # UIDs per bulk BODYSTRUCTURE fetch
+SIZE_UNITS = {"b": 1, "kb": 1024, "k": 1024, "mb": 1024 ** 2, "m": 1024 ** 2, "gb": 1024 ** 3, "g": 1024 ** 3}
+SIZE = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z]*)$")
+DAYS = re.compile(r"(\d+)\s*d?$")
+CONDITION_KEYS = ("larger", "older", "from", "attachment")
+
+
+def parse_size(text):
+    match = SIZE.match(text.strip().lower())
+    if not match or (match.group(2) and match.group(2) not in SIZE_UNITS):
+        raise ValueError(f"Invalid size: {text}")
+    # A bare number means megabytes, the unit mailbox quotas are thought of in
+    return int(float(match.group(1)) * SIZE_UNITS.get(match.group(2) or "mb"))
+
+
+def format_size(size):
+    for unit, factor in (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024)):
+        if size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+
+def iter_body_parts(structure):
+    # Single parts of a BODYSTRUCTURE: multiparts start with their child parts instead of a type
+    if not isinstance(structure, list) or not structure:
+        return
+    if isinstance(structure[0], list):
+        for item in structure:
+            if not isinstance(item, list):
+                break
+            yield from iter_body_parts(item)
+        return
+    yield structure
+    # A forwarded message/rfc822 part carries the attached message's own structure at index 8
+    if len(structure) > 8 and structure[0] and structure[1] and \
+            structure[0].lower() == b"message" and structure[1].lower() == b"rfc822":
+        yield from iter_body_parts(structure[8])
+
+
+def part_attachment(part):
+    # (mime type, file name or None, disposition or None) of one single part
+    mime_type = b"/".join(value or b"" for value in part[:2]).lower().decode("ascii", errors="replace")
+    names = {}
+    disposition = None
+    parameter_lists = [part[2]] if len(part) > 2 else []
+    for item in part[7:]:
+        # The disposition extension field is (type (parameters)), e.g. ("attachment" ("filename" "a.pdf"))
+        if isinstance(item, list) and len(item) == 2 and isinstance(item[0], bytes) and \
+                (item[1] is None or isinstance(item[1], list)):
+            disposition = item[0].lower().decode("ascii", errors="replace")
+            parameter_lists.append(item[1])
+    for parameters in parameter_lists:
+        if isinstance(parameters, list):
+            for key, value in zip(parameters[::2], parameters[1::2]):
+                if isinstance(key, bytes) and isinstance(value, bytes):
+                    names[key.lower()] = value.decode("utf-8", errors="replace")
+    return mime_type, names.get(b"filename") or names.get(b"name"), disposition
+
+
+class MetadataRule:
+    # Conditions answered by the server from message metadata, all of them must hold.
+    # Size, age and sender become UID SEARCH criteria, attachment types are checked
+    # against a bulk BODYSTRUCTURE fetch of the search results, so no message body is downloaded.
+    def __init__(self, larger_than=None, older_than_days=None, sender=None, attachment_type=None):
+        self.larger_than = larger_than          # Bytes
+        self.older_than_days = older_than_days
+        self.sender = sender.lower() if sender else None
+        self.attachment_type = attachment_type.lower().lstrip(".") if attachment_type else None
+
+    @classmethod
+    def parse(cls, text):
+        # "larger:10MB", "attachment:pdf older:365", "older:30 from:news@example.com"
+        conditions = {}
+        for token in text.split():
+            key, _, value = token.partition(":")
+            key = key.lower()
+            if key not in CONDITION_KEYS or not value:
+                raise ValueError(f"Invalid rule condition: {token}")
+            conditions[key] = value
+        if not conditions:
+            raise ValueError("Empty rule")
+        older = conditions.get("older")
+        if older is not None and not DAYS.match(older.lower()):
+            raise ValueError(f"Invalid age: {older}")
+        return cls(parse_size(conditions["larger"]) if "larger" in conditions else None,
+                   int(DAYS.match(older.lower()).group(1)) if older is not None else None,
+                   conditions.get("from"), conditions.get("attachment"))
+
+    def describe(self):
+        conditions = []
+        if self.larger_than is not None:
+            conditions.append(f"larger:{format_size(self.larger_than)}")
+        if self.older_than_days is not None:
+            conditions.append(f"older:{self.older_than_days}d")
+        if self.sender:
+            conditions.append(f"from:{self.sender}")
+        if self.attachment_type:
+            conditions.append(f"attachment:{self.attachment_type}")
+        return " ".join(conditions)
+
+    def search_criteria(self):
+        # Messages already flagged \Deleted by an earlier rule in the same run are left out
+        criteria = ["UNDELETED"]
+        if self.larger_than is not None:
+            criteria.append(f"LARGER {self.larger_than}")
+        if self.older_than_days is not None:
+            criteria.append(f'BEFORE "{imap_date(days_ago(self.older_than_days))}"')
+        if self.sender:
+            # *@domain selects the whole domain, the same form the sender rules use
+            criteria.append(f"FROM {quote_string(self.sender[1:] if self.sender.startswith('*@') else self.sender)}")
+        return " ".join(criteria)
+
+    def matches_part(self, part):
+        mime_type, filename, disposition = part_attachment(part)
+        if filename is None and disposition != "attachment":
+            return False
+        if "/" in self.attachment_type:
+            kind, _, subtype = self.attachment_type.partition("/")
+            return mime_type.partition("/")[0] == kind and subtype in ("*", mime_type.partition("/")[2])
+        # A bare type is a file extension or a MIME subtype: "pdf" finds application/pdf and *.pdf
+        return (filename or "").lower().endswith("." + self.attachment_type) or \
+            mime_type.partition("/")[2] == self.attachment_type
+
+    def matches_structure(self, structure):
+        return any(self.matches_part(part) for part in iter_body_parts(structure))
+
+
+def parse_metadata_rules(text):
+    # Rules are separated by semicolons, conditions within a rule by spaces
+    return [MetadataRule.parse(rule) for rule in text.split(";") if rule.strip()]
+
+
+def filter_by_structure(mail, rule, uids, log):
+    matched = []
+    for chunk in chunked(uids, STRUCTURE_FETCH_CHUNK):
+        try:
+            result, data = mail.uid('FETCH', uid_set(chunk), "(UID BODYSTRUCTURE)")
+        except Exception as e:
+            log(f"Exception occurred: {str(e)}\n")
+            continue
+        if result != 'OK':
+            log(f"ERROR getting message structure {uid_set(chunk)}\n")
+            continue
+        for group in iter_fetch_groups(data):
+            attributes = fetch_attributes(group)
+            uid = attributes.get(b"UID")
+            if uid and uid.isdigit() and rule.matches_structure(attributes.get(b"BODYSTRUCTURE")):
+                matched.append(int(uid))
+    return matched
+
+
+def find_rule_matches(mail, rules, log, cancelled=lambda: False, scope=""):
+    # {uid: rule description} over the selected folder, the first matching rule names each message.
+    # scope is extra SEARCH criteria (the run's SINCE date) for rules without an age of their own,
+    # an older: rule sets its own date range and would never match inside a recent one.
+    matched = {}
+    for rule in rules:
+        criteria = rule.search_criteria() if rule.older_than_days is not None else f"{rule.search_criteria()} {scope}"
+        for uids in iter_uid_windows(mail, criteria.strip()):
+            if cancelled():
+                return matched
+            uids = [int(uid) for uid in uids if int(uid) not in matched]
+            if rule.attachment_type and uids:
+                uids = filter_by_structure(mail, rule, uids, log)
+            for uid in uids:
+                matched[uid] = rule.describe()
+    return matched
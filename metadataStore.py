@@ -0,0 +1,240 @@
+import bisect
+import time
+from array import array
+
+from imapUtils import days_ago
+
+try:
+    import numpy
+except ImportError:  # Optional, every filter and total also runs as a plain loop over the arrays
+    numpy = None
+
+ATTACHMENT = 1  # Bits of the flags column
+UNKNOWN = 0     # Sender id of messages without a usable From address
+BIT_CHARS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+class Interner:
+    # Each distinct value is stored once, rows refer to it by its position
+    def __init__(self, first=None):
+        self.ids = {}
+        self.values = []
+        self.intern(first)
+
+    def intern(self, value):
+        key = self.ids.get(value)
+        if key is None:
+            key = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return key
+
+    def __len__(self):
+        return len(self.values)
+
+
+def bits_from_mask(mask):
+    # Bitset with bit i set for every non-zero byte i of a 0/1 byte mask
+    return int(bytes(mask).translate(BIT_CHARS)[::-1] or b"0", 2)
+
+
+def bit_count(bits):
+    return bin(bits).count("1")
+
+
+def iter_bits(bits):
+    # Rows of a bitset, lowest first
+    text = bin(bits)[:1:-1]
+    row = text.find("1")
+    while row >= 0:
+        yield row
+        row = text.find("1", row + 1)
+
+
+def month_starts(oldest, newest):
+    # Local start time of every calendar month from the oldest to the newest date
+    first, last = time.localtime(oldest), time.localtime(newest)
+    starts = []
+    year, month = first.tm_year, first.tm_mon
+    while (year, month) <= (last.tm_year, last.tm_mon):
+        starts.append((time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1)), f"{year:04d}-{month:02d}"))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return starts
+
+
+class MessageStore:
+    # Per-message metadata as columns: one typed array per field and senders as interned
+    # ids, about 21 bytes a message instead of a tuple and the objects it points to.
+    # Filters return bitsets (bit i = row i) that combine with & | and ~ and are counted
+    # or totalled without building a row. With numpy installed they run vectorized over
+    # the arrays in place, without it as one loop per filter.
+    # There are no keyword columns: keyword matches need message bodies, which the
+    # metadata scan never fetches, so a store row could never have a keyword bit set.
+    def __init__(self):
+        self.uids = array('I')
+        self.sizes = array('I')
+        self.dates = array('d')    # Seconds since the epoch, 0.0 when unknown
+        self.senders = array('I')
+        self.flags = array('B')
+        self.sender_names = Interner()         # Id 0 is the unknown sender
+        self.domain_names = Interner()
+        self.sender_domains = array('I', [0])  # Domain id per sender id
+
+    def __len__(self):
+        return len(self.uids)
+
+    def sender_id(self, sender):
+        key = self.sender_names.intern(sender)
+        if key == len(self.sender_domains):
+            self.sender_domains.append(self.domain_names.intern(sender.rpartition("@")[2]))
+        return key
+
+    def add(self, uid, size, timestamp, sender=None, flags=0):
+        self.uids.append(uid)
+        self.sizes.append(size)
+        self.dates.append(timestamp)
+        self.senders.append(self.sender_id(sender) if sender else UNKNOWN)
+        self.flags.append(flags)
+
+    def column(self, values):
+        # numpy view over an array column without copying it. Arrays can't grow while a
+        # view exists, so views never outlive the call that made them.
+        return numpy.frombuffer(values, dtype=values.typecode) if len(values) else numpy.zeros(0, values.typecode)
+
+    def numpy_bits(self, mask):
+        return int.from_bytes(numpy.packbits(mask, bitorder='little').tobytes(), 'little')
+
+    def numpy_mask(self, bits):
+        packed = numpy.frombuffer(bits.to_bytes((len(self) + 7) // 8, 'little'), dtype=numpy.uint8)
+        return numpy.unpackbits(packed, count=len(self), bitorder='little').view(bool)
+
+    def all(self):
+        return (1 << len(self)) - 1
+
+    def larger_than(self, size):
+        # Strictly larger, like SEARCH LARGER
+        if numpy is not None:
+            return self.numpy_bits(self.column(self.sizes) > size)
+        return bits_from_mask(bytes(value > size for value in self.sizes))
+
+    def dated(self, start=None, end=None):
+        # start <= date < end, in seconds since the epoch; unknown dates never match
+        start = 0.0 if start is None else max(start, 0.0)
+        end = float("inf") if end is None else end
+        if numpy is not None:
+            dates = self.column(self.dates)
+            return self.numpy_bits((dates > 0) & (dates >= start) & (dates < end))
+        return bits_from_mask(bytes(0 < value and start <= value < end for value in self.dates))
+
+    def from_senders(self, senders):
+        # Addresses and *@domain patterns, the same forms the sender rules use
+        senders = [sender.lower() for sender in senders]
+        domains = {self.domain_names.ids.get(sender[2:]) for sender in senders if sender.startswith("*@")}
+        domains.discard(None)
+        table = bytearray(len(self.sender_names))
+        if domains:
+            for key, domain in enumerate(self.sender_domains):
+                if domain in domains:
+                    table[key] = 1
+        for sender in senders:
+            key = self.sender_names.ids.get(sender)
+            if key:
+                table[key] = 1
+        return self.sender_table_bits(table)
+
+    def senders_containing(self, text):
+        # Substring match on the address, as SEARCH FROM does
+        text = text.lower()
+        table = bytearray(len(self.sender_names))
+        for key, sender in enumerate(self.sender_names.values):
+            if sender and text in sender:
+                table[key] = 1
+        return self.sender_table_bits(table)
+
+    def sender_table_bits(self, table):
+        # Rows whose sender id is set in a byte-per-sender table, one lookup per row
+        if numpy is not None:
+            return self.numpy_bits(numpy.frombuffer(table, dtype=bool)[self.column(self.senders)])
+        return bits_from_mask(bytes(map(table.__getitem__, self.senders)))
+
+    def with_flags(self, flag):
+        if numpy is not None:
+            return self.numpy_bits(self.column(self.flags) & flag != 0)
+        return bits_from_mask(bytes(value & flag != 0 for value in self.flags))
+
+    def total_size(self, bits=None):
+        if bits is None:
+            return sum(self.sizes)
+        if numpy is not None:
+            return int(self.column(self.sizes)[self.numpy_mask(bits)].sum(dtype=numpy.uint64))
+        sizes = self.sizes
+        return sum(sizes[row] for row in iter_bits(bits))
+
+    def sender_groups(self):
+        # (group id per row, label per group id) for totals()
+        return self.senders, self.sender_names.values
+
+    def domain_groups(self):
+        if numpy is not None:
+            groups = self.column(self.sender_domains)[self.column(self.senders)]
+        else:
+            groups = array('I', map(self.sender_domains.__getitem__, self.senders))
+        return groups, self.domain_names.values
+
+    def month_groups(self, unknown="unknown"):
+        # Local calendar month of each row, group 0 holds the rows without a date
+        if numpy is not None:
+            dates = self.column(self.dates)
+            known = dates[dates > 0]
+            starts = month_starts(known.min(), known.max()) if len(known) else []
+            bounds = numpy.array([start for start, _ in starts], dtype=float)
+            groups = numpy.searchsorted(bounds, dates, side='right')
+        else:
+            oldest = min((date for date in self.dates if date > 0), default=None)
+            starts = month_starts(oldest, max(self.dates)) if oldest is not None else []
+            bounds = [start for start, _ in starts]
+            groups = array('I', (bisect.bisect_right(bounds, date) for date in self.dates))
+        return groups, [unknown] + [label for _, label in starts]
+
+    def flag_groups(self, flag, labels):
+        # labels is (without the flag, with it)
+        if numpy is not None:
+            return (self.column(self.flags) & flag != 0).astype(numpy.uint8), list(labels)
+        return bytes(value & flag != 0 for value in self.flags), list(labels)
+
+    def totals(self, groups, group_count, bits=None):
+        # Lists of message count, bytes and newest date per group id over the selected rows
+        if numpy is not None:
+            ids = groups if isinstance(groups, numpy.ndarray) else self.column(groups)
+            sizes, dates = self.column(self.sizes), self.column(self.dates)
+            if bits is not None:
+                mask = self.numpy_mask(bits)
+                ids, sizes, dates = ids[mask], sizes[mask], dates[mask]
+            counts = numpy.bincount(ids, minlength=group_count)
+            size_totals = numpy.bincount(ids, weights=sizes, minlength=group_count)
+            last_seen = numpy.zeros(group_count)
+            numpy.maximum.at(last_seen, ids, dates)
+            return counts.tolist(), [int(size) for size in size_totals], last_seen.tolist()
+
+        counts, size_totals, last_seen = [0] * group_count, [0] * group_count, [0.0] * group_count
+        sizes, dates = self.sizes, self.dates
+        for row in range(len(self)) if bits is None else iter_bits(bits):
+            key = groups[row]
+            counts[key] += 1
+            size_totals[key] += sizes[row]
+            if dates[row] > last_seen[key]:
+                last_seen[key] = dates[row]
+        return counts, size_totals, last_seen
+
+    def rule_bits(self, rule):
+        # (bitset, exact) for a metadataRules.MetadataRule. Attachment types are not kept per
+        # message, an attachment rule selects every message with an attachment and is not exact.
+        bits = self.all()
+        if rule.larger_than is not None:
+            bits &= self.larger_than(rule.larger_than)
+        if rule.older_than_days is not None:
+            bits &= self.dated(end=time.mktime(days_ago(rule.older_than_days).timetuple()))
+        if rule.sender:
+            bits &= self.senders_containing(rule.sender[1:] if rule.sender.startswith("*@") else rule.sender)
+        if rule.attachment_type:
+            bits &= self.with_flags(ATTACHMENT)
+        return bits, not rule.attachment_type
@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from mailParser import scan_message
+
+PROCESS_THRESHOLD = 2000   # Below this many messages, process start-up costs more than it saves
+MAX_PROCESS_WORKERS = 8
+
+_worker_scanner = None
+
+
+def _init_worker(scanner):
+    global _worker_scanner
+    _worker_scanner = scanner
+
+
+def scan_batch(items, scanner):
+    results = []
+    errors = []
+    for uid, raw in items:
+        try:
+            results.append(scan_message(uid, raw, scanner))
+        except Exception as e:
+            errors.append(f"Exception occurred: {str(e)}\n")
+    return results, errors
+
+
+def _scan_batch_in_worker(items):
+    return scan_batch(items, _worker_scanner)
+
+
+def process_workers_for(message_count):
+    cpus = os.cpu_count() or 1
+    if message_count < PROCESS_THRESHOLD or cpus < 2:
+        return 0
+    return min(cpus - 1, MAX_PROCESS_WORKERS)
+
+
+class ProcessParseStage:
+    # Ships raw message batches to worker processes and gets compact ParsedMessages back.
+    # The keyword scanner is sent once per worker through the pool initializer.
+    # Workers are spawned, not forked: the pool is started from a job thread while other
+    # threads hold locks and Qt state that a forked child would inherit half-way through.
+    # They import only this module and the parser, never the GUI.
+    def __init__(self, workers, scanner):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(scanner,))
+
+    def scan(self, items):
+        return self.executor.submit(_scan_batch_in_worker, items).result()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
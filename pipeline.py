@@ -0,0 +1,498 @@
+import collections
+import queue
+import threading
+import time
+
+from conversations import ConversationAction
+from gmailBackend import GmailBackend, is_gmail
+from imapConnection import CONNECTION_ERRORS, reconnect_count, transfer_stats
+from imapPipeline import PIPELINE_DEPTH, CommandPipeline
+from imapUtils import (chunked, count_messages, find_special_folders, imap_date, iter_fetch_items, iter_uid_windows,
+                       quote_mailbox, uid_set)
+from journal import DELETE, MOVE, ActionJournal
+from matcher import CONVERSATION, RULE, Match
+from metadataRules import find_rule_matches
+from parsePool import PROCESS_THRESHOLD, ProcessParseStage, process_workers_for, scan_batch
+from progress import ProgressTracker
+from runStats import ByteBudget, TransferStats, peak_rss_mb
+
+FETCH_BATCH_SIZE = 50        # Messages per UID FETCH
+ACTION_BATCH_SIZE = 500      # UIDs per bulk STORE
+EXPUNGE_CHUNK_SIZE = 5000    # UIDs per UID EXPUNGE
+QUEUE_SIZE = 200             # Items each stage may buffer before the previous one blocks
+PARSE_WORKERS = 2            # In-thread parse workers when the process pool is not used
+DEPTH_REPORT_INTERVAL = 5.0  # Seconds between queue depth reports
+MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024  # Raw message bytes fetched but not yet parsed
+ARCHIVE_FOLDER = "Archive"   # Created on servers without an archive folder of their own
+
+STOP = object()
+
+
+class ArchiveAction:
+    # Generic action: move into the archive folder when the server has one, otherwise
+    # archive label plus \Deleted. Expunged once at the end.
+    # apply returns how many messages it acted on.
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.kind = MOVE if folder else DELETE  # How the journal restores these messages
+        self.target = folder
+        self.flagged = []  # UIDs apply marked \Deleted, for finish to expunge
+
+    def members(self, uids):
+        # Every UID apply acts on, mapped to the matched UID it acts for
+        return {uid: uid for uid in uids}
+
+    def take_followers(self):
+        # UIDs to act on without matching them (see conversations.ConversationSet)
+        return []
+
+    def apply(self, mail, uids):
+        message_set = uid_set(uids)
+        if self.folder and 'MOVE' in mail.capabilities:
+            mail.uid('MOVE', message_set, quote_mailbox(self.folder))
+            return len(uids)
+        if self.folder:
+            mail.uid('COPY', message_set, quote_mailbox(self.folder))
+        else:
+            mail.uid('STORE', message_set, '+X-GM-LABELS', '(\\Archive)')
+        mail.uid('STORE', message_set, '+FLAGS.SILENT', '(\\Deleted)')
+        self.flagged.extend(uids)
+        return len(uids)
+
+    def finish(self, mail):
+        # UID EXPUNGE removes only what apply flagged, a plain EXPUNGE would also remove
+        # messages the user had marked \Deleted in another client
+        flagged, self.flagged = self.flagged, []
+        if not flagged:
+            return
+        if 'UIDPLUS' in mail.capabilities:
+            for chunk in chunked(flagged, EXPUNGE_CHUNK_SIZE):
+                mail.uid('EXPUNGE', uid_set(chunk))
+        else:
+            mail.expunge()
+
+
+class ArchiveSummary:
+    def __init__(self):
+        self.scanned = 0
+        self.archived = 0
+        self.matched_keywords = {}
+        self.peak_depths = {}
+        self.peak_in_flight = 0
+        self.peak_rss_mb = None
+        self.folders = {}          # Folder -> emails archived, for multi-folder runs
+        self.skipped_folders = 0   # Folders left alone because nothing changed since the last run
+        self.compression = None    # TransferStats when the connection used COMPRESS=DEFLATE
+        self.reconnects = 0        # Dropped connections brought back during the run
+
+    def merge(self, other, folder):
+        self.scanned += other.scanned
+        self.archived += other.archived
+        for keyword, count in other.matched_keywords.items():
+            self.matched_keywords[keyword] = self.matched_keywords.get(keyword, 0) + count
+        for name, depth in other.peak_depths.items():
+            self.peak_depths[name] = max(self.peak_depths.get(name, 0), depth)
+        self.peak_in_flight = max(self.peak_in_flight, other.peak_in_flight)
+        if other.peak_rss_mb is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0, other.peak_rss_mb)
+        self.folders[folder] = other.archived
+        self.reconnects += other.reconnects
+        if other.compression is not None:
+            if self.compression is None:
+                self.compression = TransferStats()
+            self.compression.add(other.compression)
+
+    def format(self):
+        summary = f"Total emails archived: {self.archived}\n\n"
+        for keyword, count in self.matched_keywords.items():
+            summary += f"'{keyword}': {count} emails\n"
+        if self.folders or self.skipped_folders:
+            summary += "\n" + "".join(f"{folder}: {count} emails\n" for folder, count in self.folders.items())
+            summary += f"Unchanged folders skipped: {self.skipped_folders}\n"
+        if self.compression is not None:
+            summary += "\n" + self.compression.format()
+        if self.reconnects:
+            summary += f"Reconnected after {self.reconnects} dropped connections\n"
+        if self.peak_rss_mb is not None:
+            summary += f"\nPeak memory: {self.peak_rss_mb:.0f} MB, peak in-flight: {self.peak_in_flight / 1048576:.1f} MB\n"
+        return summary
+
+
+class ArchivePipeline:
+    # fetch -> parse -> match -> act, each stage on its own thread and connected by
+    # bounded queues so the network and the CPU stay busy at the same time.
+    def __init__(self, mail, matcher, log, cancelled=lambda: False, action=None, parse_workers=PARSE_WORKERS,
+                 fetch_batch_size=FETCH_BATCH_SIZE, action_batch_size=ACTION_BATCH_SIZE, queue_size=QUEUE_SIZE,
+                 use_processes=True, max_in_flight_bytes=MAX_IN_FLIGHT_BYTES, progress=None, journal=None,
+                 pipeline_depth=PIPELINE_DEPTH):
+        self.mail = mail
+        self.matcher = matcher
+        self.log = log
+        self.cancelled = cancelled
+        self.action = action or ArchiveAction()
+        self.parse_workers = parse_workers
+        self.fetch_batch_size = fetch_batch_size
+        self.action_batch_size = action_batch_size
+        self.use_processes = use_processes
+        self.byte_budget = ByteBudget(max_in_flight_bytes)
+        self.process_stage = None
+        self.processes_checked = False
+        self.parse_threads = []
+        self.searched = 0  # Messages the windows searched so far
+        self.progress = progress or ProgressTracker(lambda *args: None)
+        self.journal = journal
+        self.window_sizes = None
+        # imaplib is not thread safe, the fetch and action stages take turns on the connection.
+        # Fetches stay in flight between turns, anything else drains them first.
+        self.mail_lock = threading.Lock()
+        self.commands = CommandPipeline(mail, pipeline_depth)
+        self.queues = {
+            # The parse queue holds whole fetch batches rather than single messages
+            "parse": queue.Queue(max(2, queue_size // fetch_batch_size)),
+            "match": queue.Queue(queue_size),
+            "action": queue.Queue(queue_size),
+        }
+        self.summary = ArchiveSummary()
+        self.last_depth_report = 0.0
+        # Set once the connection is gone and could not be brought back, the remaining
+        # stages then only drain their queues instead of failing message by message
+        self.connection_lost = False
+
+    def queue_depths(self):
+        return {name: stage_queue.qsize() for name, stage_queue in self.queues.items()}
+
+    def report_depths(self, force=False):
+        depths = self.queue_depths()
+        for name, depth in depths.items():
+            self.summary.peak_depths[name] = max(self.summary.peak_depths.get(name, 0), depth)
+        now = time.monotonic()
+        if force or now - self.last_depth_report >= DEPTH_REPORT_INTERVAL:
+            self.last_depth_report = now
+            self.log("Queue depth: " + ", ".join(f"{name} {depth}" for name, depth in depths.items()) + "\n")
+
+    def run(self, uid_windows, message_count, window_sizes=None):
+        # uid_windows yields lists of UIDs, so the full UID list never has to be in memory.
+        # window_sizes (see count_windows) lets progress count messages before thread grouping.
+        # message_count is how many messages the search will scan, None when the server could
+        # not count them up front; the windows then decide once enough have been searched.
+        self.window_sizes = window_sizes
+        if message_count is not None:
+            self.start_processes(message_count)
+        self.add_parse_threads(self.parse_workers - len(self.parse_threads))
+        match_thread = threading.Thread(target=self.match_stage, daemon=True)
+        action_thread = threading.Thread(target=self.action_stage, daemon=True)
+        match_thread.start()
+        action_thread.start()
+
+        try:
+            self.fetch_stage(uid_windows)
+        finally:
+            # Shut the stages down in order so every queued item is still processed
+            for _ in self.parse_threads:
+                self.queues["parse"].put(STOP)
+            for thread in self.parse_threads:
+                thread.join()
+            self.queues["match"].put(STOP)
+            match_thread.join()
+            self.queues["action"].put(STOP)
+            action_thread.join()
+            if self.process_stage:
+                self.process_stage.close()
+
+        if not self.connection_lost:
+            with self.mail_lock:
+                self.action.finish(self.mail)
+        self.report_depths(force=True)
+        self.summary.peak_in_flight = self.byte_budget.peak
+        self.summary.peak_rss_mb = peak_rss_mb()
+        self.progress.finish()
+        return self.summary
+
+    def start_processes(self, message_count):
+        # Once per run: worker processes only pay off their start-up for enough messages
+        self.processes_checked = True
+        process_workers = process_workers_for(message_count) if self.use_processes else 0
+        if process_workers:
+            self.process_stage = ProcessParseStage(process_workers, self.matcher.scanner)
+            self.parse_workers = process_workers
+            self.log(f"Parsing on {process_workers} worker processes.\n")
+            # One thread feeds each worker process, on top of the in-thread ones already running
+            self.add_parse_threads(process_workers - len(self.parse_threads))
+
+    def add_parse_threads(self, count):
+        for _ in range(count):
+            thread = threading.Thread(target=self.parse_stage, daemon=True)
+            thread.start()
+            self.parse_threads.append(thread)
+
+    def fetch_stage(self, uid_windows):
+        for chunk, covered in self.fetch_chunks(uid_windows):
+            if self.cancelled():
+                self.log("Archiving cancelled.\n")
+                break
+            if self.connection_lost:
+                break
+            try:
+                with self.mail_lock:
+                    # Chunk N+1 is requested before chunk N has arrived
+                    self.commands.submit((chunk, covered), 'FETCH', uid_set(chunk), "(RFC822)")
+                    if self.commands.full():
+                        self.commands.complete_one()
+            except CONNECTION_ERRORS as e:
+                self.lose_connection(e)
+                break
+            except Exception as e:
+                self.log(f"Exception occurred: {str(e)}\n")
+                continue
+            self.queue_fetched()
+        try:
+            with self.mail_lock:
+                self.commands.drain()
+        except CONNECTION_ERRORS as e:
+            self.lose_connection(e)
+        except Exception as e:
+            self.log(f"Exception occurred: {str(e)}\n")
+        self.queue_fetched()
+
+    def lose_connection(self, error):
+        # Connections from imapConnection.connect() have already tried to reconnect by now
+        if not self.connection_lost:
+            self.log(f"Exception occurred: {str(error)}\n")
+            self.log("Connection lost, stopping. Messages archived so far are in the journal.\n")
+        self.connection_lost = True
+
+    def queue_fetched(self):
+        # Hand completed fetches to the parse stage, outside the connection lock
+        for (chunk, covered), result, data in self.commands.take_ready():
+            if result != 'OK':
+                self.log(f"ERROR getting messages {uid_set(chunk)}\n")
+                continue
+            batch = list(iter_fetch_items(data))
+            fetched_bytes = batch_bytes(batch)
+            # Block until the parse stage has worked off enough bytes
+            self.byte_budget.acquire(fetched_bytes)
+            self.queues["parse"].put(batch)
+            self.progress.advance(covered, fetched_bytes)
+            self.report_depths()
+
+    def fetch_chunks(self, uid_windows):
+        uid_windows = iter(uid_windows)
+        while True:
+            # Windowed searches share the connection with the action stage
+            with self.mail_lock:
+                self.commands.drain()
+                uids = next(uid_windows, None)
+                followers = self.action.take_followers()
+            self.queue_followers(followers)
+            if uids is None:
+                return
+            covered = self.window_sizes.popleft() if self.window_sizes else len(uids)
+            self.searched += covered
+            if not self.processes_checked and self.searched >= PROCESS_THRESHOLD:
+                self.start_processes(self.searched)
+            if not uids:
+                self.progress.advance(covered)
+                continue
+            for chunk in chunked(uids, self.fetch_batch_size):
+                yield chunk, covered * len(chunk) / len(uids)
+
+    def queue_followers(self, uids):
+        # Members of conversations already acted on, straight to the action stage without a fetch
+        for uid in uids:
+            self.queues["action"].put(Match(uid, None, None, CONVERSATION))
+
+    def parse_stage(self):
+        parse_queue, match_queue = self.queues["parse"], self.queues["match"]
+        while True:
+            batch = parse_queue.get()
+            if batch is STOP:
+                break
+            try:
+                if self.process_stage:
+                    results, errors = self.process_stage.scan(batch)
+                else:
+                    results, errors = scan_batch(batch, self.matcher.scanner)
+            except Exception as e:
+                self.log(f"Exception occurred: {str(e)}\n")
+                continue
+            finally:
+                self.byte_budget.release(batch_bytes(batch))
+            for error in errors:
+                self.log(error)
+            for parsed in results:
+                match_queue.put(parsed)
+
+    def match_stage(self):
+        match_queue, action_queue = self.queues["match"], self.queues["action"]
+        summary = self.summary
+        while True:
+            parsed = match_queue.get()
+            if parsed is STOP:
+                break
+            summary.scanned += 1
+            try:
+                match = self.matcher.match(parsed)
+            except Exception as e:
+                self.log(f"Exception occurred: {str(e)}\n")
+                continue
+            if match is None:
+                continue
+            if match.keyword:
+                summary.matched_keywords[match.keyword] = summary.matched_keywords.get(match.keyword, 0) + 1
+            self.log(f"Matched {match.reason}: {match.subject}\n")
+            action_queue.put(match)
+
+    def action_stage(self):
+        action_queue = self.queues["action"]
+        pending = []
+        while True:
+            match = action_queue.get()
+            if match is not STOP:
+                pending.append(match)
+            if pending and (match is STOP or len(pending) >= self.action_batch_size):
+                self.apply_action(pending)
+                pending = []
+            if match is STOP:
+                break
+
+    def archive_rule_matches(self, matched):
+        # Messages the server already identified (see metadataRules), acted on in bulk
+        # before the scan starts so the scan never fetches them
+        summary = self.summary
+        for chunk in chunked(sorted(matched), self.action_batch_size):
+            if self.cancelled() or self.connection_lost:
+                break
+            for uid in chunk:
+                summary.matched_keywords[matched[uid]] = summary.matched_keywords.get(matched[uid], 0) + 1
+            self.apply_action([Match(uid, None, matched[uid], RULE) for uid in chunk])
+
+    def apply_action(self, matches):
+        if self.connection_lost:
+            return
+        rules = {match.uid: f"{match.reason}: {match.keyword}" if match.keyword else match.reason for match in matches}
+        uids = list(rules)
+        try:
+            with self.mail_lock:
+                # STORE and MOVE are not pipelined: wait for the fetches in flight to complete first
+                self.commands.drain()
+                if self.journal:
+                    # Write-ahead: the batch is on disk before the server changes anything
+                    members = self.action.members(uids)
+                    self.journal.record(self.mail, {uid: rules[rep] for uid, rep in members.items()},
+                                        self.action.kind, self.action.target)
+                self.summary.archived += self.action.apply(self.mail, uids)
+                if self.journal:
+                    self.journal.record_copyuid(self.mail, self.action.target)
+        except CONNECTION_ERRORS as e:
+            self.lose_connection(e)
+        except Exception as e:
+            self.log(f"Exception occurred: {str(e)}\n")
+
+
+def count_windows(uid_windows, window_sizes):
+    # Record how many searched messages each window stands for before any grouping shrinks it
+    for uids in uid_windows:
+        window_sizes.append(len(uids))
+        yield uids
+
+
+def batch_bytes(batch):
+    return sum(len(raw) for _, raw in batch)
+
+
+def since_criteria(archive_date):
+    return f'SINCE "{imap_date(archive_date)}"'
+
+
+def find_archive_folder(mail, log):
+    # The server's archive folder, or a new ARCHIVE_FOLDER when it has none. Without one, matches
+    # could only be flagged \Deleted and expunged, and the journal would have nothing to restore.
+    folder = find_special_folders(mail).get("\\Archive")
+    if folder:
+        return folder
+    try:
+        result, data = mail.create(quote_mailbox(ARCHIVE_FOLDER))
+    except Exception as e:
+        log(f"Exception occurred: {str(e)}\n")
+        result, data = None, []
+    if result == 'OK':
+        log(f"No archive folder found, created \"{ARCHIVE_FOLDER}\" to archive into.\n")
+        return ARCHIVE_FOLDER
+    # Another connection of a multi-folder run may have created it in the meantime
+    folder = find_special_folders(mail).get("\\Archive")
+    if folder:
+        return folder
+    reason = data[0].decode(errors="replace") if data and isinstance(data[0], bytes) else result
+    log(f"No archive folder found and \"{ARCHIVE_FOLDER}\" could not be created ({reason}), "
+        f"nothing archived: the emails would be deleted for good.\n")
+    return None
+
+
+def archive_mailbox(mail, matcher, archive_date, log, cancelled=lambda: False, action=None, by_conversation=True,
+                    progress=None, journal=None, metadata_rules=(), folder="INBOX", pipeline_depth=PIPELINE_DEPTH):
+    if not matcher and not metadata_rules:
+        log("No keywords, senders or rules selected!\n")
+        return None
+
+    result, data = mail.select(quote_mailbox(folder))
+    if result != 'OK':
+        log(f"No messages found in {folder}!\n")
+        return None
+
+    gmail = action is None and is_gmail(mail)
+    if action is None and not gmail:
+        archive_folder = find_archive_folder(mail, log)
+        if archive_folder is None:
+            return None
+        action = ArchiveAction(archive_folder)
+    if action is not None and action.kind == DELETE:
+        # Flagging \Deleted and expunging would leave nothing on the server for the journal to restore
+        log("Archiving without an archive folder would delete the emails for good, nothing archived.\n")
+        return None
+
+    message_count = int(data[0] or 0)
+    reconnects_start = reconnect_count(mail)
+    transfer = transfer_stats(mail)
+    transfer_start = transfer.copy() if transfer else None
+    own_journal = journal is None
+    if own_journal:
+        journal = ActionJournal()
+        log(f"Recording archived messages in {journal.path}\n")
+        matcher.sender_index.log_dropped(log)
+    folder_journal = journal.for_folder(mail, folder)
+    # The messages the search will scan, not the whole folder: None when the server can't count them
+    search_count = count_messages(mail, since_criteria(archive_date), None)
+    if progress and matcher:
+        progress.set_total(message_count if search_count is None else search_count)
+
+    window_sizes = collections.deque()
+    # Rule matches are gone or flagged \Deleted by the time the windows are searched
+    uid_windows = count_windows(iter_uid_windows(mail, f"UNDELETED {since_criteria(archive_date)}"), window_sizes)
+    if gmail:
+        # Gmail: a match archives its whole X-GM-THRID thread, one MOVE per batch
+        action = GmailBackend(mail, folder=folder)
+        uid_windows = action.thread_windows(mail, uid_windows)
+        log("Using Gmail thread-level archiving.\n")
+    elif by_conversation:
+        # Other servers: group by References / In-Reply-To, a match archives the whole conversation
+        action = ConversationAction(action)
+        uid_windows = action.thread_windows(mail, uid_windows)
+    pipeline = ArchivePipeline(mail, matcher, log, cancelled, action, progress=progress, journal=folder_journal,
+                               pipeline_depth=pipeline_depth)
+    try:
+        if metadata_rules:
+            # Rules without older: stay inside the date range the run was asked to archive, like the keyword rules
+            matched = find_rule_matches(mail, metadata_rules, log, cancelled, since_criteria(archive_date))
+            log(f"Size and attachment rules matched {len(matched)} emails on the server.\n")
+            pipeline.archive_rule_matches(matched)
+        if not matcher:
+            # Rules only, nothing left that needs message bodies
+            uid_windows, search_count = (), 0
+        summary = pipeline.run(uid_windows, search_count, window_sizes)
+        if transfer:
+            summary.compression = transfer.since(transfer_start)
+        summary.reconnects = reconnect_count(mail) - reconnects_start
+        return summary
+    finally:
+        if own_journal:
+            journal.close()
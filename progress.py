@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+
+PROGRESS_INTERVAL = 0.5  # Minimum seconds between progress emissions
+
+
+def eta_seconds(done, total, rate):
+    if rate <= 0 or total <= done:
+        return 0.0
+    return (total - done) / rate
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_progress(done, total, num_bytes, rate):
+    return (f"{done:,} / {total:,} messages, {num_bytes / 1048576:.1f} MB, {rate:.0f} msg/s, "
+            f"ETA {format_duration(eta_seconds(done, total, rate))}")
+
+
+def progress_line(done, total, num_bytes, rate):
+    # Machine-readable form for headless runs
+    return "PROGRESS " + json.dumps({"done": done, "total": total, "bytes": num_bytes, "rate": round(rate, 1),
+                                     "eta": round(eta_seconds(done, total, rate), 1)}) + "\n"
+
+
+class ProgressTracker:
+    # advance() is a couple of additions and a clock read; the callback only runs
+    # once per PROGRESS_INTERVAL, so it is safe to call from hot loops.
+    def __init__(self, emit, total=0, interval=PROGRESS_INTERVAL):
+        self.emit = emit
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.next_emit = self.started + interval
+
+    def set_total(self, total):
+        self.total = total
+
+    def advance(self, count, num_bytes=0):
+        self.done += count
+        self.bytes += num_bytes
+        now = time.monotonic()
+        if now >= self.next_emit:
+            self.next_emit = now + self.interval
+            self._emit(now)
+
+    def finish(self):
+        self.total = max(self.total, round(self.done))
+        self._emit(time.monotonic())
+
+    def _emit(self, now):
+        elapsed = now - self.started
+        done = round(self.done)
+        self.emit(done, max(self.total, done), self.bytes, done / elapsed if elapsed > 0 else 0.0)
+
+
+class ProgressGroup:
+    # One tracker fed by scans running on several threads at once, each through its own part
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.lock = threading.Lock()
+
+    def part(self):
+        return ProgressPart(self)
+
+
+class ProgressPart:
+    # Stands in for the tracker in one scan: totals add up across parts, and finish()
+    # settles only this part's total so the group's tracker is finished once by its owner
+    def __init__(self, group):
+        self.group = group
+        self.total = 0
+        self.done = 0
+
+    def set_total(self, total):
+        with self.group.lock:
+            tracker = self.group.tracker
+            tracker.set_total(tracker.total - self.total + total)
+            self.total = total
+
+    def advance(self, count, num_bytes=0):
+        with self.group.lock:
+            self.done += count
+            self.group.tracker.advance(count, num_bytes)
+
+    def finish(self):
+        self.set_total(max(self.total, round(self.done)))
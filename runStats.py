@@ -0,0 +1,83 @@
+import sys
+import threading
+
+from progress import format_duration
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def format_peak_rss():
+    peak = peak_rss_mb()
+    return f"Peak memory: {peak:.0f} MB\n" if peak is not None else ""
+
+
+class ByteBudget:
+    # Caps the bytes held between stages. A single oversized item is still let
+    # through when nothing else is in flight, so the pipeline cannot stall.
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        with self.condition:
+            while self.in_flight and self.in_flight + size > self.limit:
+                self.condition.wait()
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+class TransferStats:
+    # Bytes on one connection before and after COMPRESS=DEFLATE (see imapConnection)
+    def __init__(self, raw_in=0, wire_in=0, raw_out=0, wire_out=0, read_seconds=0.0):
+        self.raw_in = raw_in
+        self.wire_in = wire_in
+        self.raw_out = raw_out
+        self.wire_out = wire_out
+        self.read_seconds = read_seconds  # Time spent waiting for compressed bytes
+
+    def copy(self):
+        return TransferStats(self.raw_in, self.wire_in, self.raw_out, self.wire_out, self.read_seconds)
+
+    def since(self, start):
+        return TransferStats(self.raw_in - start.raw_in, self.wire_in - start.wire_in, self.raw_out - start.raw_out,
+                             self.wire_out - start.wire_out, self.read_seconds - start.read_seconds)
+
+    def add(self, other):
+        self.raw_in += other.raw_in
+        self.wire_in += other.wire_in
+        self.raw_out += other.raw_out
+        self.wire_out += other.wire_out
+        self.read_seconds += other.read_seconds
+
+    def ratio(self):
+        return self.raw_in / self.wire_in if self.wire_in else 1.0
+
+    def seconds_saved(self):
+        # What the bytes compression saved would have taken at the rate the compressed ones arrived
+        if not self.wire_in or self.read_seconds <= 0:
+            return 0.0
+        return (self.raw_in - self.wire_in) * self.read_seconds / self.wire_in
+
+    def format(self):
+        if not self.wire_in:
+            return ""
+        return (f"Compression: {self.raw_in / 1048576:.1f} MB received as {self.wire_in / 1048576:.1f} MB "
+                f"({self.ratio():.1f}x), about {format_duration(self.seconds_saved())} saved\n")
@@ -0,0 +1,66 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+
+from fileUtils import atomic_write
+
+SENDER_CACHE_DIR = "sender_cache"
+SNAPSHOT_VERSION = 2
+
+
+def account_key(account):
+    # Names files per mailbox without putting the address on disk in clear
+    imap_server, _, username, _ = account
+    return hashlib.sha1(f"{imap_server.lower()}|{username.lower()}".encode()).hexdigest()[:16]
+
+
+def snapshot_path(account, directory=SENDER_CACHE_DIR):
+    return os.path.join(directory, f"senders-{account_key(account)}.json.gz")
+
+
+class SenderSnapshot:
+    def __init__(self, since, folders=None, senders=None):
+        self.since = since              # Date the collection counted messages from
+        self.folders = folders or {}    # Folder -> [UIDVALIDITY, UIDNEXT], every UID below UIDNEXT is counted
+        self.senders = senders or {}    # Sender -> [count, size, last_seen]
+
+    def rows(self):
+        return [(sender, *stats) for sender, stats in self.senders.items()]
+
+    def uid_start(self, folder):
+        return self.folders.get(folder, (None, 1))[1]
+
+    def matches(self, statuses):
+        # statuses maps folder -> STATUS items. A new UIDVALIDITY renumbers a folder, its
+        # high-water mark means nothing after that.
+        return all(uidvalidity is not None and statuses[folder].get("UIDVALIDITY") == uidvalidity
+                   for folder, (uidvalidity, _) in self.folders.items() if folder in statuses)
+
+
+def load_snapshot(account, directory=SENDER_CACHE_DIR):
+    try:
+        with gzip.open(snapshot_path(account, directory), "rt", encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError, EOFError):
+        return None
+    if data.get("version") == 1:
+        # Inbox-only snapshots from before folder scanning
+        data["folders"] = {"INBOX": [data["uidvalidity"], data["uid_next"]]}
+    elif data.get("version") != SNAPSHOT_VERSION:
+        return None
+    # Rows are stored as flat lists, which is about half the size of one object per sender
+    senders = {row[0]: row[1:] for row in data["senders"]}
+    return SenderSnapshot(datetime.date.fromisoformat(data["since"]), data["folders"], senders)
+
+
+def save_snapshot(account, snapshot, directory=SENDER_CACHE_DIR):
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "since": snapshot.since.isoformat(),
+        "folders": snapshot.folders,
+        "senders": [list(row) for row in snapshot.rows()],
+    }
+    payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    atomic_write(snapshot_path(account, directory), gzip.compress(payload))
@@ -0,0 +1,74 @@
+import sys
+from email.utils import getaddresses
+
+
+def normalize_address(address):
+    return sys.intern(address.strip().lower())
+
+
+def parse_addresses(header):
+    # Parse a From-style header into normalized addresses, dropping display names
+    return [normalize_address(address) for _, address in getaddresses([header]) if "@" in address]
+
+
+def sender_address(header):
+    if not header:
+        return None
+    addresses = parse_addresses(header)
+    return addresses[0] if addresses else None
+
+
+class SenderIndex:
+    # Hash sets of selected addresses and wildcard domains, so checking a sender
+    # costs the same no matter how many senders are selected.
+    def __init__(self, rules=()):
+        self.addresses = set()
+        self.domains = set()
+        # Rules that are neither an address nor *@domain, reported by log_dropped()
+        self.dropped = []
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def from_sets(cls, addresses, domains, dropped=()):
+        index = cls()
+        index.addresses = {sys.intern(address) for address in addresses}
+        index.domains = {sys.intern(domain) for domain in domains}
+        index.dropped = list(dropped)
+        return index
+
+    def add(self, rule):
+        text = rule.strip().lower()
+        if not text:
+            return
+        if text.startswith("*@") or text.startswith("@"):
+            domain = text.split("@", 1)[1]
+            if domain:
+                self.domains.add(sys.intern(domain))
+            else:
+                self.dropped.append(rule)
+            return
+        addresses = parse_addresses(text)
+        if not addresses:
+            # Plain names used to match as substrings of the From header, they match nothing now
+            self.dropped.append(rule)
+        self.addresses.update(addresses)
+
+    def log_dropped(self, log):
+        if self.dropped:
+            log(f"Ignored {len(self.dropped)} sender rules that are not an address or *@domain: "
+                f"{', '.join(self.dropped)}\n")
+
+    def matches(self, header):
+        if not header:
+            return False
+        for address in parse_addresses(header):
+            if address in self.addresses or address.rsplit("@", 1)[1] in self.domains:
+                return True
+        return False
+
+    def __bool__(self):
+        return bool(self.addresses or self.domains)
+
+    def __len__(self):
+        return len(self.addresses) + len(self.domains)
@@ -0,0 +1,150 @@
+import datetime
+import threading
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+
+SENDER_COLUMN, COUNT_COLUMN, SIZE_COLUMN, LAST_SEEN_COLUMN = range(4)
+HEADERS = ["Sender", "Count", "Size", "Last Seen"]
+SORT_ROLE = Qt.UserRole
+SENDER_BATCH_SIZE = 500  # Number of changed senders per streamed batch
+
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
+class SenderCollector:
+    # Aggregates per-sender stats and hands out the changed rows in batches,
+    # so the sender list can fill in while collection is still running.
+    # Folders scanned in parallel share one collector.
+    def __init__(self, batch_size=SENDER_BATCH_SIZE, senders=None):
+        self.batch_size = batch_size
+        self.senders = senders if senders is not None else {}  # Seeded from a snapshot for delta scans
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def add(self, sender, size, timestamp):
+        with self.lock:
+            stats = self.senders.get(sender)
+            if stats is None:
+                stats = self.senders[sender] = [0, 0, 0.0]
+            stats[0] += 1
+            stats[1] += size
+            if timestamp > stats[2]:
+                stats[2] = timestamp
+            self.pending.add(sender)
+            return len(self.pending) >= self.batch_size
+
+    def take_batch(self):
+        with self.lock:
+            rows = [(sender, *self.senders[sender]) for sender in self.pending]
+            self.pending.clear()
+        return rows
+
+
+class SenderTableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._senders = []      # Sender per row, in insertion order
+        self._search_keys = []  # Lower-cased sender per row, used by the filter
+        self._stats = []        # [count, size, last_seen] per row
+        self._rows = {}         # Sender -> row
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._senders)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+
+        # Rows are only rendered when the view asks for them
+        if role == Qt.DisplayRole:
+            if column == SENDER_COLUMN:
+                return self._senders[row]
+            count, size, last_seen = self._stats[row]
+            if column == COUNT_COLUMN:
+                return str(count)
+            if column == SIZE_COLUMN:
+                return format_size(size)
+            if last_seen:
+                return datetime.datetime.fromtimestamp(last_seen).strftime("%Y-%m-%d %H:%M")
+            return ""
+        if role == SORT_ROLE:
+            if column == SENDER_COLUMN:
+                return self._search_keys[row]
+            return self._stats[row][column - 1]
+        if role == Qt.TextAlignmentRole and column != SENDER_COLUMN:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[section]
+        return None
+
+    def sender_at(self, row):
+        return self._senders[row]
+
+    def search_key(self, row):
+        return self._search_keys[row]
+
+    def clear(self):
+        self.beginResetModel()
+        self._senders = []
+        self._search_keys = []
+        self._stats = []
+        self._rows = {}
+        self.endResetModel()
+
+    def upsert_senders(self, rows):
+        new_rows = []
+        first_changed = last_changed = None
+
+        for sender, count, size, last_seen in rows:
+            row = self._rows.get(sender)
+            if row is None:
+                new_rows.append((sender, [count, size, last_seen]))
+                continue
+            self._stats[row] = [count, size, last_seen]
+            first_changed = row if first_changed is None else min(first_changed, row)
+            last_changed = row if last_changed is None else max(last_changed, row)
+
+        if first_changed is not None:
+            self.dataChanged.emit(self.index(first_changed, COUNT_COLUMN),
+                                  self.index(last_changed, LAST_SEEN_COLUMN))
+
+        # Append new senders in one insertion so the view updates once per batch
+        if new_rows:
+            first = len(self._senders)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+            for sender, stats in new_rows:
+                self._rows[sender] = len(self._senders)
+                self._senders.append(sender)
+                self._search_keys.append(sender.lower())
+                self._stats.append(stats)
+            self.endInsertRows()
+
+
+class SenderFilterProxyModel(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._needle = ""
+        self.setSortRole(SORT_ROLE)
+        self.setDynamicSortFilter(True)
+
+    def set_filter_text(self, text):
+        needle = text.strip().lower()
+        if needle != self._needle:
+            self._needle = needle
+            self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        # Match against the model's pre-lowered keys instead of formatting every cell
+        return not self._needle or self._needle in self.sourceModel().search_key(source_row)
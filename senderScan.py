@@ -0,0 +1,70 @@
+import email
+
+from imapConnection import transfer_stats
+from imapPipeline import pipelined_uid
+from imapUtils import (chunked, count_messages, fetch_internaldate, fetch_number, imap_date, iter_fetch_responses,
+                       iter_uid_windows, quote_mailbox, selected_uid_next, selected_uidvalidity, uid_set)
+from progress import ProgressTracker
+from runStats import format_peak_rss
+from senderIndex import sender_address
+
+HEADER_BATCH_SIZE = 500  # Messages per header-only UID FETCH
+SENDER_FETCH = "(UID RFC822.SIZE INTERNALDATE BODY.PEEK[HEADER.FIELDS (FROM)])"
+
+
+def scan_senders(mail, archive_date, collector, on_batch, log, cancelled=lambda: False, progress=None, uid_start=1,
+                 folder="INBOX"):
+    # Walk the folder in UID windows and fetch only the From header, size and date.
+    # uid_start skips UIDs a previous scan already counted. Returns (UIDVALIDITY, UIDNEXT)
+    # of the scanned range, or None when the scan did not complete.
+    result, data = mail.select(quote_mailbox(folder), readonly=True)
+    if result != 'OK':
+        log(f"No messages found in {folder}!\n")
+        return None
+
+    uidvalidity = selected_uidvalidity(mail)
+    uid_next = selected_uid_next(mail)
+    criteria = f'SINCE "{imap_date(archive_date)}"'
+    transfer = transfer_stats(mail)
+    transfer_start = transfer.copy() if transfer else None
+    progress = progress or ProgressTracker(lambda *args: None)
+    if uid_start >= uid_next:
+        progress.set_total(0)
+    elif uid_start > 1:
+        progress.set_total(count_messages(mail, f"UID {uid_start}:{uid_next - 1} {criteria}",
+                                          min(int(data[0] or 0), uid_next - uid_start)))
+    else:
+        progress.set_total(count_messages(mail, criteria, int(data[0] or 0)))
+
+    for uids in iter_uid_windows(mail, criteria, uid_next=uid_next, uid_start=uid_start):
+        commands = ((chunk, ('FETCH', uid_set(chunk), SENDER_FETCH)) for chunk in chunked(uids, HEADER_BATCH_SIZE))
+        for chunk, result, data in pipelined_uid(mail, commands):
+            if cancelled():
+                log("Collecting senders cancelled.\n")
+                on_batch(collector.take_batch())
+                return None
+            try:
+                if result != 'OK':
+                    log(f"ERROR getting messages {uid_set(chunk)}\n")
+                    progress.advance(len(chunk))
+                    continue
+                fetched = 0
+                for uid, meta, literals in iter_fetch_responses(data):
+                    if not literals:
+                        continue
+                    sender = sender_address(email.message_from_bytes(literals[0]).get("From"))
+                    size = fetch_number(meta, "RFC822.SIZE") or 0
+                    fetched += len(literals[0])
+                    if sender and collector.add(sender, size, fetch_internaldate(meta)):
+                        # Stream partial results so the sender list fills in while collecting
+                        on_batch(collector.take_batch())
+                progress.advance(len(chunk), fetched)
+            except Exception as e:
+                log(f"Exception occurred: {str(e)}\n")
+
+    on_batch(collector.take_batch())
+    progress.finish()
+    log(format_peak_rss())
+    if transfer:
+        log(transfer.since(transfer_start).format())
+    return uidvalidity, uid_next
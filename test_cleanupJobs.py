@@ -0,0 +1,74 @@
+import datetime
+
+import cleanupJobs
+from cleanupJobs import DRAFTS, JUNK, TRASH, CleanupJob, run_cleanup, run_cleanup_jobs
+from conftest import CAPABILITIES, make_message
+
+OLD = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+NEW = datetime.datetime.now(datetime.timezone.utc)
+
+
+def fill_trash(server):
+    trash = server.add_mailbox("Trash", TRASH)
+    for number in range(5):
+        trash.add(make_message(subject=f"Old {number}"), date=OLD)
+    trash.add(make_message(subject="Recent"), date=NEW)
+    # Flagged by someone else, only our own messages may be expunged
+    trash.add(make_message(subject="Pending"), date=NEW, flags=["\\Deleted"])
+    return trash
+
+
+def subjects(mailbox):
+    return [message.headers["Subject"] for message in mailbox.messages]
+
+
+def test_search_criteria():
+    assert CleanupJob().search_criteria() is None
+    assert CleanupJob(older_than_days=30, larger_than=1024.0).search_criteria().endswith(' LARGER 1024)')
+    assert CleanupJob(older_than_days=30).search_criteria().startswith('(BEFORE "')
+    assert CleanupJob(JUNK).name == "Junk"
+    assert CleanupJob(folder="Old stuff").name == "Old stuff"
+
+
+def test_uid_expunge_removes_only_matching_chunks(imap_server, monkeypatch):
+    monkeypatch.setattr(cleanupJobs, "CLEANUP_CHUNK_SIZE", 2)
+    trash = fill_trash(imap_server)
+    mail = imap_server.connect()
+    assert run_cleanup(mail, CleanupJob(TRASH, older_than_days=30), print) == 5
+    assert subjects(trash) == ["Recent", "Pending"]
+    assert imap_server.ran("UID STORE") == 3
+    assert imap_server.ran("UID EXPUNGE") == 3
+    assert imap_server.ran("EXPUNGE") == 0
+
+
+def test_expunge_once_without_uidplus(imap_server):
+    imap_server.capabilities = tuple(c for c in CAPABILITIES if c != "UIDPLUS")
+    trash = fill_trash(imap_server)
+    mail = imap_server.connect()
+    assert run_cleanup(mail, CleanupJob(TRASH, older_than_days=30), print) == 5
+    # A plain EXPUNGE also takes the messages flagged before the job ran
+    assert subjects(trash) == ["Recent"]
+    assert imap_server.ran("EXPUNGE") == 1
+    assert imap_server.ran("UID EXPUNGE") == 0
+
+
+def test_unfiltered_job_empties_the_folder(imap_server):
+    trash = fill_trash(imap_server)
+    imap_server.add_mailbox("Drafts", DRAFTS)
+    mail = imap_server.connect()
+    results = run_cleanup_jobs(mail, [CleanupJob(TRASH), CleanupJob(DRAFTS)], print)
+    assert results == {"Trash": 7, "Drafts": 0}
+    assert trash.messages == []
+    # One ranged STORE for the whole folder, nothing sent for the empty one
+    assert imap_server.ran("STORE") == 1
+    assert imap_server.ran("UID SEARCH") == 0
+
+
+def test_missing_folder_and_cancel(imap_server):
+    trash = fill_trash(imap_server)
+    mail = imap_server.connect()
+    logged = []
+    assert run_cleanup(mail, CleanupJob(JUNK), logged.append) == 0
+    assert logged == ["No Junk folder found!\n"]
+    assert run_cleanup(mail, CleanupJob(TRASH, older_than_days=30), logged.append, cancelled=lambda: True) == 0
+    assert len(trash.messages) == 7
@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+import fileUtils
+from configStore import ConfigStore
+from fileUtils import atomic_write
+
+
+def test_save_compiles_rules(tmp_path):
+    store = ConfigStore(str(tmp_path / "configurations.json"))
+    store.save("work", {"keywords": "Sale, unsubscribe", "senders": ["*@Shop.example"], "metadata_rules": "larger:1MB"})
+    rules = store.rules("work")
+    assert [keyword for keyword, _ in rules["keywords"]] == ["Sale", "unsubscribe"]
+    assert rules["domains"] == ["shop.example"]
+    assert len(rules["metadata_rules"]) == 1
+    assert ConfigStore(store.path).names() == ["work"]
+
+
+def test_external_edit_is_picked_up(tmp_path):
+    path = tmp_path / "configurations.json"
+    store = ConfigStore(str(path))
+    store.save("work", {"keywords": "sale"})
+    path.write_text(json.dumps({"home": {"keywords": "offer"}}))
+    os.utime(path, ns=(1, 1))
+    assert store.names() == ["home"]
+    # Written by hand without compiled rules, they are rebuilt on first use
+    assert [keyword for keyword, _ in store.rules("home")["keywords"]] == ["offer"]
+
+
+def test_failed_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "configurations.json"
+    atomic_write(str(path), b"old")
+
+    def fail(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(fileUtils.os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write(str(path), b"new")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["configurations.json"]
+
+
+def test_atomic_write_creates_the_directory(tmp_path):
+    path = tmp_path / "state" / "folders"
+    atomic_write(str(path), b"data")
+    assert path.read_bytes() == b"data"
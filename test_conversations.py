@@ -0,0 +1,119 @@
+import datetime
+import functools
+
+import imapUtils
+import pipeline
+from conftest import CAPABILITIES, make_message
+from conversations import ConversationAction, ConversationIndex, ConversationSet
+from matcher import MessageMatcher
+from pipeline import ArchiveAction, archive_mailbox
+
+ARCHIVE_DATE = datetime.date(2023, 12, 1)
+
+
+def headers(message_id, references=""):
+    return f"Message-ID: <{message_id}>\r\nReferences: {references}\r\n\r\n".encode()
+
+
+def test_index_joins_replies_and_forwards():
+    index = ConversationIndex()
+    first = index.add(1, headers("a@x"))
+    # 3 refers to a message the mailbox does not have, 4 links it back to the first thread
+    second = index.add(2, headers("b@x", "<a@x>"))
+    third = index.add(3, headers("c@x", "<missing@x>"))
+    fourth = index.add(4, headers("d@x", "<missing@x> <b@x>"))
+    other = index.add(5, headers("e@x"))
+    assert len({index.find(key) for key in (first, second, third, fourth)}) == 1
+    assert index.find(other) != index.find(first)
+    # No Message-ID at all is a conversation of its own
+    assert index.add(6, b"Subject: hi\r\n\r\n") == "uid:6"
+
+
+def test_any_member_match_acts_on_the_whole_conversation_once():
+    conversations = ConversationSet()
+    for uid, key in ((1, "a"), (2, "b"), (3, "a"), (4, "a")):
+        conversations.add(uid, key)
+    assert conversations.members([3]) == {1: 3, 3: 3, 4: 3}
+    assert sorted(conversations.take([3])) == [1, 3, 4]
+    # Later matches of the same conversation have nothing left to do
+    assert conversations.take([1, 4]) == []
+    assert conversations.take([2, 9]) == [2, 9]
+
+
+def test_late_members_follow_without_being_fetched():
+    conversations = ConversationSet()
+    conversations.add(1, "a")
+    conversations.add(2, "b")
+    conversations.take([1])
+    conversations.add(3, "a")
+    conversations.add(4, "c")
+    assert conversations.pending([b"3", b"4", b"5"]) == [b"4", b"5"]
+    assert conversations.take_followers() == [3] and conversations.take_followers() == []
+    assert conversations.members([3]) == {3: 3}
+    assert conversations.take([3]) == [3]
+    assert conversations.members([3]) == {}
+
+    # A reply joins the done conversation "a" with "c": 4 follows it
+    conversations.merge("a", "c")
+    assert conversations.take_followers() == [4]
+    # ...and the other way round, "b" joining a done conversation makes it done
+    conversations.merge("b", "a")
+    assert conversations.take_followers() == [2]
+    assert conversations.pending([b"1", b"2", b"3", b"4"]) == []
+
+
+def thread_server(server):
+    inbox = server.mailboxes["INBOX"]
+    inbox.add(make_message(subject="Spring sale", message_id="<a@shop>"))
+    inbox.add(make_message(subject="Lunch?", message_id="<b@friend>"))
+    inbox.add(make_message(subject="Lunch? Sure", message_id="<c@me>", references="<b@friend>"))
+    inbox.add(make_message(subject="When does it start?", message_id="<d@me>", references="<a@shop>"))
+    server.add_mailbox("Archive", "\\Archive")
+    return inbox
+
+
+def test_conversation_across_a_window_boundary(imap_server):
+    thread_server(imap_server)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    action = ConversationAction(ArchiveAction("Archive"))
+    windows = list(action.thread_windows(mail, [[b"1", b"2"], [b"3", b"4"]]))
+    assert windows == [[b"1", b"2"], [b"3", b"4"]]
+    # UID 1 is matched in the first window, its reply 4 sits in the second
+    assert action.members([1]) == {1: 1, 4: 1}
+    assert action.apply(mail, [1]) == 2
+    assert action.apply(mail, [4]) == 0
+    assert sorted(message.headers["Subject"] for message in imap_server.mailboxes["Archive"].messages) == [
+        "Spring sale", "When does it start?"]
+
+
+def test_windows_stream_and_skip_decided_conversations(imap_server):
+    thread_server(imap_server)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    action = ConversationAction(ArchiveAction("Archive"))
+    windows = action.thread_windows(mail, iter([[b"1", b"2"], [b"3", b"4"]]))
+    assert next(windows) == [b"1", b"2"]
+    # The second window's headers are only read once it is asked for
+    assert imap_server.ran("UID FETCH") == 1
+    assert action.apply(mail, [1]) == 1
+    # 4 replies to the archived 1: it is not fetched, it follows its conversation
+    assert next(windows) == [b"3"]
+    assert action.take_followers() == [4]
+    assert action.members([4]) == {4: 4}
+    assert action.apply(mail, [4]) == 1
+    assert next(windows, None) is None
+    assert sorted(message.headers["Subject"] for message in imap_server.mailboxes["Archive"].messages) == [
+        "Spring sale", "When does it start?"]
+
+
+def test_archive_matches_any_member(imap_server, monkeypatch):
+    # Two UIDs per search window, so the sale thread (UIDs 1 and 4) spans two windows and
+    # only its oldest message matches
+    imap_server.capabilities = tuple(c for c in CAPABILITIES if c != "MOVE")
+    inbox = thread_server(imap_server)
+    monkeypatch.setattr(pipeline, "iter_uid_windows", functools.partial(imapUtils.iter_uid_windows, window=2))
+    mail = imap_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, lambda text: None)
+    assert summary.archived == 2
+    assert sorted(message.headers["Subject"] for message in inbox.messages) == ["Lunch?", "Lunch? Sure"]
@@ -0,0 +1,82 @@
+import datetime
+import random
+
+import pytest
+
+import estimator
+from conftest import make_message
+from estimator import estimate_matches, sample_uids, wilson_interval
+from matcher import MessageMatcher
+
+OLD = datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc)
+NEW = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+SINCE = 'SINCE "1-Jan-2024"'
+
+
+def quiet(text):
+    pass
+
+
+def test_wilson_interval():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    low, high = wilson_interval(50, 100)
+    assert low == pytest.approx(0.4038, abs=1e-4) and high == pytest.approx(0.5962, abs=1e-4)
+    # No hits still leaves room above zero, all hits below one
+    low, high = wilson_interval(0, 400)
+    assert low == 0.0 and high == pytest.approx(1.96 ** 2 / (400 + 1.96 ** 2), abs=1e-9)
+    assert wilson_interval(400, 400) == pytest.approx((1 - high, 1.0))
+    low, high = wilson_interval(3, 40)
+    assert (low, high) == pytest.approx(tuple(1 - bound for bound in reversed(wilson_interval(37, 40))))
+    assert wilson_interval(3, 4000)[1] - wilson_interval(3, 4000)[0] < high - low
+
+
+def test_small_folders_are_searched_in_one_go(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    for number in range(30):
+        inbox.add(make_message(subject=f"Message {number}"), date=NEW if number % 3 else OLD)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    sample, population = sample_uids(mail, SINCE, 10, inbox.uidnext, random.Random(1))
+    assert population == 20 and len(set(sample)) == 10
+    assert all(inbox.by_uid(uid).date == NEW for uid in sample)
+    sample, population = sample_uids(mail, SINCE, 100, inbox.uidnext, random.Random(1))
+    assert sorted(sample) == [uid for uid in inbox.uids() if uid % 3 != 1] and population == 20
+    assert imap_server.ran("UID SEARCH") == 2
+
+
+def test_sparse_uid_ranges_are_sampled(imap_server, monkeypatch):
+    monkeypatch.setattr(estimator, "MAX_CANDIDATES", 300)
+    monkeypatch.setattr(estimator, "CANDIDATE_CHUNK", 100)
+    inbox = imap_server.mailboxes["INBOX"]
+    # 400 messages spread over UIDs 1..4000, every other one in range of the search
+    for number in range(400):
+        inbox.uidnext = number * 10 + 1
+        inbox.add(make_message(subject=f"Message {number}"), date=NEW if number % 2 else OLD)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    sample, population = sample_uids(mail, SINCE, 20, inbox.uidnext, random.Random(7))
+    assert len(set(sample)) == 20
+    assert all(inbox.by_uid(uid) is not None and inbox.by_uid(uid).date == NEW for uid in sample)
+    # Scaled up from the share of random UIDs that hit, never a listing of the folder
+    assert 100 <= population <= 400
+    searches = [arguments for command, arguments in imap_server.commands if command == "UID SEARCH"]
+    assert searches and all(len(arguments) < 1000 for arguments in searches)
+
+    assert sample_uids(mail, SINCE, 20, inbox.uidnext, random.Random(7), cancelled=lambda: True) == ([], 0)
+
+
+def test_estimate_covers_the_whole_population(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    inbox.add(make_message(subject="Big sale"), date=NEW)
+    inbox.add(make_message(body="A sale inside"), date=NEW)
+    inbox.add(make_message(sender="deals@shop.example"), date=NEW)
+    inbox.add(make_message(subject="Old sale"), date=OLD)
+    inbox.add(make_message(subject="Nothing"), date=NEW)
+    estimate = estimate_matches(imap_server.connect(), MessageMatcher(["sale"], ["*@shop.example"]),
+                                datetime.date(2024, 1, 1), quiet, rng=random.Random(3))
+    assert (estimate.population, estimate.sample_size, estimate.hits) == (4, 4, 3)
+    assert estimate.keyword_hits == {"sale": 2} and estimate.sender_hits == 1
+    assert estimate.scaled(estimate.hits)[0] == 3
+    assert "~3 of 4 messages" in estimate.format()
+    # A sample only reads messages, it never marks them \Seen
+    assert not any("\\Seen" in message.flags for message in inbox.messages)
@@ -0,0 +1,122 @@
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from analytics import ANALYTICS_FETCH, analyze_mailbox
+from conftest import make_message
+from fetchParser import envelope_sender, fetch_attributes, has_attachment, parse_group, tokenize
+from imapUtils import iter_fetch_groups
+
+
+def quiet(text):
+    pass
+
+
+def multipart_message(subject="Invoice", message_id=None):
+    # mixed( alternative( plain, html ), pdf attachment )
+    message = MIMEMultipart("mixed")
+    message["From"] = '"Billing Dept" <Billing@Shop.Example>'
+    message["To"] = "me@example.com, Other <other@example.com>"
+    message["Subject"] = subject
+    if message_id:
+        message["Message-ID"] = message_id
+    body = MIMEMultipart("alternative")
+    body.attach(MIMEText("Your invoice", "plain"))
+    body.attach(MIMEText("<p>Your invoice</p>", "html"))
+    message.attach(body)
+    message.attach(MIMEApplication(b"%PDF-1.4 fake", "pdf", Name="invoice.pdf"))
+    message.get_payload()[1].add_header("Content-Disposition", "attachment", filename="invoice.pdf")
+    return message.as_bytes().replace(b"\n", b"\r\n")
+
+
+def fetch_groups(imap_server, query="(UID ENVELOPE BODYSTRUCTURE)"):
+    mail = imap_server.connect()
+    mail.select("INBOX", readonly=True)
+    result, data = mail.uid("FETCH", "1:*", query)
+    assert result == "OK"
+    return [fetch_attributes(group) for group in iter_fetch_groups(data)]
+
+
+def test_tokenizer():
+    assert parse_group([b'1 (UID 7 FLAGS (\\Seen) X NIL Y "a \\"quoted\\" \\\\ string" Z ())']) == [
+        b"1", [b"UID", b"7", b"FLAGS", [b"\\Seen"], b"X", None, b"Y", b'a "quoted" \\ string', b"Z", []]]
+    # Sections stay one atom, brackets and all
+    assert tokenize(b"BODY[HEADER.FIELDS (FROM TO)]<0> nil") == [b"BODY[HEADER.FIELDS (FROM TO)]<0>", None]
+
+
+def test_literals_take_the_place_of_their_marker():
+    group = [(b'1 (UID 3 ENVELOPE (NIL {11}', b'Hi (there")'), (b' NIL {2}', b'\r\n'), b' "x") RFC822.SIZE 9)']
+    attributes = fetch_attributes(group)
+    assert attributes[b"ENVELOPE"] == [None, b'Hi (there")', None, b"\r\n", b"x"]
+    assert attributes[b"UID"] == b"3" and attributes[b"RFC822.SIZE"] == b"9"
+
+
+def test_unbalanced_input_still_parses():
+    assert parse_group([b"1 (UID 4 ENVELOPE (NIL"]) == [b"1", [b"UID", b"4", b"ENVELOPE", [None]]]
+    assert parse_group([b"1 (UID 4))"]) == [b"1", [b"UID", b"4"]]
+    assert fetch_attributes([b"* garbage"]) == {}
+
+
+def test_envelope_and_nested_bodystructure_from_the_server(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    inbox.add(multipart_message(subject='The "big" invoice', message_id='<"odd id"@shop.example>'))
+    inbox.add(make_message(sender="Plain Sender <plain@example.com>", subject="No parts"))
+    first, second = fetch_groups(imap_server)
+
+    envelope = first[b"ENVELOPE"]
+    # Subject and Message-ID came as literals, the Message-ID one right before the closing paren
+    assert envelope[1] == b'The "big" invoice' and envelope[9] == b'<"odd id"@shop.example>'
+    assert envelope[2] == [[b"Billing Dept", None, b"Billing", b"Shop.Example"]]
+    assert [address[2] for address in envelope[5]] == [b"me", b"other"]
+    assert envelope[6] is None and envelope[8] is None
+    assert envelope_sender(envelope) == "Billing@Shop.Example"
+
+    structure = first[b"BODYSTRUCTURE"]
+    alternative, attachment, subtype = structure[:3]
+    assert subtype == b"mixed"
+    assert [part[1] for part in alternative[:2]] == [b"plain", b"html"] and alternative[2] == b"alternative"
+    assert attachment[:2] == [b"application", b"pdf"]
+    assert attachment[-2] == [b"attachment", [b"filename", b"invoice.pdf"]]
+    assert has_attachment(structure)
+
+    assert envelope_sender(second[b"ENVELOPE"]) == "plain@example.com"
+    assert second[b"BODYSTRUCTURE"][:3] == [b"text", b"plain", [b"charset", b"utf-8"]]
+    assert not has_attachment(second[b"BODYSTRUCTURE"])
+
+
+def test_has_attachment():
+    assert has_attachment([[b"text", b"plain", None], [b"image", b"png", [b"NAME", b"logo.png"]], b"related"])
+    assert has_attachment([b"application", b"zip", None, None, None, b"base64", 10, None,
+                           [b"ATTACHMENT", None], None])
+    # Alternative bodies, charsets and file-like words inside longer values are not attachments
+    assert not has_attachment([[b"text", b"plain", [b"charset", b"utf-8"]],
+                               [b"text", b"html", [b"charset", b"utf-8"]], b"alternative"])
+    assert not has_attachment([b"text", b"plain", None, None, b"see the attachment", b"7bit", 5, 1])
+    assert not has_attachment(None) and not has_attachment(b"") and not has_attachment([])
+    assert not has_attachment(5)
+
+
+def test_envelope_sender_without_a_usable_address():
+    assert envelope_sender(None) is None
+    assert envelope_sender([None, None, None]) is None
+    assert envelope_sender([None, None, [[None, None, b"undisclosed-recipients", None]]]) is None
+    assert envelope_sender([None, None, [b"broken"]]) is None
+
+
+def test_analyze_mailbox_reads_only_metadata(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    inbox.add(multipart_message())
+    inbox.add(multipart_message(subject="Ünïcode subject"))
+    inbox.add(make_message(sender="news@club.example"))
+    inbox.add(make_message(sender="news@club.example"), flags=["\\Deleted"])
+
+    analytics = analyze_mailbox(imap_server.connect(), quiet)
+    assert len(analytics.store) == 4
+    rows = {row[0]: row[1] for row in analytics.sender_rows()}
+    assert rows == {"billing@shop.example": 2, "news@club.example": 2, "*@shop.example": 2, "*@club.example": 2}
+    report = analytics.format()
+    assert "with attachments: " in report and "in 2 emails" in report
+    # Nothing but the metadata items was asked for, so no message was marked \Seen
+    fetches = [arguments for command, arguments in imap_server.commands if command == "UID FETCH"]
+    assert fetches and all(ANALYTICS_FETCH in arguments for arguments in fetches)
+    assert not any("\\Seen" in message.flags for message in inbox.messages)
@@ -0,0 +1,48 @@
+import datetime
+
+import pytest
+
+from conftest import CAPABILITIES, make_message
+from folderScan import archive_folders, discover_folders
+from matcher import MessageMatcher
+
+ARCHIVE_DATE = datetime.date(2023, 12, 1)
+
+
+@pytest.mark.parametrize("capabilities", [CAPABILITIES, tuple(c for c in CAPABILITIES if c != "UNSELECT")])
+def test_archive_leaves_other_deleted_messages(imap_server, tmp_path, monkeypatch, capabilities):
+    monkeypatch.chdir(tmp_path)
+    imap_server.capabilities = capabilities
+    archive = imap_server.add_mailbox("Archive", "\\Archive")
+    projects = imap_server.add_mailbox("Projects")
+    for mailbox in (imap_server.mailboxes["INBOX"], projects):
+        mailbox.add(make_message(subject="Big sale today"))
+        mailbox.add(make_message(subject="Meeting notes"))
+        # Flagged for deletion by the user in another client, not by the archiver
+        mailbox.add(make_message(subject="Draft reply"), flags=["\\Deleted"])
+
+    mail = imap_server.connect()
+    summary = archive_folders(mail, None, mail.account, MessageMatcher(["sale"]), ARCHIVE_DATE, lambda text: None)
+
+    assert summary.archived == 2
+    assert len(archive.messages) == 2
+    for mailbox in (imap_server.mailboxes["INBOX"], projects):
+        subjects = sorted(message.headers["Subject"] for message in mailbox.messages)
+        assert subjects == ["Draft reply", "Meeting notes"]
+    assert imap_server.ran("CLOSE") == 0
+    assert imap_server.ran("UNSELECT" if "UNSELECT" in capabilities else "EXAMINE") == 2
+
+
+def test_gmail_runs_stay_on_the_inbox(gmail_server):
+    gmail_server.add_mailbox("Receipts")
+    gmail_server.add_mailbox("[Gmail]/Important", "\\Important")
+    mail = gmail_server.connect()
+    assert discover_folders(mail) == ["INBOX"]
+
+
+def test_folders_skip_special_use(imap_server):
+    imap_server.add_mailbox("Archive", "\\Archive")
+    imap_server.add_mailbox("Trash", "\\Trash")
+    imap_server.add_mailbox("Projects")
+    mail = imap_server.connect()
+    assert discover_folders(mail) == ["INBOX", "Projects"]
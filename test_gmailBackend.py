@@ -0,0 +1,66 @@
+import datetime
+
+from conftest import GMAIL_CAPABILITIES, make_message
+from gmailBackend import GmailBackend
+from matcher import MessageMatcher
+from pipeline import archive_mailbox
+
+ARCHIVE_DATE = datetime.date(2023, 12, 1)
+SALE_THREAD = 1700000000000000001
+LUNCH_THREAD = 1700000000000000002
+
+
+def fill(server):
+    inbox = server.mailboxes["INBOX"]
+    inbox.add(make_message(subject="Spring sale"), thread_id=SALE_THREAD)
+    inbox.add(make_message(subject="Lunch?"), thread_id=LUNCH_THREAD)
+    inbox.add(make_message(subject="When does it start?"), thread_id=SALE_THREAD)
+    inbox.add(make_message(subject="Sure"), thread_id=LUNCH_THREAD)
+    return inbox
+
+
+def test_thread_ids_group_across_windows(gmail_server):
+    fill(gmail_server)
+    mail = gmail_server.connect()
+    mail.select("INBOX")
+    backend = GmailBackend(mail)
+    assert backend.all_mail == "[Gmail]/All Mail"
+    assert list(backend.thread_windows(mail, [[b"1", b"2"], [b"3", b"4"]])) == [[b"1", b"2"], [b"3", b"4"]]
+    assert backend.members([1]) == {1: 1, 3: 1}
+    assert backend.members([4]) == {2: 4, 4: 4}
+
+
+def test_members_of_moved_threads_are_not_fetched(gmail_server):
+    inbox = fill(gmail_server)
+    mail = gmail_server.connect()
+    mail.select("INBOX")
+    backend = GmailBackend(mail)
+    windows = backend.thread_windows(mail, iter([[b"1", b"2"], [b"3", b"4"]]))
+    assert next(windows) == [b"1", b"2"]
+    assert gmail_server.ran("UID FETCH") == 1
+    assert backend.apply(mail, [1]) == 1
+    assert next(windows) == [b"4"]
+    assert backend.take_followers() == [3]
+    assert backend.apply(mail, [3]) == 1
+    assert sorted(message.headers["Subject"] for message in inbox.messages) == ["Lunch?", "Sure"]
+
+
+def test_older_member_match_archives_the_thread(gmail_server):
+    inbox = fill(gmail_server)
+    mail = gmail_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, lambda text: None)
+    assert summary.archived == 2
+    assert sorted(message.headers["Subject"] for message in inbox.messages) == ["Lunch?", "Sure"]
+    assert gmail_server.ran("UID MOVE") == 1
+
+
+def test_label_removal_without_move(gmail_server):
+    gmail_server.capabilities = tuple(c for c in GMAIL_CAPABILITIES if c != "MOVE")
+    inbox = fill(gmail_server)
+    for message in inbox.messages:
+        message.labels.add("\\Inbox")
+    mail = gmail_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, lambda text: None)
+    assert summary.archived == 2
+    unlabelled = sorted(message.headers["Subject"] for message in inbox.messages if "\\Inbox" not in message.labels)
+    assert unlabelled == ["Spring sale", "When does it start?"]
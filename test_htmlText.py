@@ -0,0 +1,37 @@
+from htmlText import HTML_FEED_SIZE, html_cache, scan_html
+from matcher import MessageMatcher
+
+SCANNER = MessageMatcher(["unsubscribe"]).scanner
+
+
+def padding(length):
+    # Many short text nodes, the shape that made every feed re-join everything before it
+    cells = "<td>filler</td>" * (length // 15)
+    return cells + "x" * (length - len(cells))
+
+
+def test_keyword_split_across_feeds_is_found():
+    for cut in range(1, len("unsubscribe")):
+        start = HTML_FEED_SIZE * 3 - cut
+        html = padding(start) + "unsubscribe" + padding(HTML_FEED_SIZE)
+        assert html.index("unsubscribe") == start
+        keyword, text = scan_html(html, SCANNER)
+        assert keyword == "unsubscribe"
+        assert text.startswith("filler filler")
+
+
+def test_keyword_in_markup_split_text_is_found():
+    html = padding(HTML_FEED_SIZE - 4) + "<p>un<b>sub</b>scribe</p>"
+    assert scan_html(html, SCANNER)[0] == "unsubscribe"
+
+
+def test_text_without_a_keyword_is_complete_and_cached():
+    html = "<style>.unsubscribe{}</style>" + padding(HTML_FEED_SIZE * 5) + "<p>the end</p>"
+    keyword, text = scan_html(html, SCANNER, "<no-keyword@example.com>")
+    assert keyword is None
+    assert text.endswith("filler xxxxx the end")
+    assert text.count("filler") == (HTML_FEED_SIZE * 5) // 15
+    assert html_cache.get("<no-keyword@example.com>") == text
+
+    scan_html(html, SCANNER, "<truncated@example.com>", complete=False)
+    assert html_cache.get("<truncated@example.com>") is None
@@ -0,0 +1,222 @@
+import random
+import zlib
+
+import pytest
+
+from conftest import make_message
+from imapConnection import CompressedIMAP4_SSL, ConnectionPool, SessionLost, UnconfirmedCommand, is_replayable
+from imapPipeline import pipelined_uid
+from runStats import TransferStats
+
+
+def fill(server, count=3):
+    inbox = server.mailboxes["INBOX"]
+    for number in range(count):
+        inbox.add(make_message(subject=f"Message {number}"))
+    return inbox
+
+
+@pytest.mark.parametrize("name, args, expected", [
+    ('UID', ('FETCH', '1:5', '(RFC822)'), True),
+    ('UID', ('SEARCH', None, 'ALL'), True),
+    ('UID', ('STORE', '1:5', 'FLAGS.SILENT', '(\\Seen)'), True),
+    ('UID', ('STORE', '1:5', '+FLAGS.SILENT', '(\\Deleted)'), False),
+    ('UID', ('STORE', '1:5', '+X-GM-LABELS', '(\\Archive)'), False),
+    ('UID', ('COPY', '1:5', '"Archive"'), False),
+    ('UID', ('MOVE', '1:5', '"Archive"'), False),
+    ('UID', ('EXPUNGE', '1:5'), False),
+    ('STORE', ('1:*', 'FLAGS.SILENT', '(\\Deleted)'), False),
+    ('EXPUNGE', (), False),
+    ('APPEND', ('"INBOX"', None, None, b'x'), False),
+    ('STATUS', ('"INBOX"', '(MESSAGES)'), True),
+    ('SELECT', ('INBOX',), True),
+    ('EXAMINE', ('INBOX',), True),
+    ('NOOP', (), True),
+])
+def test_replay_policy(name, args, expected):
+    assert is_replayable(name, args) is expected
+
+
+def test_fetch_is_replayed_after_a_drop(imap_server):
+    fill(imap_server)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    imap_server.drop("UID FETCH", "after")
+    result, data = mail.uid('FETCH', '1:3', '(UID)')
+    assert result == 'OK'
+    assert len([line for line in data if line]) == 3
+    assert mail.reconnects == 1
+    assert imap_server.ran("UID FETCH") == 2
+
+
+def test_copy_is_not_replayed(imap_server):
+    fill(imap_server)
+    archive = imap_server.add_mailbox("Archive")
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    imap_server.drop("UID COPY", "after")
+    with pytest.raises(UnconfirmedCommand):
+        mail.uid('COPY', '1:3', '"Archive"')
+    assert imap_server.ran("UID COPY") == 1
+    assert len(archive.messages) == 3
+    # The connection is back on the same folder for whatever the caller does next
+    assert mail.state == 'SELECTED'
+    assert mail.noop()[0] == 'OK'
+
+
+def test_sequence_store_and_expunge_are_not_replayed(imap_server):
+    # The cleanup job's empty-the-folder path: STORE 1:* then EXPUNGE
+    inbox = fill(imap_server)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    imap_server.drop("STORE", "before")
+    with pytest.raises(UnconfirmedCommand):
+        mail.store("1:*", '+FLAGS.SILENT', '(\\Deleted)')
+    assert imap_server.ran("STORE") == 0
+
+    mail.store("1:*", '+FLAGS.SILENT', '(\\Deleted)')
+    imap_server.drop("EXPUNGE", "after")
+    with pytest.raises(UnconfirmedCommand):
+        mail.expunge()
+    assert imap_server.ran("EXPUNGE") == 1
+    assert inbox.messages == []
+
+
+def test_absolute_uid_store_is_replayed(imap_server):
+    inbox = fill(imap_server)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    imap_server.drop("UID STORE", "after")
+    assert mail.uid('STORE', '1', 'FLAGS.SILENT', '(\\Flagged)')[0] == 'OK'
+    assert inbox.by_uid(1).flags == {"\\Flagged"}
+
+    imap_server.drop("UID STORE", "after")
+    with pytest.raises(UnconfirmedCommand):
+        mail.uid('STORE', '2', '+FLAGS.SILENT', '(\\Flagged)')
+
+
+def test_changed_uidvalidity_ends_the_session(imap_server):
+    inbox = fill(imap_server)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    inbox.uidvalidity = 2
+    imap_server.drop("UID FETCH", "before")
+    with pytest.raises(SessionLost):
+        mail.uid('FETCH', '1', '(UID)')
+
+
+def test_pipelined_fetches_are_replayed(imap_server):
+    fill(imap_server, 8)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    imap_server.drop("UID FETCH", "after")
+    commands = ((uid, ('FETCH', str(uid), '(UID)')) for uid in range(1, 9))
+    results = list(pipelined_uid(mail, commands, depth=4))
+    assert [key for key, _, _ in results] == list(range(1, 9))
+    assert all(result == 'OK' for _, result, _ in results)
+    assert mail.reconnects == 1
+
+
+class DeflateSocket:
+    # Hands out a raw deflate stream at most chunk bytes per recv_into, like a slow link
+    def __init__(self, writes, chunk):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        # The server flushes after every response it writes
+        self.wire = b"".join(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) for data in writes)
+        self.position = 0
+        self.chunk = chunk
+
+    def recv_into(self, view):
+        count = min(self.chunk, len(view), len(self.wire) - self.position)
+        view[:count] = self.wire[self.position:self.position + count]
+        self.position += count
+        return count
+
+
+def compressed_reader(writes, chunk, wire_size):
+    # A connection past COMPRESS=DEFLATE, without the network setup of __init__
+    mail = CompressedIMAP4_SSL.__new__(CompressedIMAP4_SSL)
+    mail.sock = DeflateSocket(writes, chunk)
+    mail.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    mail.buffer = bytearray()
+    mail.wire_view = memoryview(bytearray(wire_size))
+    mail.transfer = TransferStats()
+    return mail
+
+
+@pytest.mark.parametrize("chunk, wire_size", [(1, 7), (5, 7), (7, 7), (300, 64), (65536, 4096)])
+@pytest.mark.parametrize("literal_size", [0, 1, 10, 5000, 70000])
+def test_compressed_reads_keep_literals_and_buffer_intact(chunk, wire_size, literal_size):
+    literal = random.Random(literal_size).randbytes(literal_size // 2) + b"text " * (literal_size // 10)
+    literal = literal[:literal_size].ljust(literal_size, b"x")
+    writes = [b"* 1 FETCH (UID 7 BODY[] {%d}\r\n" % len(literal) + literal + b")\r\n",
+              b"* 2 FETCH (UID 8 FLAGS (\\Seen))\r\nA1 OK FETCH completed\r\n"]
+    stream = b"".join(writes)
+    mail = compressed_reader(writes, chunk, wire_size)
+    consumed = bytearray()
+
+    def check(data):
+        consumed.extend(data)
+        # What was handed out plus what is still buffered is always the next part of the stream
+        assert stream.startswith(bytes(consumed) + bytes(mail.buffer))
+
+    line = mail.readline()
+    check(line)
+    assert line == b"* 1 FETCH (UID 7 BODY[] {%d}\r\n" % len(literal)
+    data = mail.read(len(literal))
+    check(data)
+    assert type(data) is bytes and data == literal
+    for expected in (b")\r\n", b"* 2 FETCH (UID 8 FLAGS (\\Seen))\r\n", b"A1 OK FETCH completed\r\n"):
+        line = mail.readline()
+        check(line)
+        assert line == expected
+    assert bytes(consumed) == stream and not mail.buffer
+    assert mail.transfer.raw_in == len(stream)
+
+    # The end of the last flush carries no data, the next read drains it and then sees EOF
+    with pytest.raises(CompressedIMAP4_SSL.abort):
+        mail.readline()
+    assert mail.transfer.wire_in == len(mail.sock.wire) and not mail.buffer
+
+
+def test_compressed_read_served_from_the_buffer():
+    mail = compressed_reader([b"A1 OK done\r\n"], 4096, 4096)
+    assert mail.read(2) == b"A1"
+    assert bytes(mail.buffer) == b" OK done\r\n"
+    assert mail.read(3) == b" OK"
+    assert mail.readline() == b" done\r\n"
+
+
+def test_pool_reuses_live_connections(imap_server):
+    opened = []
+
+    def connect(account):
+        opened.append(imap_server.connect())
+        return opened[-1]
+
+    pool = ConnectionPool(connect)
+    first = pool.acquire("account")
+    second = pool.acquire("account")
+    assert first is not second
+    pool.release("account", first)
+    assert pool.acquire("account") is first
+    assert pool.acquire("other") is not first
+    assert len(opened) == 3
+
+    # Connections a job could not finish with cleanly are logged out, not pooled
+    pool.release("account", second, reusable=False)
+    assert second.state == 'LOGOUT'
+    pool.release("account", first)
+    pool.close_all()
+    assert first.state == 'LOGOUT' and pool.idle == {}
+
+
+def test_pool_replaces_dead_connections(imap_server):
+    pool = ConnectionPool(lambda account: imap_server.connect())
+    stale = pool.acquire("account")
+    pool.release("account", stale)
+    stale.account = None  # Cannot reconnect by itself, like a plain connection
+    imap_server.drop("NOOP", "before")
+    fresh = pool.acquire("account")
+    assert fresh is not stale
+    assert fresh.noop()[0] == 'OK'
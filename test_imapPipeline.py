@@ -0,0 +1,47 @@
+from conftest import make_message
+from imapPipeline import CommandPipeline, pipelined_uid
+from imapUtils import iter_fetch_items
+
+
+def fill(server, count):
+    inbox = server.mailboxes["INBOX"]
+    for number in range(count):
+        inbox.add(make_message(subject=f"Message {number}", body=f"Body {number}"))
+    return inbox
+
+
+def test_commands_are_in_flight_together(imap_server):
+    fill(imap_server, 8)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    # The server answers nothing until it has all four commands, so this only completes
+    # when they are sent without waiting for each other's replies
+    imap_server.hold_next(4)
+    pipeline = CommandPipeline(mail, depth=4)
+    for first in (1, 3, 5, 7):
+        pipeline.submit(first, 'FETCH', f"{first}:{first + 1}", "(RFC822)")
+    assert pipeline.full()
+    tags = [tag for tag, _, _, _ in pipeline.in_flight]
+    pipeline.drain()
+
+    assert tags == sorted(tags)
+    ready = list(pipeline.take_ready())
+    assert [key for key, _, _ in ready] == [1, 3, 5, 7]
+    for key, result, data in ready:
+        assert result == 'OK'
+        items = list(iter_fetch_items(data))
+        assert [int(uid) for uid, _ in items] == [key, key + 1]
+        assert all(f"Body {int(uid) - 1}".encode() in raw for uid, raw in items)
+    # Nothing left over for the next command on the connection
+    assert mail.noop()[0] == 'OK'
+    assert not mail.untagged_responses.get('FETCH')
+    assert mail.reconnects == 0
+
+
+def test_bad_answer_fails_only_its_command(imap_server):
+    fill(imap_server, 3)
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    commands = [(1, ('FETCH', '1', '(UID)')), (2, ('FETCH', '2', '(NOSUCHITEM)')), (3, ('FETCH', '3', '(UID)'))]
+    results = list(pipelined_uid(mail, iter(commands), depth=3))
+    assert [(key, result) for key, result, _ in results] == [(1, 'OK'), (2, 'BAD'), (3, 'OK')]
@@ -0,0 +1,87 @@
+import datetime
+import threading
+
+from jobQueue import (ANALYZE, ARCHIVE, CANCELLED, COLLECT_SENDERS, DELETE_DRAFTS, DONE, HIGH, HOURLY, LOW, NORMAL,
+                      QUEUED, RUNNING, Job, JobQueue, RecurringJob, next_nightly)
+
+ACCOUNT = ("imap.example.com", 993, "me@example.com", "secret")
+OTHER = ("imap.example.org", 993, "you@example.org", "secret")
+
+
+def test_priority_then_submission_order():
+    queue = JobQueue()
+    low = queue.submit(Job(COLLECT_SENDERS, ACCOUNT, priority=LOW))
+    first = queue.submit(Job(ANALYZE, ACCOUNT))
+    high = queue.submit(Job(COLLECT_SENDERS, ACCOUNT, priority=HIGH))
+    second = queue.submit(Job(ANALYZE, ACCOUNT))
+    assert first.priority == NORMAL
+    assert [queue.take(0) for _ in range(4)] == [high, first, second, low]
+    assert queue.take(0) is None
+
+
+def test_one_writer_per_account():
+    queue = JobQueue()
+    archive = queue.submit(Job(ARCHIVE, ACCOUNT))
+    drafts = queue.submit(Job(DELETE_DRAFTS, ACCOUNT, priority=HIGH))
+    assert queue.take(0) is drafts and drafts.status == RUNNING
+    # The second writer on the account waits, read-only jobs and other accounts do not
+    elsewhere = queue.submit(Job(ARCHIVE, OTHER, priority=LOW))
+    reader = queue.submit(Job(ANALYZE, ACCOUNT, priority=LOW))
+    assert queue.take(0) is elsewhere
+    assert queue.take(0) is reader
+    assert queue.take(0) is None and archive.status == QUEUED
+
+    queue.finish(drafts, DONE)
+    assert queue.take(0) is archive
+
+
+def test_cancelled_jobs_are_skipped():
+    queue = JobQueue()
+    cancelled = queue.submit(Job(ARCHIVE, ACCOUNT, priority=HIGH))
+    waiting = queue.submit(Job(ARCHIVE, ACCOUNT))
+    assert queue.cancel(cancelled.id) is cancelled
+    assert cancelled.status == CANCELLED and cancelled.cancelled()
+    assert queue.take(0) is waiting
+    # A running job is only asked to stop, the worker finishes it
+    assert queue.cancel(waiting.id) is waiting and waiting.status == RUNNING and waiting.cancelled()
+    assert queue.cancel(12345) is None
+
+
+def test_take_wakes_on_submit_and_close():
+    queue = JobQueue()
+    taken = []
+
+    def wait_for_job():
+        worker = threading.Thread(target=lambda: taken.append(queue.take()))
+        worker.start()
+        return worker
+
+    worker = wait_for_job()
+    job = queue.submit(Job(ARCHIVE, ACCOUNT))
+    worker.join(5)
+    worker = wait_for_job()
+    queue.close()
+    worker.join(5)
+    assert taken == [job, None]
+
+
+def test_recurring_jobs_do_not_stack():
+    queue = JobQueue()
+    recurring = RecurringJob(ARCHIVE, ACCOUNT, {"keywords": ["sale"]}, first_run=1000)
+    queue.add_recurring(recurring)
+    assert queue.submit_due(999) == []
+    job, = queue.submit_due(1000 + 3 * HOURLY + 5)
+    assert job.params == {"keywords": ["sale"]} and job.params is not recurring.params
+    assert job.priority == LOW and recurring.next_run == 1000 + 4 * HOURLY
+    assert queue.submit_due(1000 + 5 * HOURLY) == []
+
+    queue.finish(queue.take(0), DONE)
+    assert len(queue.submit_due(1000 + 5 * HOURLY)) == 1
+    assert "every 60 min" in job.describe()
+
+
+def test_next_nightly():
+    evening = datetime.datetime(2024, 5, 1, 23, 30).timestamp()
+    assert datetime.datetime.fromtimestamp(next_nightly(evening)) == datetime.datetime(2024, 5, 2, 2, 0)
+    night = datetime.datetime(2024, 5, 1, 1, 0).timestamp()
+    assert datetime.datetime.fromtimestamp(next_nightly(night)) == datetime.datetime(2024, 5, 1, 2, 0)
@@ -0,0 +1,103 @@
+import datetime
+import json
+
+import pytest
+
+from conftest import CAPABILITIES, make_message
+from journal import DELETE, MOVE, ActionJournal, latest_journal, read_journal, restore_journal
+from matcher import MessageMatcher
+from pipeline import ArchiveAction, archive_mailbox
+
+ARCHIVE_DATE = datetime.date(2023, 12, 1)
+
+
+def quiet(text):
+    pass
+
+
+def fill(server):
+    inbox = server.mailboxes["INBOX"]
+    for number in range(3):
+        inbox.add(make_message(subject=f"Sale {number}", message_id=f"<sale{number}@shop>"))
+    inbox.add(make_message(subject="Meeting notes", message_id="<notes@work>"))
+    inbox.add(make_message(subject="Draft reply", message_id="<draft@me>"), flags=["\\Deleted"])
+    return inbox
+
+
+def subjects(mailbox):
+    return sorted(message.headers["Subject"] for message in mailbox.messages)
+
+
+@pytest.mark.parametrize("capabilities", [
+    CAPABILITIES,                                                    # MOVE, COPYUID records
+    tuple(c for c in CAPABILITIES if c != "MOVE"),                   # COPY + UID EXPUNGE
+    tuple(c for c in CAPABILITIES if c not in ("MOVE", "UIDPLUS")),  # No COPYUID, found by Message-ID
+])
+def test_archive_then_restore(imap_server, tmp_path, monkeypatch, capabilities):
+    monkeypatch.chdir(tmp_path)
+    imap_server.capabilities = capabilities
+    inbox = fill(imap_server)
+    before = subjects(inbox)
+    archive = imap_server.add_mailbox("Archive", "\\Archive")
+    mail = imap_server.connect()
+
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, quiet, by_conversation=False)
+    assert summary.archived == 3
+    entries, copied = read_journal(latest_journal())
+    assert sorted(entry["message_id"] for entry in entries) == ["<sale0@shop>", "<sale1@shop>", "<sale2@shop>"]
+    assert {(entry["action"], entry["folder"], entry["target"]) for entry in entries} == {(MOVE, "INBOX", "Archive")}
+    assert len(copied) == (3 if "UIDPLUS" in capabilities else 0)
+
+    if "UIDPLUS" not in capabilities:
+        # Plain EXPUNGE is all such a server offers, the user's own \Deleted message goes with it
+        before.remove("Draft reply")
+    assert restore_journal(mail, latest_journal(), quiet) == 3
+    assert archive.messages == []
+    assert subjects(inbox) == before
+
+
+def test_journal_survives_a_torn_last_line(tmp_path):
+    path = tmp_path / "archive.jsonl"
+    journal = ActionJournal(str(path))
+    journal.folder, journal.uidvalidity = "INBOX", 7
+    journal._write([{"uid": 5, "uidvalidity": 7, "action": MOVE, "folder": "INBOX", "target": "Archive"}])
+    journal.close()
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"uid": 6, "uidval')
+    entries, _ = read_journal(str(path))
+    assert [entry["uid"] for entry in entries] == [5]
+
+
+def test_missing_archive_folder_is_created(imap_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inbox = fill(imap_server)
+    logged = []
+    mail = imap_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, logged.append)
+    assert summary.archived == 3
+    assert 'No archive folder found, created "Archive" to archive into.\n' in logged
+    assert len(imap_server.mailboxes["Archive"].messages) == 3
+    assert restore_journal(mail, latest_journal(), logged.append) == 3
+    assert len(inbox.messages) == 5
+
+
+def test_no_archive_folder_refuses_to_delete(imap_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    imap_server.can_create = False
+    inbox = fill(imap_server)
+    before = subjects(inbox)
+    logged = []
+    mail = imap_server.connect()
+    assert archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, logged.append) is None
+    assert subjects(inbox) == before
+    assert latest_journal() is None
+    assert any('"Archive" could not be created' in line for line in logged)
+    assert ArchiveAction(None).kind == DELETE
+
+
+def test_deleted_entries_are_reported_not_restored(imap_server, tmp_path):
+    path = tmp_path / "archive.jsonl"
+    path.write_text(json.dumps({"uid": 1, "uidvalidity": 1, "action": DELETE, "folder": "INBOX", "target": None}) + "\n")
+    logged = []
+    assert restore_journal(imap_server.connect(), str(path), logged.append) == 0
+    assert logged == ["1 messages were expunged from INBOX and cannot be restored.\n"]
@@ -0,0 +1,88 @@
+import pytest
+
+from mailParser import decode_payload
+from matcher import KeywordScanner, find_keyword, is_ascii_compatible, keyword_pairs
+
+KEYWORDS = ["Sale", "unsubscribe", "Rabatt für", "распродажа", "セール"]
+
+BODIES = [
+    "Our BIG SALE starts now",
+    "Click here to UnSubScribe",
+    "Nur heute: RABATT FÜR alle",
+    "Летняя РАСПРОДАЖА уже здесь",
+    "夏のセール開催中",
+    "Nothing to see here",
+    "Ça coûte cher, pas de soldes",
+    "",
+]
+
+
+def decoded_search(payload, charset, keywords):
+    # What the scanner replaced: decode every body, then search the text
+    return find_keyword(decode_payload(payload, charset), keyword_pairs(keywords))
+
+
+@pytest.mark.parametrize("charset", ["utf-8", "latin-1", "iso-8859-1", "windows-1252", "us-ascii", "x-unknown"])
+@pytest.mark.parametrize("body", BODIES)
+def test_same_result_as_decoding_first(charset, body):
+    payload = body.encode(charset if charset != "x-unknown" else "latin-1", errors="ignore")
+    scanner = KeywordScanner(keyword_pairs(KEYWORDS))
+    assert scanner.find_in_payload(payload, charset, decode_payload) == decoded_search(payload, charset, KEYWORDS)
+
+
+def test_ascii_keywords_match_in_any_case_without_decoding():
+    decoded = []
+
+    def decode(payload, charset):
+        decoded.append(payload)
+        return decode_payload(payload, charset)
+
+    scanner = KeywordScanner(keyword_pairs(["Sale", "распродажа"]))
+    assert scanner.find_in_payload(b"Big SALE today", "utf-8", decode) == "Sale"
+    assert scanner.find_in_payload(b"big sAlE today", "latin-1", decode) == "Sale"
+    # Pure ASCII can't hold the Cyrillic keyword, nothing is decoded
+    assert scanner.find_in_payload(b"nothing here", "utf-8", decode) is None
+    assert decoded == []
+    assert scanner.find_in_payload("Летняя РАСПРОДАЖА".encode("utf-8"), "utf-8", decode) == "распродажа"
+    assert len(decoded) == 1
+
+
+def test_keyword_order_is_kept_across_ascii_and_other_keywords():
+    scanner = KeywordScanner(keyword_pairs(["Rabatt für", "Rabatt"]))
+    payload = "Rabatt für alle".encode("utf-8")
+    assert scanner.find_in_payload(payload, "utf-8", decode_payload) == decoded_search(payload, "utf-8", [
+        "Rabatt für", "Rabatt"]) == "Rabatt für"
+
+
+@pytest.mark.parametrize("charset, text", [
+    ("utf-16", "Big sale today"),
+    ("utf-16-le", "Unsubscribe here"),
+    ("shift_jis", "夏のセール"),
+    ("euc-jp", "夏のセール"),
+    ("gb2312", "夏季促销 sale"),
+    ("big5", "夏季特賣 sale"),
+])
+def test_multi_byte_charsets_take_the_decode_path(charset, text):
+    assert not is_ascii_compatible(charset)
+    payload = text.encode(charset)
+    scanner = KeywordScanner(keyword_pairs(KEYWORDS))
+    assert scanner.find_in_payload(payload, charset, decode_payload) == decoded_search(payload, charset, KEYWORDS)
+    assert scanner.find_in_payload(payload, charset, decode_payload) is not None
+
+
+def test_ascii_bytes_inside_cjk_characters_are_not_hits():
+    # Shift_JIS trail bytes fall in the ASCII range: "ソ" is 0x83 0x5C, "ア" 0x83 0x41
+    payload = "ソアラ".encode("shift_jis")
+    assert b"A" in payload
+    scanner = KeywordScanner(keyword_pairs(["a"]))
+    assert scanner.find_in_payload(payload, "shift_jis", decode_payload) is None
+
+
+@pytest.mark.parametrize("charset, expected", [
+    ("utf-8", True), ("UTF8", True), ("us-ascii", True), ("latin-1", True), ("iso-8859-15", True),
+    ("windows-1251", True), ("koi8-r", True), ("cp437", True), ("x-unknown-charset", True),
+    ("utf-16", False), ("utf-32", False), ("shift_jis", False), ("iso-2022-jp", False), ("gbk", False),
+    ("big5", False), ("euc-kr", False), ("utf-7", False),
+])
+def test_charset_allow_list(charset, expected):
+    assert is_ascii_compatible(charset) is expected
@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from conftest import make_message
+from matcher import MessageMatcher
+from metadataRules import MetadataRule, find_rule_matches, parse_metadata_rules, parse_size
+from pipeline import archive_mailbox
+
+OLD = datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc)
+NEW = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+def quiet(text):
+    pass
+
+
+def test_parse_and_describe():
+    rules = parse_metadata_rules("larger:10MB; attachment:.PDF older:365; older:30d from:*@News.example.com;")
+    assert [rule.describe() for rule in rules] == [
+        "larger:10MB", "older:365d attachment:pdf", "older:30d from:*@news.example.com"]
+    assert parse_size("512kb") == 512 * 1024
+    assert parse_size("2") == 2 * 1024 ** 2
+
+
+@pytest.mark.parametrize("text", ["bigger:10MB", "larger:", "larger:10XB", "older:soon", "   "])
+def test_invalid_rules_are_refused(text):
+    with pytest.raises(ValueError):
+        MetadataRule.parse(text)
+
+
+def test_search_criteria():
+    assert MetadataRule.parse("larger:1KB from:*@example.com").search_criteria() == \
+        'UNDELETED LARGER 1024 FROM "@example.com"'
+    assert MetadataRule.parse("older:30").search_criteria().startswith('UNDELETED BEFORE "')
+
+
+def test_attachment_types_match_structure():
+    pdf = [[b"text", b"plain", [b"charset", b"utf-8"], None, None, b"7bit", 10, 1],
+           [b"application", b"octet-stream", [b"name", b"Report.PDF"], None, None, b"base64", 400,
+            None, [b"attachment", [b"filename", b"Report.PDF"]], None], b"mixed"]
+    assert MetadataRule.parse("attachment:pdf").matches_structure(pdf)
+    assert MetadataRule.parse("attachment:application/*").matches_structure(pdf)
+    assert not MetadataRule.parse("attachment:zip").matches_structure(pdf)
+    assert not MetadataRule.parse("attachment:text/plain").matches_structure(pdf)
+
+
+def test_matches_are_limited_to_the_scope(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    big = "x" * 4000
+    inbox.add(make_message(subject="Old and big", body=big), date=OLD)
+    inbox.add(make_message(subject="New and big", body=big), date=NEW)
+    inbox.add(make_message(subject="New and small"), date=NEW)
+    inbox.add(make_message(subject="Already gone", body=big), date=NEW, flags=["\\Deleted"])
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    rules = parse_metadata_rules("larger:2KB; from:news@example.com")
+
+    assert find_rule_matches(mail, rules, quiet) == {1: "larger:2KB", 2: "larger:2KB", 3: "from:news@example.com"}
+    assert find_rule_matches(mail, rules, quiet, scope='SINCE "1-Jan-2024"') == \
+        {2: "larger:2KB", 3: "from:news@example.com"}
+    assert find_rule_matches(mail, rules, quiet, cancelled=lambda: True) == {}
+
+
+def test_age_rules_reach_past_the_archive_date(imap_server):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    inbox = imap_server.mailboxes["INBOX"]
+    inbox.add(make_message(subject="Last year"), date=now - datetime.timedelta(days=400))
+    inbox.add(make_message(subject="Last month", body="x" * 4000), date=now - datetime.timedelta(days=40))
+    inbox.add(make_message(subject="Yesterday", body="x" * 4000), date=now - datetime.timedelta(days=1))
+    archive = imap_server.add_mailbox("Archive", "\\Archive")
+    mail = imap_server.connect()
+    # The default 7-day run: older: rules pick their own range, the size rule stays inside the week
+    rules = parse_metadata_rules("older:365; larger:2KB")
+    summary = archive_mailbox(mail, MessageMatcher([]), (now - datetime.timedelta(days=7)).date(), quiet,
+                              metadata_rules=rules)
+    assert summary.archived == 2
+    assert sorted(message.headers["Subject"] for message in archive.messages) == ["Last year", "Yesterday"]
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+import metadataStore
+from metadataRules import MetadataRule
+from metadataStore import ATTACHMENT, MessageStore, bit_count, bits_from_mask, iter_bits
+
+
+@pytest.fixture(params=["plain", "numpy"])
+def store(request, monkeypatch):
+    # Every filter has a vectorized and a plain loop version, both must agree
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(metadataStore, "numpy", None)
+    store = MessageStore()
+    march = time.mktime((2024, 3, 15, 12, 0, 0, 0, 0, -1))
+    april = time.mktime((2024, 4, 2, 12, 0, 0, 0, 0, -1))
+    store.add(10, 500, march, "a@shop.example")
+    store.add(11, 5000, april, "b@shop.example", ATTACHMENT)
+    store.add(12, 20000, march, "news@club.example", ATTACHMENT)
+    store.add(13, 800, 0.0)
+    store.add(14, 9000, april, "a@shop.example")
+    return store
+
+
+def rows(bits):
+    return list(iter_bits(bits))
+
+
+def test_bit_helpers():
+    assert bits_from_mask(bytes([1, 0, 1, 1])) == 0b1101
+    assert bits_from_mask(b"") == 0
+    assert rows(0b100101) == [0, 2, 5] and rows(0) == []
+    assert bit_count(0b100101) == 3
+
+
+def test_filters(store):
+    assert store.all() == 0b11111
+    assert rows(store.larger_than(5000)) == [2, 4]
+    assert rows(store.with_flags(ATTACHMENT)) == [1, 2]
+    assert rows(store.from_senders(["*@shop.example"])) == [0, 1, 4]
+    assert rows(store.from_senders(["NEWS@club.example", "nobody@example.com"])) == [2]
+    assert rows(store.senders_containing("shop")) == [0, 1, 4]
+    april = time.mktime((2024, 4, 1, 0, 0, 0, 0, 0, -1))
+    assert rows(store.dated(start=april)) == [1, 4]
+    # Unknown dates match neither side
+    assert rows(store.dated(end=april)) == [0, 2]
+    combined = store.larger_than(1000) & ~store.with_flags(ATTACHMENT)
+    assert rows(combined) == [4]
+    assert store.total_size() == 35300 and store.total_size(combined) == 9000
+
+
+def test_totals(store):
+    groups, labels = store.sender_groups()
+    counts, sizes, last_seen = store.totals(groups, len(labels))
+    assert labels == [None, "a@shop.example", "b@shop.example", "news@club.example"]
+    assert list(counts) == [1, 2, 1, 1] and list(sizes) == [800, 9500, 5000, 20000]
+    assert last_seen[1] == store.dates[4]
+
+    groups, labels = store.domain_groups()
+    counts, sizes, _ = store.totals(groups, len(labels), store.larger_than(600))
+    assert dict(zip(labels, counts)) == {None: 1, "shop.example": 2, "club.example": 1}
+    assert dict(zip(labels, sizes))["shop.example"] == 14000
+
+    groups, labels = store.month_groups()
+    counts, _, _ = store.totals(groups, len(labels))
+    assert labels == ["unknown", "2024-03", "2024-04"] and list(counts) == [1, 2, 2]
+
+    groups, labels = store.flag_groups(ATTACHMENT, ("no attachment", "attachment"))
+    assert list(store.totals(groups, len(labels))[0]) == [3, 2]
+
+
+def test_rule_bits(store):
+    assert store.rule_bits(MetadataRule.parse("larger:4KB from:*@shop.example")) == (0b10010, True)
+    bits, exact = store.rule_bits(MetadataRule.parse("attachment:pdf"))
+    assert rows(bits) == [1, 2] and not exact
+    # Every dated message is older than a day, the undated one never matches an age
+    assert rows(store.rule_bits(MetadataRule.parse("older:1"))[0]) == [0, 1, 2, 4]
@@ -0,0 +1,37 @@
+from conftest import make_message
+from matcher import MessageMatcher
+from parsePool import PROCESS_THRESHOLD, ProcessParseStage, scan_batch
+
+FIELDS = ("uid", "subject", "sender", "size", "subject_keyword", "body_keyword", "snippet")
+
+
+def batch():
+    items = []
+    for number in range(PROCESS_THRESHOLD):
+        if number % 3 == 0:
+            raw = make_message(subject=f"Weekly sale {number}", body="Everything must go")
+        elif number % 3 == 1:
+            raw = make_message(subject=f"Note {number}", body=f"<p>Click to <b>unsub</b>scribe {number}</p>", html=True)
+        else:
+            raw = make_message(sender=f"friend{number}@example.org", subject=f"Lunch {number}", body="See you")
+        items.append((str(number + 1).encode(), raw))
+    return items
+
+
+def as_rows(results):
+    return [tuple(getattr(parsed, field) for field in FIELDS) for parsed in results]
+
+
+def test_process_pool_matches_in_thread_scan():
+    items = batch()
+    scanner = MessageMatcher(["sale", "unsubscribe"]).scanner
+    expected, expected_errors = scan_batch(items, scanner)
+    stage = ProcessParseStage(2, scanner)
+    try:
+        results, errors = stage.scan(items)
+    finally:
+        stage.close()
+    assert as_rows(results) == as_rows(expected)
+    assert errors == expected_errors
+    assert sum(parsed.subject_keyword == "sale" for parsed in results) == len(range(0, PROCESS_THRESHOLD, 3))
+    assert sum(parsed.body_keyword == "unsubscribe" for parsed in results) == len(range(1, PROCESS_THRESHOLD, 3))
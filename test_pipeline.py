@@ -0,0 +1,109 @@
+import datetime
+
+import pipeline
+from conftest import CAPABILITIES, make_message
+from matcher import MessageMatcher
+from metadataRules import MetadataRule
+from pipeline import archive_mailbox
+
+ARCHIVE_DATE = datetime.date(2023, 12, 1)
+
+
+def quiet(text):
+    pass
+
+
+def fill_inbox(server):
+    inbox = server.mailboxes["INBOX"]
+    inbox.add(make_message(subject="Big sale today"))
+    inbox.add(make_message(subject="Another sale"))
+    inbox.add(make_message(subject="Meeting notes"))
+    inbox.add(make_message(subject="Draft reply"), flags=["\\Deleted"])
+    return inbox
+
+
+def subjects(mailbox):
+    return sorted(message.headers["Subject"] for message in mailbox.messages)
+
+
+def test_copy_path_expunges_only_archived_messages(imap_server):
+    imap_server.capabilities = tuple(c for c in CAPABILITIES if c != "MOVE")
+    inbox = fill_inbox(imap_server)
+    archive = imap_server.add_mailbox("Archive", "\\Archive")
+    mail = imap_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, quiet)
+    assert summary.archived == 2
+    assert subjects(archive) == ["Another sale", "Big sale today"]
+    assert subjects(inbox) == ["Draft reply", "Meeting notes"]
+    assert imap_server.ran("EXPUNGE") == 0
+    assert imap_server.ran("UID EXPUNGE") == 1
+
+
+def test_move_path_expunges_nothing(imap_server):
+    inbox = fill_inbox(imap_server)
+    archive = imap_server.add_mailbox("Archive", "\\Archive")
+    mail = imap_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher(["sale"]), ARCHIVE_DATE, quiet)
+    assert summary.archived == 2
+    assert len(archive.messages) == 2
+    assert subjects(inbox) == ["Draft reply", "Meeting notes"]
+    assert imap_server.ran("EXPUNGE") + imap_server.ran("UID EXPUNGE") == 0
+
+
+def test_rules_only_cover_the_archive_date_range(imap_server):
+    inbox = imap_server.mailboxes["INBOX"]
+    inbox.add(make_message(subject="Old report", body="x" * 4000), date=datetime.datetime(2020, 6, 1))
+    inbox.add(make_message(subject="New report", body="x" * 4000))
+    archive = imap_server.add_mailbox("Archive", "\\Archive")
+    mail = imap_server.connect()
+    summary = archive_mailbox(mail, MessageMatcher([]), ARCHIVE_DATE, quiet,
+                              metadata_rules=[MetadataRule.parse("larger:2KB")])
+    assert summary.archived == 1
+    assert subjects(archive) == ["New report"]
+    assert subjects(inbox) == ["Old report"]
+
+
+def fill_mostly_old(server):
+    inbox = server.mailboxes["INBOX"]
+    for number in range(30):
+        inbox.add(make_message(subject=f"Old sale {number}"), date=datetime.datetime(2020, 1, 1))
+    inbox.add(make_message(subject="New sale"))
+    inbox.add(make_message(subject="New note"))
+    return inbox
+
+
+def record_workers_for(monkeypatch):
+    counts = []
+
+    def process_workers_for(message_count):
+        counts.append(message_count)
+        return 0
+
+    monkeypatch.setattr(pipeline, "process_workers_for", process_workers_for)
+    return counts
+
+
+def test_process_pool_is_sized_from_the_searched_messages(imap_server, monkeypatch):
+    imap_server.capabilities = CAPABILITIES + ("ESEARCH",)
+    fill_mostly_old(imap_server)
+    imap_server.add_mailbox("Archive", "\\Archive")
+    counts = record_workers_for(monkeypatch)
+    summary = archive_mailbox(imap_server.connect(), MessageMatcher(["sale"]), ARCHIVE_DATE, quiet)
+    assert summary.archived == 1
+    # Two messages are in the date range, not the 32 in the folder
+    assert counts == [2]
+
+
+def test_without_esearch_the_windows_decide(imap_server, monkeypatch):
+    fill_mostly_old(imap_server)
+    imap_server.add_mailbox("Archive", "\\Archive")
+    counts = record_workers_for(monkeypatch)
+    archive_mailbox(imap_server.connect(), MessageMatcher(["sale"]), ARCHIVE_DATE, quiet)
+    # Too few searched messages to ever consider worker processes
+    assert counts == []
+
+    monkeypatch.setattr(pipeline, "PROCESS_THRESHOLD", 2)
+    imap_server.mailboxes["INBOX"].add(make_message(subject="Another sale"))
+    archive_mailbox(imap_server.connect(), MessageMatcher(["sale"]), ARCHIVE_DATE, quiet)
+    # New note and Another sale: decided once the window is searched
+    assert counts == [2]
@@ -0,0 +1,43 @@
+import threading
+
+from runStats import ByteBudget, TransferStats
+
+
+def test_budget_blocks_until_bytes_are_released():
+    budget = ByteBudget(100)
+    budget.acquire(60)
+    budget.acquire(40)
+    acquired = threading.Event()
+
+    def take():
+        budget.acquire(30)
+        acquired.set()
+
+    worker = threading.Thread(target=take)
+    worker.start()
+    assert not acquired.wait(0.1)
+    budget.release(40)
+    worker.join(5)
+    assert acquired.is_set()
+    assert budget.in_flight == 90 and budget.peak == 100
+
+
+def test_oversized_item_passes_when_nothing_is_in_flight():
+    budget = ByteBudget(100)
+    budget.acquire(500)
+    assert budget.in_flight == 500
+    budget.release(500)
+    budget.acquire(10)
+    assert budget.in_flight == 10 and budget.peak == 500
+
+
+def test_transfer_stats():
+    start = TransferStats(100, 50, 10, 8, 1.0)
+    now = start.copy()
+    now.add(TransferStats(400, 100, 20, 10, 2.0))
+    run = now.since(start)
+    assert (run.raw_in, run.wire_in, run.raw_out, run.wire_out, run.read_seconds) == (400, 100, 20, 10, 2.0)
+    assert run.ratio() == 4.0
+    # 300 bytes saved at the 50 bytes a second the compressed ones came in
+    assert run.seconds_saved() == 6.0
+    assert TransferStats().ratio() == 1.0 and TransferStats().seconds_saved() == 0.0
@@ -0,0 +1,71 @@
+import datetime
+import gzip
+import json
+
+from senderCache import SNAPSHOT_VERSION, SenderSnapshot, account_key, load_snapshot, save_snapshot, snapshot_path
+
+ACCOUNT = ("IMAP.Example.com", 993, "Me@Example.com", "secret")
+
+
+def write_raw(tmp_path, data):
+    with gzip.open(snapshot_path(ACCOUNT, tmp_path), "wt", encoding="utf-8") as file:
+        json.dump(data, file)
+
+
+def test_account_key():
+    key = account_key(ACCOUNT)
+    assert key == account_key(("imap.example.com", 143, "me@example.com", "other password"))
+    assert key != account_key(("imap.example.com", 993, "you@example.com", "secret"))
+    assert "example" not in snapshot_path(ACCOUNT)
+
+
+def test_save_and_load(tmp_path):
+    senders = {"a@shop.example": [3, 12000, 1700000000.0], "news@club.example": [1, 800, 1690000000.0]}
+    folders = {"INBOX": [7, 120], "Work/Ünïcode": [3, 9]}
+    save_snapshot(ACCOUNT, SenderSnapshot(datetime.date(2024, 1, 1), folders, senders), tmp_path)
+    with gzip.open(snapshot_path(ACCOUNT, tmp_path), "rt", encoding="utf-8") as file:
+        stored = json.load(file)
+    # Flat rows, not one object per sender
+    assert stored["version"] == SNAPSHOT_VERSION and ["a@shop.example", 3, 12000, 1700000000.0] in stored["senders"]
+
+    snapshot = load_snapshot(ACCOUNT, tmp_path)
+    assert snapshot.since == datetime.date(2024, 1, 1)
+    assert snapshot.folders == folders and snapshot.senders == senders
+    assert sorted(snapshot.rows()) == [("a@shop.example", 3, 12000, 1700000000.0),
+                                       ("news@club.example", 1, 800, 1690000000.0)]
+    assert snapshot.uid_start("INBOX") == 120 and snapshot.uid_start("Never scanned") == 1
+
+
+def test_version_1_snapshots_become_inbox_folders(tmp_path):
+    write_raw(tmp_path, {"version": 1, "since": "2023-06-01", "uidvalidity": 5, "uid_next": 42,
+                         "senders": [["a@shop.example", 2, 500, 1680000000.0]]})
+    snapshot = load_snapshot(ACCOUNT, tmp_path)
+    assert snapshot.since == datetime.date(2023, 6, 1)
+    assert snapshot.folders == {"INBOX": [5, 42]} and snapshot.uid_start("INBOX") == 42
+    assert snapshot.senders == {"a@shop.example": [2, 500, 1680000000.0]}
+    assert snapshot.matches({"INBOX": {"UIDVALIDITY": 5}})
+
+    # Saving it again writes the current format
+    save_snapshot(ACCOUNT, snapshot, tmp_path)
+    assert load_snapshot(ACCOUNT, tmp_path).folders == {"INBOX": [5, 42]}
+
+
+def test_unreadable_snapshots_are_ignored(tmp_path):
+    assert load_snapshot(ACCOUNT, tmp_path) is None
+    write_raw(tmp_path, {"version": SNAPSHOT_VERSION + 1, "since": "2024-01-01", "folders": {}, "senders": []})
+    assert load_snapshot(ACCOUNT, tmp_path) is None
+    with open(snapshot_path(ACCOUNT, tmp_path), "wb") as file:
+        file.write(gzip.compress(b'{"version": 2, "since"')[:-4])
+    assert load_snapshot(ACCOUNT, tmp_path) is None
+    with open(snapshot_path(ACCOUNT, tmp_path), "wb") as file:
+        file.write(b"not gzip at all")
+    assert load_snapshot(ACCOUNT, tmp_path) is None
+
+
+def test_matches_checks_uidvalidity():
+    snapshot = SenderSnapshot(datetime.date(2024, 1, 1), {"INBOX": [7, 120], "Old": [None, 1]})
+    assert snapshot.matches({"INBOX": {"UIDVALIDITY": 7}})
+    assert not snapshot.matches({"INBOX": {"UIDVALIDITY": 8}})
+    # Folders that are gone from the server don't matter, ones never validated do
+    assert snapshot.matches({})
+    assert not snapshot.matches({"Old": {"UIDVALIDITY": 1}})
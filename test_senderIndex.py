@@ -0,0 +1,55 @@
+from configStore import compile_rules
+from matcher import MessageMatcher
+from senderIndex import SenderIndex, parse_addresses, sender_address
+
+
+def test_display_names_and_case_are_normalized():
+    assert sender_address('"Shop, Deals" <DEALS@Shop.Example>') == "deals@shop.example"
+    assert sender_address("=?utf-8?q?Shop?= <deals@shop.example>") == "deals@shop.example"
+    assert sender_address("") is None and sender_address("Shop Deals") is None
+    index = SenderIndex(['The Shop <Deals@SHOP.example>', " news@club.example "])
+    assert index.addresses == {"deals@shop.example", "news@club.example"}
+    assert index.matches("deals@shop.example")
+    assert index.matches('"Deals" <DEALS@shop.EXAMPLE>')
+    assert not index.matches("other@shop.example")
+
+
+def test_domain_wildcards():
+    index = SenderIndex(["*@Shop.Example", "@club.example"])
+    assert index.domains == {"shop.example", "club.example"} and not index.addresses
+    assert index.matches("Anyone <anyone@shop.example>")
+    assert index.matches("news@club.example")
+    # Whole domains only: neither look-alike domains nor subdomains are substring hits
+    assert not index.matches("deals@notshop.example")
+    assert not index.matches("deals@mail.shop.example")
+    assert not index.matches("shop.example@elsewhere.example")
+
+
+def test_headers_with_several_addresses():
+    assert parse_addresses('"A" <a@one.example>, b@two.example, "Name only"') == ["a@one.example", "b@two.example"]
+    index = SenderIndex(["b@two.example"])
+    assert index.matches('"A" <a@one.example>, "B" <B@two.example>')
+    assert not index.matches('"A" <a@one.example>, c@two.example')
+    assert len(index) == 1 and index and not SenderIndex()
+
+
+def test_rules_without_an_address_are_dropped_and_logged():
+    index = SenderIndex(["Newsletter", "a@shop.example", "*@", "  "])
+    assert index.dropped == ["Newsletter", "*@"]
+    assert len(index) == 1
+    # The old substring match would have hit this sender
+    assert not index.matches("Newsletter <news@club.example>")
+    logged = []
+    index.log_dropped(logged.append)
+    assert logged == ["Ignored 2 sender rules that are not an address or *@domain: Newsletter, *@\n"]
+    logged.clear()
+    SenderIndex(["a@shop.example"]).log_dropped(logged.append)
+    assert logged == []
+
+
+def test_compiled_rules_keep_the_dropped_senders():
+    rules = compile_rules({"keywords": "sale", "senders": ["Newsletter", "*@shop.example", "A <a@b.example>"]})
+    matcher = MessageMatcher.from_rules(rules)
+    assert matcher.sender_index.addresses == {"a@b.example"}
+    assert matcher.sender_index.domains == {"shop.example"}
+    assert matcher.sender_index.dropped == ["Newsletter"]
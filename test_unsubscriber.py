@@ -0,0 +1,130 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from conftest import make_message
+from unsubscriber import UnsubscribePool, UnsubscribeTarget, send_mailto_unsubscribes, unsubscribe_senders
+
+
+class StubResponse:
+    def __init__(self, status):
+        self.status = status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StubOpener:
+    def __init__(self, status=200):
+        self.status = status
+        self.requests = []
+
+    def open(self, request, timeout=None):
+        self.requests.append(request)
+        return StubResponse(self.status)
+
+
+class StubMailer:
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, to, subject, body):
+        self.sent.append((to, subject, body))
+
+
+def add_senders(inbox):
+    inbox.add(make_message(sender="deals@shop.example", headers=[
+        "List-Unsubscribe: <https://shop.example/u/1>, <mailto:leave@shop.example>",
+        "List-Unsubscribe-Post: List-Unsubscribe=One-Click"]))
+    inbox.add(make_message(sender="digest@club.example", headers=[
+        "List-Unsubscribe: <mailto:unsub@club.example?subject=stop%20it>"]))
+    inbox.add(make_message(sender="old@plain.example", headers=[
+        "List-Unsubscribe: <http://plain.example/u>, <mailto:off@plain.example>",
+        "List-Unsubscribe-Post: List-Unsubscribe=One-Click"]))
+    inbox.add(make_message(sender="friend@example.org"))
+
+
+def test_mailto_is_never_sent_without_confirmation(gmail_server):
+    add_senders(gmail_server.mailboxes["INBOX"])
+    mail = gmail_server.connect()
+    mail.select("INBOX")
+    opener, mailer = StubOpener(), StubMailer()
+    senders = ["deals@shop.example", "digest@club.example", "old@plain.example"]
+    results, mailto = unsubscribe_senders(mail, senders, UnsubscribePool(opener=opener), lambda text: None)
+
+    # HTTPS one-click is posted, plain HTTP one-click is not trusted and falls back to mailto
+    assert [request.full_url for request in opener.requests] == ["https://shop.example/u/1"]
+    assert results == [("deals@shop.example", "one-click", True, "HTTP 200")]
+    assert sorted(mailto) == [("digest@club.example", "mailto:unsub@club.example?subject=stop%20it"),
+                              ("old@plain.example", "mailto:off@plain.example")]
+    assert mailer.sent == []
+    labelled = [message for message in gmail_server.mailboxes["INBOX"].messages if "\\Unsubscribed" in message.labels]
+    assert len(labelled) == 3
+
+    results = send_mailto_unsubscribes(sorted(mailto), UnsubscribePool(mailer=mailer))
+    assert mailer.sent == [("unsub@club.example", "stop it", "unsubscribe"),
+                           ("off@plain.example", "unsubscribe", "unsubscribe")]
+    assert all(ok for _, method, ok, _ in results if method == "mailto")
+
+
+def test_pool_without_mailer_sends_nothing():
+    results = send_mailto_unsubscribes([("a@example.com", "mailto:a@example.com")], UnsubscribePool())
+    assert results == [("a@example.com", "none", False, "no one-click or mailto unsubscribe offered")]
+
+
+def test_failed_one_click_is_reported(imap_server):
+    add_senders(imap_server.mailboxes["INBOX"])
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    pool = UnsubscribePool(opener=StubOpener(status=500))
+    results, _ = unsubscribe_senders(mail, ["deals@shop.example"], pool, lambda text: None)
+    assert results == [("deals@shop.example", "one-click", False, "HTTP 500")]
+
+
+def test_other_servers_are_not_labelled(imap_server):
+    add_senders(imap_server.mailboxes["INBOX"])
+    mail = imap_server.connect()
+    mail.select("INBOX")
+    opener = StubOpener()
+    results, _ = unsubscribe_senders(mail, ["deals@shop.example"], UnsubscribePool(opener=opener), lambda text: None)
+    assert results == [("deals@shop.example", "one-click", True, "HTTP 200")]
+    assert imap_server.ran("UID STORE") == 0
+
+
+class OneClickHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, self.headers["Content-Type"], body))
+        self.send_response(404 if self.path == "/gone" else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_one_click_post_reaches_a_real_http_server(monkeypatch):
+    for name in ("http_proxy", "HTTP_PROXY", "all_proxy", "ALL_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OneClickHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        targets = [UnsubscribeTarget("a@shop.example", 1, [f"{base}/u?id=1"], True),
+                   UnsubscribeTarget("b@shop.example", 2, [f"{base}/gone"], True),
+                   UnsubscribeTarget("c@shop.example", 3, [f"{base}/u?id=3"], False)]
+        results = UnsubscribePool(allow_http=True).run(targets)
+    finally:
+        server.shutdown()
+        server.server_close()
+    # RFC 8058: a form-encoded POST of exactly List-Unsubscribe=One-Click, in any order from the pool
+    assert sorted(server.requests) == [("/gone", "application/x-www-form-urlencoded", b"List-Unsubscribe=One-Click"),
+                                       ("/u?id=1", "application/x-www-form-urlencoded", b"List-Unsubscribe=One-Click")]
+    assert results[0] == ("a@shop.example", "one-click", True, "HTTP 200")
+    assert results[1][:3] == ("b@shop.example", "one-click", False) and "404" in results[1][3]
+    # No List-Unsubscribe-Post header: never posted
+    assert results[2] == ("c@shop.example", "none", False, "no one-click or mailto unsubscribe offered")
@@ -0,0 +1,209 @@
+import email
+import re
+import smtplib
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+from gmailBackend import is_gmail
+from imapUtils import chunked, iter_fetch_items, or_criteria, uid_set
+from senderIndex import SenderIndex, sender_address
+
+SEARCH_CHUNK_SIZE = 50     # Senders per combined OR FROM search
+FETCH_CHUNK_SIZE = 1000    # UIDs per header-only FETCH / label STORE
+UNSUBSCRIBE_WORKERS = 8
+UNSUBSCRIBE_TIMEOUT = 15
+ONE_CLICK_BODY = b"List-Unsubscribe=One-Click"
+HEADER_FETCH = "(UID BODY.PEEK[HEADER.FIELDS (FROM LIST-UNSUBSCRIBE LIST-UNSUBSCRIBE-POST)])"
+LINK_PATTERN = re.compile(r"<([^>]+)>")
+
+
+class SmtpMailer:
+    def __init__(self, smtp_server, smtp_port, username, password, timeout=UNSUBSCRIBE_TIMEOUT):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+
+    def __call__(self, to, subject, body):
+        message = EmailMessage()
+        message["From"] = self.username
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout) as smtp:
+            smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class UnsubscribeTarget:
+    def __init__(self, sender, uid, links, one_click):
+        self.sender = sender
+        self.uid = uid
+        self.links = links
+        self.one_click = one_click
+
+    @property
+    def http_link(self):
+        return next((link for link in self.links if link.lower().startswith(("https:", "http:"))), None)
+
+    @property
+    def mailto_link(self):
+        return next((link for link in self.links if link.lower().startswith("mailto:")), None)
+
+
+def parse_unsubscribe_target(sender, uid, msg):
+    header = msg.get("List-Unsubscribe")
+    if not header:
+        return None
+    links = [link.strip() for link in LINK_PATTERN.findall(str(header))]
+    one_click = "list-unsubscribe=one-click" in str(msg.get("List-Unsubscribe-Post", "")).lower()
+    return UnsubscribeTarget(sender, uid, links, one_click) if links else None
+
+
+def mailto_address(link):
+    return urllib.parse.unquote(urllib.parse.urlsplit(link).path)
+
+
+class UnsubscribePool:
+    # Runs one-click unsubscribes on a bounded worker pool. The opener and mailer
+    # are injectable so the pool can be pointed at a local stand-in server.
+    # Without a mailer nothing is ever sent by email.
+    def __init__(self, max_workers=UNSUBSCRIBE_WORKERS, timeout=UNSUBSCRIBE_TIMEOUT, mailer=None, opener=None,
+                 allow_http=False):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.mailer = mailer
+        self.opener = opener or urllib.request.build_opener()
+        self.allow_http = allow_http
+
+    def run(self, targets, log=None):
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for result in executor.map(self.unsubscribe, targets):
+                results.append(result)
+                if log:
+                    sender, method, ok, detail = result
+                    log(f"{'Unsubscribed' if ok else 'Could not unsubscribe'} {sender} via {method}: {detail}\n")
+        return results
+
+    def one_click_link(self, target):
+        link = target.http_link
+        if link and target.one_click and (link.lower().startswith("https:") or self.allow_http):
+            return link
+        return None
+
+    def unsubscribe(self, target):
+        link = self.one_click_link(target)
+        if link:
+            return self.post_one_click(target, link)
+        if target.mailto_link and self.mailer is not None:
+            return self.send_mailto(target, target.mailto_link)
+        return target.sender, "none", False, "no one-click or mailto unsubscribe offered"
+
+    def post_one_click(self, target, link):
+        # RFC 8058: POST the fixed one-click body to the List-Unsubscribe URL
+        request = urllib.request.Request(link, data=ONE_CLICK_BODY, method="POST",
+                                         headers={"Content-Type": "application/x-www-form-urlencoded"})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return target.sender, "one-click", 200 <= response.status < 300, f"HTTP {response.status}"
+        except Exception as e:
+            return target.sender, "one-click", False, str(e)
+
+    def send_mailto(self, target, link):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(link).query)
+        to = mailto_address(link)
+        subject = query.get("subject", ["unsubscribe"])[0]
+        body = query.get("body", ["unsubscribe"])[0]
+        try:
+            self.mailer(to, subject, body)
+            return target.sender, "mailto", True, to
+        except Exception as e:
+            return target.sender, "mailto", False, str(e)
+
+
+def search_terms(senders):
+    # Wildcard domain rules search on "@domain"; the index filters out substring hits later
+    return [sender[1:] if sender.startswith("*@") else sender for sender in senders]
+
+
+def find_sender_uids(mail, senders, cancelled=lambda: False):
+    uids = set()
+    for chunk in chunked(search_terms(senders), SEARCH_CHUNK_SIZE):
+        if cancelled():
+            break
+        result, data = mail.uid('SEARCH', None, or_criteria("FROM", chunk))
+        if result == 'OK' and data[0]:
+            uids.update(int(uid) for uid in data[0].split())
+    return sorted(uids)
+
+
+def fetch_unsubscribe_targets(mail, uids, sender_index, cancelled=lambda: False):
+    matched_uids = []
+    targets = {}
+    for chunk in chunked(uids, FETCH_CHUNK_SIZE):
+        if cancelled():
+            break
+        result, data = mail.uid('FETCH', uid_set(chunk), HEADER_FETCH)
+        if result != 'OK':
+            continue
+        for uid, headers in iter_fetch_items(data):
+            msg = email.message_from_bytes(headers)
+            if not sender_index.matches(msg.get("From")):
+                continue
+            matched_uids.append(uid)
+            # Keep the newest message per sender, its unsubscribe link is the most likely to work
+            sender = sender_address(msg.get("From"))
+            target = parse_unsubscribe_target(sender, uid, msg)
+            if target and (sender not in targets or targets[sender].uid < uid):
+                targets[sender] = target
+    return matched_uids, list(targets.values())
+
+
+def label_messages(mail, uids, label, log, cancelled=lambda: False):
+    # Gmail labels; a chunk that fails is logged and skipped, unsubscribing goes on regardless
+    labelled = 0
+    for chunk in chunked(uids, FETCH_CHUNK_SIZE):
+        if cancelled():
+            break
+        try:
+            result, _ = mail.uid('STORE', uid_set(chunk), '+X-GM-LABELS', f'({label})')
+        except Exception as e:
+            log(f"Exception occurred: {str(e)}\n")
+            continue
+        if result != 'OK':
+            log(f"ERROR labelling messages {uid_set(chunk)}\n")
+            continue
+        labelled += len(chunk)
+    return labelled
+
+
+def unsubscribe_senders(mail, senders, pool, log, cancelled=lambda: False):
+    # Returns the one-click results and the (sender, mailto link) pairs of senders that can
+    # only be unsubscribed by email. Those are never sent here: the user confirms the
+    # addresses first and send_mailto_unsubscribes() sends them.
+    sender_index = SenderIndex(senders)
+    sender_index.log_dropped(log)
+    uids = find_sender_uids(mail, senders, cancelled)
+    log(f"Found {len(uids)} messages from {len(senders)} selected senders.\n")
+
+    matched_uids, targets = fetch_unsubscribe_targets(mail, uids, sender_index, cancelled)
+    if is_gmail(mail):
+        labelled = label_messages(mail, matched_uids, '\\Unsubscribed', log, cancelled)
+        log(f"Labelled {labelled} messages as unsubscribed.\n")
+
+    if cancelled():
+        return [], []
+    mailto = [(target.sender, target.mailto_link) for target in targets
+              if not pool.one_click_link(target) and target.mailto_link]
+    mailto_senders = {sender for sender, _ in mailto}
+    results = pool.run([target for target in targets if target.sender not in mailto_senders], log)
+    return results, mailto
+
+
+def send_mailto_unsubscribes(mailto, pool, log=None):
+    # mailto is the confirmed (sender, mailto link) list from unsubscribe_senders()
+    return pool.run([UnsubscribeTarget(sender, 0, [link], False) for sender, link in mailto], log)